@@ -43,19 +43,20 @@ def run_migrations_online():
         poolclass=pool.NullPool,
     )
 
-    async def do_migrations(connection):
-        await connection.run_sync(
-            lambda sync_conn: context.configure(
-                connection=sync_conn,
-                target_metadata=target_metadata,
-            )
+    def do_migrations(sync_conn):
+        context.configure(
+            connection=sync_conn,
+            target_metadata=target_metadata,
         )
         with context.begin_transaction():
             context.run_migrations()
 
-    asyncio.run(
-        connectable.connect().run_sync(do_migrations)
-    )
+    async def run():
+        async with connectable.connect() as connection:
+            await connection.run_sync(do_migrations)
+        await connectable.dispose()
+
+    asyncio.run(run())
 
 # Entry point
 if context.is_offline_mode():
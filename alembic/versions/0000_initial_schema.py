@@ -0,0 +1,101 @@
+"""initial schema: the tables as they were before 0001
+
+Builds a fresh database so the rest of the chain can run on it. Tables that
+already exist (databases created by create_all before migrations were
+adopted) are left alone.
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0000"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _interaction(table: str, target: str, referenced: str, constraint: str) -> tuple:
+    return (
+        table,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(target, sa.Integer(), sa.ForeignKey(f"{referenced}.id")),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("timestamp", sa.DateTime()),
+        sa.UniqueConstraint(target, "user_id", name=constraint),
+    )
+
+
+# In dependency order; (name, *columns and constraints) as create_all made them
+TABLES = [
+    (
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("is_verified", sa.Integer()),
+    ),
+    (
+        "categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(15), unique=True),
+    ),
+    (
+        "posts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("content", sa.Text()),
+        sa.Column("timestamp", sa.DateTime()),
+    ),
+    (
+        "post_category",
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("posts.id"), primary_key=True),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), primary_key=True),
+    ),
+    (
+        "comments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("posts.id")),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("content", sa.Text()),
+        sa.Column("timestamp", sa.DateTime()),
+        sa.Column("reply_to", sa.Integer(), sa.ForeignKey("comments.id"), nullable=True),
+    ),
+    _interaction("comment_likes", "comment_id", "comments", "unique_comment_like"),
+    _interaction("post_likes", "post_id", "posts", "unique_post_like"),
+    _interaction("post_saves", "post_id", "posts", "unique_post_save"),
+    (
+        "follows",
+        sa.Column("follower_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("followee_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("timestamp", sa.DateTime()),
+    ),
+]
+
+# (index name, table, columns): index=True on the id columns, and the fan-out index on follows
+INDEXES = [
+    ("ix_users_id", "users", ["id"]),
+    ("ix_posts_id", "posts", ["id"]),
+    ("ix_comments_id", "comments", ["id"]),
+    ("ix_follows_followee_follower", "follows", ["followee_id", "follower_id"]),
+]
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, *columns in TABLES:
+        if name not in existing:
+            op.create_table(name, *columns)
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, *_ in reversed(TABLES):
+        op.drop_table(name)
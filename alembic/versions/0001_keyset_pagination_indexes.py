@@ -0,0 +1,37 @@
+"""keyset pagination indexes
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = "0000"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, columns) backing the (timestamp, id) cursors of the list endpoints
+INDEXES = [
+    ("ix_posts_user_timestamp_id", "posts", ["user_id", "timestamp", "id"]),
+    ("ix_post_likes_post_timestamp_id", "post_likes", ["post_id", "timestamp", "id"]),
+    ("ix_post_saves_post_timestamp_id", "post_saves", ["post_id", "timestamp", "id"]),
+    ("ix_comments_post_timestamp_id", "comments", ["post_id", "timestamp", "id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,63 @@
+"""engagement counters on posts and comments
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COUNTERS = {
+    "posts": ["like_count", "save_count", "comment_count"],
+    "comments": ["like_count", "reply_count"],
+}
+
+
+def upgrade() -> None:
+    for table, columns in COUNTERS.items():
+        for column in columns:
+            op.add_column(
+                table,
+                sa.Column(column, sa.Integer(), nullable=False, server_default="0"),
+                if_not_exists=True,
+            )
+
+    # Backfill from the child tables in one set-based pass per table
+    op.execute("""
+        UPDATE posts SET
+            like_count = coalesce(l.n, 0),
+            save_count = coalesce(s.n, 0),
+            comment_count = coalesce(c.n, 0)
+        FROM posts p
+        LEFT JOIN (SELECT post_id, count(*) AS n FROM post_likes GROUP BY post_id) l ON l.post_id = p.id
+        LEFT JOIN (SELECT post_id, count(*) AS n FROM post_saves GROUP BY post_id) s ON s.post_id = p.id
+        LEFT JOIN (SELECT post_id, count(*) AS n FROM comments GROUP BY post_id) c ON c.post_id = p.id
+        WHERE posts.id = p.id
+    """)
+    op.execute("""
+        UPDATE comments SET
+            like_count = coalesce(l.n, 0),
+            reply_count = coalesce(r.n, 0)
+        FROM comments c
+        LEFT JOIN (SELECT comment_id, count(*) AS n FROM comment_likes GROUP BY comment_id) l ON l.comment_id = c.id
+        LEFT JOIN (SELECT reply_to, count(*) AS n FROM comments WHERE reply_to IS NOT NULL GROUP BY reply_to) r
+            ON r.reply_to = c.id
+        WHERE comments.id = c.id
+    """)
+
+
+def downgrade() -> None:
+    for table, columns in COUNTERS.items():
+        for column in columns:
+            op.drop_column(table, column)
@@ -0,0 +1,64 @@
+"""ON DELETE CASCADE foreign keys and indexes on the cascading columns
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# table, column, referenced table (constraint names are Postgres' defaults)
+FOREIGN_KEYS = [
+    ("posts", "user_id", "users"),
+    ("comments", "post_id", "posts"),
+    ("comments", "user_id", "users"),
+    ("comments", "reply_to", "comments"),
+    ("comment_likes", "comment_id", "comments"),
+    ("comment_likes", "user_id", "users"),
+    ("post_likes", "post_id", "posts"),
+    ("post_likes", "user_id", "users"),
+    ("post_saves", "post_id", "posts"),
+    ("post_saves", "user_id", "users"),
+    ("post_category", "post_id", "posts"),
+    ("post_category", "category_id", "categories"),
+    ("follows", "follower_id", "users"),
+    ("follows", "followee_id", "users"),
+]
+
+# Without these every cascaded delete would scan the child table
+INDEXES = [
+    ("comments", "user_id"),
+    ("comments", "reply_to"),
+    ("comment_likes", "user_id"),
+    ("post_likes", "user_id"),
+    ("post_saves", "user_id"),
+]
+
+
+def _recreate_foreign_keys(ondelete) -> None:
+    for table, column, referenced in FOREIGN_KEYS:
+        name = f"{table}_{column}_fkey"
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(name, table, referenced, [column], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    for table, column in INDEXES:
+        op.create_index(f"ix_{table}_{column}", table, [column], if_not_exists=True)
+    _recreate_foreign_keys("CASCADE")
+
+
+def downgrade() -> None:
+    _recreate_foreign_keys(None)
+    for table, column in INDEXES:
+        op.drop_index(f"ix_{table}_{column}", table_name=table)
@@ -0,0 +1,30 @@
+"""index for loading the top replies of each comment
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_comments_reply_to_timestamp_id", "comments", ["reply_to", "timestamp", "id"], if_not_exists=True
+    )
+    # The composite index also serves the ON DELETE CASCADE lookups
+    op.drop_index("ix_comments_reply_to", table_name="comments", if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index("ix_comments_reply_to", "comments", ["reply_to"])
+    op.drop_index("ix_comments_reply_to_timestamp_id", table_name="comments")
@@ -0,0 +1,27 @@
+"""reverse index on post_category for browsing a category
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_post_category_category_id_post_id", "post_category", ["category_id", "post_id"], if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_post_category_category_id_post_id", table_name="post_category")
@@ -0,0 +1,42 @@
+"""generated tsvector columns and GIN indexes for full-text search
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ["posts", "comments"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        # Adding a stored generated column rewrites the table under an exclusive lock
+        op.execute(f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED
+        """)
+    # Build the indexes without blocking writes
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(
+                f"ix_{table}_search_vector", table, ["search_vector"],
+                postgresql_using="gin", postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_search_vector", table_name=table, if_exists=True)
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
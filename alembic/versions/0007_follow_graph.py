@@ -0,0 +1,66 @@
+"""follower/following counters on users and keyset indexes on follows
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COUNTERS = ["follower_count", "following_count"]
+
+
+def upgrade() -> None:
+    for column in COUNTERS:
+        op.add_column(
+            "users",
+            sa.Column(column, sa.Integer(), nullable=False, server_default="0"),
+            if_not_exists=True,
+        )
+    op.execute("""
+        UPDATE users SET
+            follower_count = coalesce(f.n, 0),
+            following_count = coalesce(g.n, 0)
+        FROM users u
+        LEFT JOIN (SELECT followee_id, count(*) AS n FROM follows GROUP BY followee_id) f ON f.followee_id = u.id
+        LEFT JOIN (SELECT follower_id, count(*) AS n FROM follows GROUP BY follower_id) g ON g.follower_id = u.id
+        WHERE users.id = u.id
+    """)
+
+    # Keyset pagination orders by timestamp, so it can't be NULL
+    op.execute("UPDATE follows SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL")
+    op.alter_column("follows", "timestamp", nullable=False, server_default=sa.text("(now() AT TIME ZONE 'utc')"))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_follows_followee_timestamp", "follows", ["followee_id", "timestamp", "follower_id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            "ix_follows_follower_timestamp", "follows", ["follower_id", "timestamp", "followee_id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        # Superseded by ix_follows_followee_timestamp, which leads with the same column
+        op.drop_index(
+            "ix_follows_followee_follower", table_name="follows", postgresql_concurrently=True, if_exists=True
+        )
+
+
+def downgrade() -> None:
+    op.create_index("ix_follows_followee_follower", "follows", ["followee_id", "follower_id"], if_not_exists=True)
+    op.drop_index("ix_follows_follower_timestamp", table_name="follows", if_exists=True)
+    op.drop_index("ix_follows_followee_timestamp", table_name="follows", if_exists=True)
+    op.alter_column("follows", "timestamp", nullable=True, server_default=None)
+    for column in COUNTERS:
+        op.drop_column("users", column)
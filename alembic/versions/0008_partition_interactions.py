@@ -0,0 +1,172 @@
+"""monthly range partitions for comments and interactions, with *_keys tables for dedupe
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 00:00:00.000000
+
+Copies each table into its partitions while holding it locked. Dedupe moves to the *_keys tables,
+and the foreign keys into comments are dropped (app.deletion cleans up after deleted comments).
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+NOW = "(now() AT TIME ZONE 'utc')"
+MONTHS_AHEAD = 3
+# Older rows go to the default partition rather than a long tail of tiny ones
+MAX_MONTHS_BACK = 24
+
+# table -> (foreign keys to users/posts, indexes besides the primary key)
+TABLES = {
+    "comments": (
+        [("post_id", "posts"), ("user_id", "users")],
+        [
+            ("ix_comments_post_timestamp_id", "(post_id, timestamp, id)"),
+            ("ix_comments_reply_to_timestamp_id", "(reply_to, timestamp, id)"),
+            ("ix_comments_search_vector", "USING gin (search_vector)"),
+            ("ix_comments_user_id", "(user_id)"),
+        ],
+    ),
+    "comment_likes": (
+        [("user_id", "users")],
+        [
+            ("ix_comment_likes_comment_timestamp_id", "(comment_id, timestamp, id)"),
+            ("ix_comment_likes_user_id", "(user_id)"),
+        ],
+    ),
+    "post_likes": (
+        [("post_id", "posts"), ("user_id", "users")],
+        [("ix_post_likes_post_timestamp_id", "(post_id, timestamp, id)"), ("ix_post_likes_user_id", "(user_id)")],
+    ),
+    "post_saves": (
+        [("post_id", "posts"), ("user_id", "users")],
+        [("ix_post_saves_post_timestamp_id", "(post_id, timestamp, id)"), ("ix_post_saves_user_id", "(user_id)")],
+    ),
+}
+
+# keys table -> (interaction table, target column, target table or None, constraint)
+KEYS = {
+    "post_like_keys": ("post_likes", "post_id", "posts", "unique_post_like"),
+    "post_save_keys": ("post_saves", "post_id", "posts", "unique_post_save"),
+    "comment_like_keys": ("comment_likes", "comment_id", None, "unique_comment_like"),
+}
+
+# Foreign keys into comments that a partitioned comments table can't keep: (table, constraint, column)
+COMMENT_REFERENCES = [
+    ("comment_likes", "comment_likes_comment_id_fkey", "comment_id"),
+    ("comments", "comments_reply_to_fkey", "reply_to"),
+]
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def insertable_columns(table: str) -> str:
+    rows = op.get_bind().execute(sa.text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = :table AND is_generated = 'NEVER' ORDER BY ordinal_position
+    """), {"table": table})
+    return ", ".join(f'"{column}"' for column, in rows)
+
+
+def rebuild(table: str, old: str, partition_by: str = ""):
+    """Copy `table` (renamed to `old`) into a new table of the same name and drop the old one"""
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING GENERATED) {partition_by}")
+    if partition_by:
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN timestamp SET NOT NULL, ALTER COLUMN timestamp SET DEFAULT {NOW}")
+        create_partitions(table, old)
+    else:
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN timestamp DROP NOT NULL, ALTER COLUMN timestamp DROP DEFAULT")
+    columns = insertable_columns(old)
+    op.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")
+    op.execute(f"DROP TABLE {old} CASCADE")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def create_partitions(table: str, source: str):
+    this_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    oldest = op.get_bind().execute(sa.text(f"SELECT min(timestamp) FROM {source}")).scalar() or this_month
+    month = max(
+        oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0), add_months(this_month, -MAX_MONTHS_BACK)
+    )
+    while month <= add_months(this_month, MONTHS_AHEAD):
+        following = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+
+def add_constraints(table: str, primary_key: str):
+    foreign_keys, indexes = TABLES[table]
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({primary_key})")
+    for column, target in foreign_keys:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey FOREIGN KEY ({column}) "
+            f"REFERENCES {target} (id) ON DELETE CASCADE"
+        )
+    for name, definition in indexes:
+        op.execute(f"CREATE INDEX {name} ON {table} {definition}")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.execute(f"UPDATE {table} SET timestamp = {NOW} WHERE timestamp IS NULL")
+    for table, constraint, _ in COMMENT_REFERENCES:
+        op.drop_constraint(constraint, table, type_="foreignkey")
+
+    # The old unique constraints guarantee the pairs are distinct; the keys take over their names
+    for keys, (table, target, target_table, constraint) in KEYS.items():
+        op.drop_constraint(constraint, table, type_="unique")
+        # comments is partitioned too, so comment_like_keys.comment_id can't reference it
+        target_fk = [sa.ForeignKey(f"{target_table}.id", ondelete="CASCADE")] if target_table else []
+        op.create_table(
+            keys,
+            sa.Column(target, sa.Integer(), *target_fk, nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("timestamp", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint(target, "user_id", name=constraint),
+        )
+        op.create_index(f"ix_{keys}_user_id", keys, ["user_id"])
+        op.execute(f"""
+            INSERT INTO {keys} ({target}, user_id, timestamp)
+            SELECT {target}, user_id, timestamp FROM {table} WHERE {target} IS NOT NULL AND user_id IS NOT NULL
+        """)
+
+    for table in TABLES:
+        rebuild(table, f"{table}_unpartitioned", "PARTITION BY RANGE (timestamp)")
+        add_constraints(table, "id, timestamp")
+        op.execute(f"ANALYZE {table}")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        rebuild(table, f"{table}_partitioned")
+        add_constraints(table, "id")
+    op.create_index("ix_comments_id", "comments", ["id"])
+
+    for keys, (table, target, _, constraint) in KEYS.items():
+        op.drop_table(keys)
+        op.create_unique_constraint(constraint, table, [target, "user_id"])
+    # Rows may reference comments deleted while there was no constraint
+    for table, constraint, column in COMMENT_REFERENCES:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {constraint} FOREIGN KEY ({column}) "
+            f"REFERENCES comments (id) ON DELETE CASCADE NOT VALID"
+        )
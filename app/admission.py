@@ -0,0 +1,284 @@
+"""Admission control: latency-adaptive concurrency limits per route class, and per-caller token buckets"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from redis.exceptions import RedisError
+from starlette.responses import JSONResponse
+
+from app import metrics
+from app.redis_cache import redis_client
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "false").lower() == "true"
+WINDOW = int(os.getenv("ADMISSION_WINDOW_MS", "500")) / 1000
+# Windows with fewer samples than this leave the limit alone
+MIN_SAMPLES = int(os.getenv("ADMISSION_MIN_SAMPLES", "10"))
+# Latency may reach this multiple of the baseline before the limit shrinks
+TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", "1.5"))
+SMOOTHING = float(os.getenv("ADMISSION_SMOOTHING", "0.2"))
+BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+# Windows the baseline averages over
+BASELINE_WINDOWS = int(os.getenv("ADMISSION_BASELINE_WINDOWS", "100"))
+RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "0"))
+USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "50"))
+USER_HEADER = os.getenv("ADMISSION_USER_HEADER", "x-user-id").lower().encode()
+
+# Never queued or limited: scrapes and health checks must answer under overload
+EXEMPT = ("/metrics", "/health", "/docs", "/openapi.json", "/redoc")
+
+
+@dataclass
+class RouteClass:
+    limit: int
+    max_limit: int
+    queue: int
+    # Longest a request may wait for a slot
+    queue_timeout: float
+    # Tokens drawn from the caller's bucket
+    cost: int
+
+
+def _route_class(name: str, limit: int, max_limit: int, queue: int, queue_ms: int, cost: int) -> RouteClass:
+    prefix = f"ADMISSION_{name.upper()}"
+    return RouteClass(
+        limit=int(os.getenv(f"{prefix}_LIMIT", str(limit))),
+        max_limit=int(os.getenv(f"{prefix}_MAX_LIMIT", str(max_limit))),
+        queue=int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+        queue_timeout=int(os.getenv(f"{prefix}_QUEUE_MS", str(queue_ms))) / 1000,
+        cost=cost,
+    )
+
+
+CLASSES = {
+    "read": _route_class("read", 20, 100, 100, 250, 1),
+    "list": _route_class("list", 10, 40, 50, 500, 1),
+    "write": _route_class("write", 10, 40, 100, 1000, 1),
+    "bulk": _route_class("bulk", 2, 4, 10, 2000, 10),
+}
+
+# (methods, path pattern, class), first match wins; other GETs are reads and everything else a write
+CLASS_RULES = [
+    ({"POST"}, re.compile(r"/batch$"), "bulk"),
+    ({"DELETE"}, re.compile(r"^/(user|post|comment)/$"), "bulk"),
+    ({"GET"}, re.compile(
+        r"^/(search|categories/(\d+/)?posts"
+        r"|users/\d+/(followers|following|mutuals|followed-by|posts)"
+        r"|posts/\d+/(likes|saves|comments|thread)|comments/\d+/(replies|details))"
+    ), "list"),
+]
+
+
+def classify(method: str, path: str) -> str:
+    for methods, pattern, name in CLASS_RULES:
+        if method in methods and pattern.search(path):
+            return name
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+class Rejected(Exception):
+    def __init__(self, outcome: str):
+        self.outcome = outcome
+
+
+# ------------ LIMITER ------------ #
+
+class Limiter:
+    """Concurrency limit for one route class, adjusted from observed service times"""
+
+    def __init__(self, name: str, route_class: RouteClass):
+        self.name = name
+        self.config = route_class
+        self.limit = float(route_class.limit)
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.baseline: Optional[float] = None
+        self._window_start = time.monotonic()
+        self._latency_sum = 0.0
+        self._samples = 0
+        self._peak = 0
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed; True if the request had to wait"""
+        if not self.waiters and self.in_flight < int(self.limit):
+            self._take()
+            return False
+        if len(self.waiters) >= self.config.queue:
+            raise Rejected("shed")
+
+        slot = asyncio.get_running_loop().create_future()
+        self.waiters.append(slot)
+        try:
+            await asyncio.wait_for(asyncio.shield(slot), self.config.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if slot.done():
+                # Handed a slot just as the wait ended
+                if isinstance(exc, asyncio.CancelledError):
+                    self.release()
+                    raise
+                return True
+            slot.cancel()
+            self.waiters.remove(slot)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            raise Rejected("timeout")
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def record(self, seconds: float, failed: bool):
+        """Feed one request's service time (queue wait excluded) into the limit"""
+        if failed:
+            self._set_limit(self.limit * BACKOFF)
+            return
+        self._latency_sum += seconds
+        self._samples += 1
+        now = time.monotonic()
+        if now - self._window_start < WINDOW:
+            return
+        if self._samples >= MIN_SAMPLES:
+            self._update(self._latency_sum / self._samples)
+        self._window_start = now
+        self._latency_sum, self._samples, self._peak = 0.0, 0, self.in_flight
+
+    def _take(self):
+        self.in_flight += 1
+        self._peak = max(self._peak, self.in_flight)
+
+    def _wake(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            slot = self.waiters.popleft()
+            if not slot.done():
+                self._take()
+                slot.set_result(None)
+
+    def _update(self, latency: float):
+        if self.baseline is None:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) / BASELINE_WINDOWS
+            # A baseline left high by a long spike would keep the limit from shrinking next time
+            if self.baseline > 2 * latency:
+                self.baseline *= 0.95
+        gradient = max(0.5, min(1.0, TOLERANCE * self.baseline / latency))
+        target = self.limit * gradient
+        # Only a limit that was mostly used is evidence that more would help
+        if self._peak >= self.limit / 2:
+            target += math.sqrt(self.limit)
+        self._set_limit(self.limit * (1 - SMOOTHING) + target * SMOOTHING)
+
+    def _set_limit(self, limit: float):
+        self.limit = min(max(limit, 1.0), float(self.config.max_limit))
+        self._wake()
+
+
+# ------------ TOKEN BUCKETS ------------ #
+
+# KEYS: bucket. ARGV: tokens per second, burst, cost.
+# Returns {1, 0} when admitted, {0, ms until enough tokens} otherwise.
+_take_tokens_script = redis_client.register_script("""
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+-- A request costing more than the burst could never be paid for
+local cost = math.min(tonumber(ARGV[3]), burst)
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local last = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local admitted, wait = 0, 0
+if tokens >= cost then
+    tokens = tokens - cost
+    admitted = 1
+else
+    wait = math.ceil((cost - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {admitted, wait}
+""")
+
+
+def caller(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == USER_HEADER:
+            return f"user:{value.decode('latin-1')}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def take_tokens(identity: str, cost: int) -> Optional[float]:
+    """None if the caller may proceed, else seconds until its bucket can pay for the request"""
+    try:
+        admitted, wait_ms = await _take_tokens_script(
+            keys=[f"ratelimit:{identity}"], args=[USER_RATE, USER_BURST, cost]
+        )
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="ratelimit")
+        return None
+    return None if admitted else wait_ms / 1000
+
+
+# ------------ MIDDLEWARE ------------ #
+
+class AdmissionMiddleware:
+    def __init__(self, app, classes: dict[str, RouteClass] = CLASSES):
+        self.app = app
+        self.limiters = {name: Limiter(name, route_class) for name, route_class in classes.items()}
+        metrics.register_collector(self._samples)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT):
+            return await self.app(scope, receive, send)
+
+        name = classify(scope["method"], scope["path"])
+        limiter = self.limiters[name]
+        if USER_RATE > 0:
+            wait = await take_tokens(caller(scope), limiter.config.cost)
+            if wait is not None:
+                metrics.inc("admission_requests_total", route_class=name, outcome="rate_limited")
+                return await self._reject(scope, receive, send, 429, "Rate limit exceeded", math.ceil(wait))
+
+        queued_at = time.perf_counter()
+        try:
+            queued = await limiter.acquire()
+        except Rejected as rejected:
+            metrics.inc("admission_requests_total", route_class=name, outcome=rejected.outcome)
+            return await self._reject(scope, receive, send, 503, "Server is overloaded", RETRY_AFTER)
+        start = time.perf_counter()
+        metrics.inc("admission_requests_total", route_class=name, outcome="queued" if queued else "admitted")
+        if queued:
+            metrics.inc("admission_queue_seconds_total", start - queued_at, route_class=name)
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            limiter.release()
+            limiter.record(time.perf_counter() - start, failed=status["code"] >= 500)
+
+    async def _reject(self, scope, receive, send, status: int, detail: str, retry_after: int):
+        headers = {"Retry-After": str(max(retry_after, 1))}
+        response = JSONResponse({"detail": detail}, status_code=status, headers=headers)
+        await response(scope, receive, send)
+
+    def _samples(self):
+        for name, limiter in self.limiters.items():
+            labels = {"route_class": name}
+            yield "admission_limit", "gauge", labels, round(limiter.limit, 2)
+            yield "admission_in_flight", "gauge", labels, limiter.in_flight
+            yield "admission_queued", "gauge", labels, len(limiter.waiters)
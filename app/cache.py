@@ -0,0 +1,315 @@
+import asyncio
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app import metrics
+from app.codec import CodecError, decode, encode
+from app.database import AsyncSessionLocal
+from app.local_cache import MISSING, local_cache
+from app.models import Post, User
+from app.redis_cache import (
+    INVALIDATION_CHANNEL, cache_post, decode_or_none, delete_cached_posts, lease_key,
+    publish_invalidation, redis_binary, redis_client
+)
+
+POST_TTL = int(os.getenv("CACHE_POST_TTL", "300"))
+USER_TTL = int(os.getenv("CACHE_USER_TTL", "300"))
+# 404s are cached briefly so repeated lookups of missing ids don't reach Postgres
+NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", "30"))
+# How long a load may hold its lease; a load slower than this doesn't write back
+LEASE_MS = int(os.getenv("CACHE_LOAD_LEASE_MS", "10000"))
+
+# Misses currently being loaded, keyed by cache key; concurrent misses await the same task
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def post_key(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def post_counts_key(post_id: int) -> str:
+    return f"post_counts:{post_id}"
+
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+# Cached apart from the post itself, so a like only drops the counts and not the post
+POST_COUNTS = (Post.like_count, Post.save_count, Post.comment_count)
+
+
+def post_to_dict(post: Post) -> dict:
+    """The cached body of a post, without its counters"""
+    return {
+        "id": post.id,
+        "user_id": post.user_id,
+        "content": post.content,
+        "timestamp": post.timestamp.isoformat(),
+    }
+
+
+def without_counts(post: dict) -> dict:
+    """The cached body of a post returned by get_post(s)"""
+    counts = {column.key for column in POST_COUNTS}
+    return {field: value for field, value in post.items() if field not in counts}
+
+
+def user_to_dict(user: User) -> dict:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "is_verified": user.is_verified,
+        "follower_count": user.follower_count,
+        "following_count": user.following_count,
+    }
+
+
+# ------------ READ-THROUGH ------------ #
+
+Loader = Callable[[AsyncSession], Awaitable[Optional[dict]]]
+
+# Writes a loaded value only while the load's lease is still held, then releases it. Invalidations
+# delete the lease, so a load that raced one returns its value without caching it.
+# KEYS: key, lease key. ARGV: lease token, value, ttl
+_fill_script = redis_client.register_script("""
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('DEL', KEYS[2])
+return 1
+""")
+
+
+async def read_through(
+    key: str, loader: Loader, ttl: int, sessions: sessionmaker = AsyncSessionLocal
+) -> Optional[dict]:
+    """Return the cached value for key: the local tier, then Redis, then loader(db) on its own session.
+
+    A loader returning None is cached as a negative entry for NEGATIVE_TTL seconds.
+    """
+    entity = key.split(":", 1)[0]
+    value = local_cache.get(key)
+    if value is not MISSING:
+        metrics.inc("cache_local_hits_total", entity=entity)
+        return value
+
+    try:
+        raw = await redis_binary.get(key)
+    except RedisError:
+        metrics.inc("cache_errors_total", entity=entity)
+        async with sessions() as db:
+            return await loader(db)
+
+    if raw is not None:
+        try:
+            value = decode(raw)
+        except CodecError:
+            # Written by a codec this worker doesn't know; reload and overwrite it
+            metrics.inc("cache_decode_errors_total", entity=entity)
+        else:
+            local_cache.set(key, value, len(raw))
+            metrics.inc("cache_hits_total" if value is not None else "cache_negative_hits_total", entity=entity)
+            return value
+
+    task = _inflight.get(key)
+    if task is not None:
+        metrics.inc("cache_coalesced_total", entity=entity)
+        return await asyncio.shield(task)
+
+    metrics.inc("cache_misses_total", entity=entity)
+    task = asyncio.ensure_future(_load(key, loader, ttl, sessions))
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _load(key: str, loader: Loader, ttl: int, sessions: sessionmaker) -> Optional[dict]:
+    entity = key.split(":", 1)[0]
+    token = uuid.uuid4().hex
+    try:
+        await redis_client.set(lease_key(key), token, px=LEASE_MS)
+    except RedisError:
+        metrics.inc("cache_errors_total", entity=entity)
+        token = None
+
+    async with sessions() as db:
+        value = await loader(db)
+    if token is None:
+        return value
+
+    payload = encode(value)
+    try:
+        filled = await _fill_script(
+            keys=[key, lease_key(key)], args=[token, payload, ttl if value is not None else NEGATIVE_TTL]
+        )
+    except RedisError:
+        metrics.inc("cache_errors_total", entity=entity)
+        return value
+    if filled:
+        local_cache.set(key, value, len(payload))
+    else:
+        metrics.inc("cache_stale_loads_total", entity=entity)
+    return value
+
+
+async def get_post(post_id: int) -> Optional[dict]:
+    async def load(db: AsyncSession):
+        post = await db.get(Post, post_id)
+        return post_to_dict(post) if post else None
+
+    async def load_counts(db: AsyncSession):
+        row = (await db.execute(select(*POST_COUNTS).where(Post.id == post_id))).one_or_none()
+        return dict(row._mapping) if row else None
+
+    post = await read_through(post_key(post_id), load, POST_TTL)
+    if post is None:
+        return None
+    counts = await read_through(post_counts_key(post_id), load_counts, POST_TTL)
+    return {**post, **counts} if counts else None
+
+
+async def get_posts(db: AsyncSession, post_ids: list[int]) -> dict[int, dict]:
+    """Batch read-through for many posts: one MGET and one IN query for the misses, for bodies and counts each.
+
+    Ids that don't exist are simply absent from the returned mapping.
+    """
+    async def load(db: AsyncSession, ids: list[int]) -> dict[int, dict]:
+        result = await db.execute(select(Post).where(Post.id.in_(ids)))
+        return {post.id: post_to_dict(post) for post in result.scalars().all()}
+
+    async def load_counts(db: AsyncSession, ids: list[int]) -> dict[int, dict]:
+        result = await db.execute(select(Post.id, *POST_COUNTS).where(Post.id.in_(ids)))
+        return {row.id: {column.key: getattr(row, column.key) for column in POST_COUNTS} for row in result.all()}
+
+    posts = await _read_many(db, post_ids, post_key, load)
+    counts = await _read_many(db, list(posts), post_counts_key, load_counts)
+    return {post_id: {**post, **counts[post_id]} for post_id, post in posts.items() if post_id in counts}
+
+
+async def _read_many(
+    db: AsyncSession, ids: list[int], key: Callable[[int], str],
+    load: Callable[[AsyncSession, list[int]], Awaitable[dict[int, dict]]],
+) -> dict[int, dict]:
+    """Redis-only batch read-through of POST_TTL entries: one MGET, then one load of the misses"""
+    entity = key(0).split(":", 1)[0]
+    try:
+        cached = [decode_or_none(raw) for raw in await redis_binary.mget([key(id) for id in ids])]
+    except RedisError:
+        metrics.inc("cache_errors_total", entity=entity)
+        cached = [None] * len(ids)
+
+    values = {id: value for id, value in zip(ids, cached) if value}
+    missing = [id for id in ids if id not in values]
+    metrics.inc("cache_hits_total", len(values), entity=entity)
+    if not missing:
+        return values
+
+    metrics.inc("cache_misses_total", len(missing), entity=entity)
+    # Leased like read_through's loads, so an entry invalidated mid-query isn't written back stale
+    token = uuid.uuid4().hex
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for id in missing:
+                pipe.set(lease_key(key(id)), token, px=LEASE_MS)
+            await pipe.execute()
+    except RedisError:
+        metrics.inc("cache_errors_total", entity=entity)
+        token = None
+    loaded = await load(db, missing)
+    if loaded and token:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for id, value in loaded.items():
+                    await _fill_script(
+                        keys=[key(id), lease_key(key(id))], args=[token, encode(value), POST_TTL], client=pipe
+                    )
+                filled = await pipe.execute()
+            metrics.inc("cache_stale_loads_total", filled.count(0), entity=entity)
+        except RedisError:
+            metrics.inc("cache_errors_total", entity=entity)
+    values.update(loaded)
+    return values
+
+
+async def get_user(user_id: int) -> Optional[dict]:
+    async def load(db: AsyncSession):
+        user = await db.get(User, user_id)
+        return user_to_dict(user) if user else None
+    return await read_through(user_key(user_id), load, USER_TTL)
+
+
+# ------------ WRITE-THROUGH / INVALIDATION ------------ #
+
+async def write_post(post: Post):
+    """Write a freshly committed post through to the cache (replaces any negative entry)"""
+    await cache_post(post_to_dict(post), ttl=POST_TTL)
+    await publish_invalidation(post_key(post.id), drop=False)
+
+
+async def write_user(user: User):
+    await redis_client.set(user_key(user.id), encode(user_to_dict(user)), ex=USER_TTL)
+    await publish_invalidation(user_key(user.id), drop=False)
+
+
+async def invalidate_post(post_id: int):
+    await invalidate_post_entities([post_id])
+
+
+async def invalidate_post_entities(post_ids: list[int]):
+    """Drop cached copies of posts whose fields changed; unlike invalidate_posts they stay in the recent list"""
+    await publish_invalidation(*[key(post_id) for post_id in post_ids for key in (post_key, post_counts_key)])
+
+
+async def invalidate_post_counts(post_ids: list[int]):
+    """Drop cached counters of posts, keeping the posts themselves"""
+    await publish_invalidation(*[post_counts_key(post_id) for post_id in post_ids])
+
+
+async def invalidate_posts(post_ids: list[int]):
+    await delete_cached_posts(post_ids)
+
+
+async def invalidate_user(user_id: int):
+    await invalidate_users([user_id])
+
+
+async def invalidate_users(user_ids: list[int]):
+    await publish_invalidation(*[user_key(user_id) for user_id in user_ids])
+
+
+# ------------ LOCAL TIER COHERENCE ------------ #
+
+async def listen_for_invalidations():
+    """Evict local entries as workers publish invalidations; runs for the worker's lifetime"""
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything published while we were disconnected was missed, so start clean
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        for key in message["data"].split("\n"):
+                            local_cache.delete(key)
+        except RedisError:
+            metrics.inc("cache_errors_total", entity="pubsub")
+            await asyncio.sleep(1)
+
+
+def _local_cache_samples():
+    labels = {"worker": str(os.getpid())}
+    yield "local_cache_entries", "gauge", labels, len(local_cache)
+    yield "local_cache_bytes", "gauge", labels, local_cache.bytes
+    yield "local_cache_hit_ratio", "gauge", labels, local_cache.hit_ratio()
+    yield "local_cache_evictions_total", "counter", labels, local_cache.evictions
+
+
+metrics.register_collector(_local_cache_samples)
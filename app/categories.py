@@ -0,0 +1,211 @@
+"""Category assignment and browsing"""
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache, metrics, trending
+from app.database import read_sessions
+from app.models import Category, Post, post_category
+from app.pagination import PageParams, decode_cursor, encode_cursor, paginate
+from app.redis_cache import publish_invalidation, redis_client
+from app.serialization import RowEncoder
+from app.schemas import PostOut
+
+CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", "1000"))
+POSTS_TTL = int(os.getenv("CACHE_CATEGORY_TTL", "3600"))
+LISTING_TTL = int(os.getenv("CACHE_CATEGORY_LISTING_TTL", "300"))
+
+LISTING_KEY = "categories:all"
+FLOOR = "_floor"
+# Extra entries fetched per page: the floor marker and posts sharing the cursor's timestamp
+SLACK = 8
+
+POST_ROWS = RowEncoder(Post, PostOut)
+
+
+def posts_key(category_id: int) -> str:
+    return f"category:{category_id}:posts"
+
+
+def _score(timestamp: datetime) -> float:
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+# Add a post to a cached category list, keeping at most ARGV[3] posts above the floor.
+# Does nothing when the list isn't cached or the post is older than the floor.
+_add_script = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+local score = tonumber(ARGV[2])
+if score <= tonumber(redis.call('ZSCORE', KEYS[1], '_floor')) then return 0 end
+redis.call('ZADD', KEYS[1], score, ARGV[1])
+if redis.call('ZCARD', KEYS[1]) > tonumber(ARGV[3]) + 1 then
+    -- The floor marker is rank 0; raise the floor to the oldest post and drop it (and its ties)
+    local floor = redis.call('ZRANGE', KEYS[1], 1, 1, 'WITHSCORES')[2]
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], floor, floor)
+    redis.call('ZADD', KEYS[1], floor, '_floor')
+end
+return 1
+""")
+
+
+# ------------ LISTING ------------ #
+
+async def list_categories() -> list[dict]:
+    async def load(db: AsyncSession):
+        result = await db.execute(select(Category.id, Category.title).order_by(Category.id))
+        return {"items": [dict(row._mapping) for row in result.all()]}
+    return (await cache.read_through(LISTING_KEY, load, LISTING_TTL, read_sessions()))["items"]
+
+
+async def invalidate_listing():
+    await publish_invalidation(LISTING_KEY)
+
+
+# ------------ ASSIGNMENT ------------ #
+
+async def assign(db: AsyncSession, post_id: int, category_ids: list[int]):
+    """Replace a post's categories with the existing ones among category_ids, set-wise"""
+    timestamp = (await db.execute(select(Post.timestamp).where(Post.id == post_id))).scalar_one_or_none()
+    if timestamp is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    found = (await db.execute(select(Category.id).where(Category.id.in_(category_ids)))).scalars().all()
+    if not found:
+        raise HTTPException(status_code=404, detail="Categories not found")
+
+    removed = (await db.execute(
+        delete(post_category)
+        .where(post_category.c.post_id == post_id, post_category.c.category_id.not_in(found))
+        .returning(post_category.c.category_id)
+    )).scalars().all()
+    added = (await db.execute(
+        pg_insert(post_category)
+        .values([{"post_id": post_id, "category_id": category_id} for category_id in found])
+        .on_conflict_do_nothing()
+        .returning(post_category.c.category_id)
+    )).scalars().all()
+    await db.commit()
+
+    try:
+        for category_id in added:
+            await _add_script(keys=[posts_key(category_id)], args=[post_id, _score(timestamp), CACHE_SIZE])
+        for category_id in removed:
+            await redis_client.zrem(posts_key(category_id), post_id)
+    except RedisError:
+        # The lists can't be trusted any more; drop them and let the next read reload
+        metrics.inc("cache_errors_total", entity="category")
+        await redis_client.delete(*[posts_key(category_id) for category_id in [*added, *removed]])
+    await trending.set_post_categories(post_id, list(found))
+
+
+# ------------ BROWSING ------------ #
+
+async def get_category_posts(db: AsyncSession, category_id: int, page: PageParams) -> dict:
+    """One page of a category's posts, newest first"""
+    if not any(category["id"] == category_id for category in await list_categories()):
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    position = decode_cursor(page.cursor) if page.cursor else None
+    try:
+        cached = await _cached_page(db, category_id, position, page.limit)
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="category")
+        cached = None
+    if cached is not None:
+        metrics.inc("cache_hits_total", entity="category")
+        return cached
+
+    metrics.inc("cache_misses_total", entity="category")
+    query = (
+        select(*POST_ROWS.columns)
+        .join(post_category, post_category.c.post_id == Post.id)
+        .where(post_category.c.category_id == category_id)
+    )
+    rows, next_cursor = await paginate(db, query, Post.timestamp, Post.id, page)
+    if position is None:
+        try:
+            await _fill(db, category_id)
+        except RedisError:
+            metrics.inc("cache_errors_total", entity="category")
+    return {"items": [POST_ROWS.encode(row) for row in rows], "next_cursor": next_cursor}
+
+
+async def _cached_page(
+    db: AsyncSession, category_id: int, position: Optional[tuple[datetime, int]], limit: int
+) -> Optional[dict]:
+    """The page from the cached list, or None when the list can't answer it"""
+    key = posts_key(category_id)
+    top = _score(position[0]) if position else "+inf"
+    entries = await redis_client.zrevrangebyscore(key, top, "-inf", start=0, num=limit + 1 + SLACK, withscores=True)
+
+    floor = None
+    ranked = []
+    for member, score in entries:
+        if member == FLOOR:
+            floor = score
+            break
+        ranked.append((score, int(member)))
+    if position:
+        after = (_score(position[0]), position[1])
+        ranked = [entry for entry in ranked if entry < after]
+    ranked.sort(reverse=True)
+
+    # Enough posts for a full page (plus one to know another exists), or the whole category
+    if len(ranked) <= limit and floor != float("-inf"):
+        return None
+    ids = [post_id for _, post_id in ranked[:limit + 1]]
+    if not ids:
+        return {"items": [], "next_cursor": None}
+    posts = await cache.get_posts(db, ids)
+    if len(posts) < len(ids):
+        await redis_client.zrem(key, *[post_id for post_id in ids if post_id not in posts])
+        return None
+
+    items = [posts[post_id] for post_id in ids[:limit]]
+    next_cursor = None
+    if len(ids) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(datetime.fromisoformat(last["timestamp"]), last["id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def _fill(db: AsyncSession, category_id: int):
+    """Load the newest CACHE_SIZE posts of a category into its list"""
+    key = posts_key(category_id)
+    result = await db.execute(
+        select(Post.id, Post.timestamp)
+        .join(post_category, post_category.c.post_id == Post.id)
+        .where(post_category.c.category_id == category_id)
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+        .limit(CACHE_SIZE)
+    )
+    entries = {str(post_id): _score(timestamp) for post_id, timestamp in result.all()}
+    floor = float("-inf")
+    if len(entries) == CACHE_SIZE:
+        # The oldest cached score may be shared with posts that didn't fit: exclude it
+        floor = min(entries.values())
+        entries = {member: score for member, score in entries.items() if score > floor}
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.zadd(key, {**entries, FLOOR: floor})
+        pipe.expire(key, POSTS_TTL)
+        await pipe.execute()
+
+
+async def get_posts_in_categories(
+    db: AsyncSession, category_ids: list[int], match: str, page: PageParams
+) -> dict:
+    """Posts in any (OR) or all (AND) of category_ids, newest first"""
+    in_categories = select(post_category.c.post_id).where(post_category.c.category_id.in_(category_ids))
+    if match == "all":
+        in_categories = in_categories.group_by(post_category.c.post_id).having(
+            func.count() == len(set(category_ids))
+        )
+    query = select(*POST_ROWS.columns).where(Post.id.in_(in_categories))
+    rows, next_cursor = await paginate(db, query, Post.timestamp, Post.id, page)
+    return {"items": [POST_ROWS.encode(row) for row in rows], "next_cursor": next_cursor}
@@ -0,0 +1,100 @@
+"""Encoding of cached values stored in Redis: a 4-byte header, then the body"""
+import json
+import os
+import zlib
+from typing import Any
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional
+    msgpack = None
+
+try:
+    import lz4.frame as lz4
+except ImportError:  # pragma: no cover - optional
+    lz4 = None
+
+MAGIC = 0xFE
+VERSION = 1
+HEADER_SIZE = 4
+
+CODEC = os.getenv("CACHE_CODEC", "orjson")
+COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")
+COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "4096"))
+ZLIB_LEVEL = int(os.getenv("CACHE_ZLIB_LEVEL", "1"))
+
+# Wire ids; never renumber, only append
+FORMATS = {"orjson": 1, "msgpack": 2}
+COMPRESSIONS = {"none": 0, "zlib": 1, "lz4": 2}
+
+
+class CodecError(ValueError):
+    """A cached value this reader can't decode"""
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(body: bytes) -> Any:
+    return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+
+_dumps = {1: orjson.dumps, 2: _msgpack_dumps}
+_loads = {1: orjson.loads, 2: _msgpack_loads}
+_compress = {1: lambda body: zlib.compress(body, ZLIB_LEVEL), 2: lambda body: lz4.compress(body)}
+_decompress = {1: zlib.decompress, 2: lambda body: lz4.decompress(body)}
+
+
+class Codec:
+    """Encoder for one format/compression setting; decode() reads any of them"""
+
+    def __init__(self, codec: str = CODEC, compression: str = COMPRESSION, compress_min_bytes: int = COMPRESS_MIN_BYTES):
+        if codec != "json" and codec not in FORMATS:
+            raise ValueError(f"CACHE_CODEC must be json, {' or '.join(FORMATS)}, not {codec!r}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"CACHE_COMPRESSION must be one of {', '.join(COMPRESSIONS)}, not {compression!r}")
+        if codec == "msgpack" and msgpack is None:
+            raise ValueError("CACHE_CODEC=msgpack needs the msgpack package")
+        if compression == "lz4" and lz4 is None:
+            raise ValueError("CACHE_COMPRESSION=lz4 needs the lz4 package")
+        self.name = codec
+        self.format = FORMATS.get(codec)
+        self.compression = COMPRESSIONS[compression]
+        self.compress_min_bytes = compress_min_bytes
+
+    def encode(self, value: Any) -> bytes:
+        if self.format is None:
+            # The pre-header format: bare JSON text
+            return json.dumps(value).encode()
+        body = _dumps[self.format](value)
+        compression = 0
+        if self.compression and len(body) >= self.compress_min_bytes:
+            compressed = _compress[self.compression](body)
+            if len(compressed) < len(body):
+                body, compression = compressed, self.compression
+        return bytes((MAGIC, VERSION, self.format, compression)) + body
+
+    @staticmethod
+    def decode(raw: bytes) -> Any:
+        if not raw or raw[0] != MAGIC:
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError as exc:
+                raise CodecError(str(exc)) from exc
+        if len(raw) < HEADER_SIZE or raw[1] != VERSION or raw[2] not in _loads or (raw[3] and raw[3] not in _decompress):
+            raise CodecError(f"unsupported cache header {raw[:HEADER_SIZE].hex()}")
+        body = raw[HEADER_SIZE:]
+        try:
+            if raw[3]:
+                body = _decompress[raw[3]](body)
+            return _loads[raw[2]](body)
+        except Exception as exc:
+            raise CodecError(str(exc)) from exc
+
+
+codec = Codec()
+encode = codec.encode
+decode = Codec.decode
@@ -0,0 +1,278 @@
+import logging
+import os
+import time
+import uuid
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache, metrics
+from app.database import AsyncSessionLocal
+from app.models import Comment, CommentLikeKey, Follow, Post, PostLikeKey, PostSaveKey, User
+from app.redis_cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# "sync": counters are updated in the same transaction as the row they count.
+# "buffered": deltas are accumulated with HINCRBY and flushed to Postgres in batches,
+# which takes the row lock off hot posts at the cost of counts lagging by up to
+# COUNTER_FLUSH_INTERVAL seconds. The flush is a periodic job, so app.worker must run;
+# API workers log a warning at startup when no flush has happened recently.
+COUNTER_MODE = os.getenv("COUNTER_MODE", "sync")
+FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "2"))
+FLUSH_BATCH = 500
+# A flush that hasn't finished after this many seconds is presumed dead and its deltas are put back
+FLUSH_LEASE = int(os.getenv("COUNTER_FLUSH_LEASE", "60"))
+
+COUNTER_FIELDS = {
+    Post: ("like_count", "save_count", "comment_count"),
+    Comment: ("like_count", "reply_count"),
+    User: ("follower_count", "following_count"),
+}
+MODELS = {model.__tablename__: model for model in COUNTER_FIELDS}
+DIRTY_SET = "counters:dirty"
+# Flushes in progress, scored by start time
+FLUSHES = "counters:flushes"
+LAST_FLUSH_KEY = "counters:last_flush"
+
+
+def _counter_key(model, id: int) -> str:
+    return f"counters:{model.__tablename__}:{id}"
+
+
+def _batch_key(token: str) -> str:
+    return f"counters:flushing:{token}"
+
+
+# Take up to ARGV[1] dirty ids and move their hashes aside under the flush's token, where they stay until
+# the flush commits (released) or fails (restored). Returns key, fields, key, fields...
+# KEYS: dirty set, flushes, batch set. ARGV: limit, token, now
+_claim_script = redis_client.register_script("""
+local out = {}
+for _, key in ipairs(redis.call('SPOP', KEYS[1], ARGV[1])) do
+    if redis.call('EXISTS', key) == 1 then
+        local moved = key .. ':' .. ARGV[2]
+        redis.call('RENAME', key, moved)
+        redis.call('SADD', KEYS[3], key)
+        out[#out + 1] = key
+        out[#out + 1] = redis.call('HGETALL', moved)
+    end
+end
+if #out > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+end
+return out
+""")
+
+# Merge the deltas of the flushes in ARGV back into the live hashes and mark them dirty again.
+# KEYS: dirty set, flushes, then the batch set of each token. ARGV: tokens
+_restore_script = redis_client.register_script("""
+for i, token in ipairs(ARGV) do
+    local batch = KEYS[i + 2]
+    for _, key in ipairs(redis.call('SMEMBERS', batch)) do
+        local moved = key .. ':' .. token
+        local flat = redis.call('HGETALL', moved)
+        for i = 1, #flat, 2 do
+            redis.call('HINCRBY', key, flat[i], flat[i + 1])
+        end
+        redis.call('DEL', moved)
+        redis.call('SADD', KEYS[1], key)
+    end
+    redis.call('DEL', batch)
+    redis.call('ZREM', KEYS[2], token)
+end
+""")
+
+# Drop a committed flush's deltas. KEYS: flushes, batch set. ARGV: token
+_release_script = redis_client.register_script("""
+for _, key in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    redis.call('DEL', key .. ':' .. ARGV[1])
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[1], ARGV[1])
+""")
+
+
+async def bump(db: AsyncSession, model, id: int, **deltas: int):
+    """Apply counter deltas, e.g. bump(db, Post, 1, like_count=1).
+
+    In sync mode this must run before the commit of the change it counts.
+    """
+    if COUNTER_MODE == "buffered":
+        key = _counter_key(model, id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for field, delta in deltas.items():
+                pipe.hincrby(key, field, delta)
+            pipe.sadd(DIRTY_SET, key)
+            await pipe.execute()
+        return
+
+    await db.execute(
+        update(model)
+        .where(model.id == id)
+        .values({field: getattr(model, field) + delta for field, delta in deltas.items()})
+    )
+
+
+async def bump_many(db: AsyncSession, model, field: str, deltas: dict[int, int]):
+    """Apply one counter delta per id in a single executemany (or one Redis pipeline)"""
+    deltas = {id: delta for id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if COUNTER_MODE == "buffered":
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for id, delta in deltas.items():
+                key = _counter_key(model, id)
+                pipe.hincrby(key, field, delta)
+                pipe.sadd(DIRTY_SET, key)
+            await pipe.execute()
+        return
+
+    table = model.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values({field: table.c[field] + bindparam("b_delta")})
+    )
+    await db.execute(stmt, [{"b_id": id, "b_delta": delta} for id, delta in sorted(deltas.items())])
+
+
+async def invalidate_cached_counts(post_ids: list[int]):
+    """Drop the cached counts of posts whose counters were just committed.
+
+    Only needed in sync mode; in buffered mode the flusher does this once per batch.
+    """
+    if COUNTER_MODE != "buffered":
+        await cache.invalidate_post_counts(post_ids)
+
+
+async def invalidate_cached_user_counts(user_ids: list[int]):
+    """Same for cached users after a follow or unfollow"""
+    if COUNTER_MODE != "buffered":
+        await cache.invalidate_users(user_ids)
+
+
+# ------------ RECONCILIATION ------------ #
+
+async def _discard_pending(model, ids: list[int]):
+    if COUNTER_MODE == "buffered" and ids:
+        await redis_client.delete(*[_counter_key(model, id) for id in ids])
+
+
+async def reconcile_posts(db: AsyncSession, post_ids: list[int]):
+    """Recompute post counters from the child tables (after bulk deletes or drift)"""
+    if not post_ids:
+        return
+    await _discard_pending(Post, post_ids)
+    await db.execute(
+        update(Post)
+        .where(Post.id.in_(post_ids))
+        .values(
+            # Counted from the keys, which keep likes and saves whose partition was archived
+            like_count=select(func.count()).where(PostLikeKey.post_id == Post.id).scalar_subquery(),
+            save_count=select(func.count()).where(PostSaveKey.post_id == Post.id).scalar_subquery(),
+            comment_count=select(func.count()).where(Comment.post_id == Post.id).scalar_subquery(),
+        )
+    )
+
+
+async def reconcile_comments(db: AsyncSession, comment_ids: list[int]):
+    """Recompute comment counters from the child tables"""
+    if not comment_ids:
+        return
+    await _discard_pending(Comment, comment_ids)
+    replies = Comment.__table__.alias("replies")
+    await db.execute(
+        update(Comment)
+        .where(Comment.id.in_(comment_ids))
+        .values(
+            like_count=select(func.count()).where(CommentLikeKey.comment_id == Comment.id).scalar_subquery(),
+            reply_count=select(func.count()).where(replies.c.reply_to == Comment.id).scalar_subquery(),
+        )
+    )
+
+
+async def reconcile_users(db: AsyncSession, user_ids: list[int]):
+    """Recompute follower and following counts from follows"""
+    if not user_ids:
+        return
+    await _discard_pending(User, user_ids)
+    await db.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(
+            follower_count=select(func.count()).where(Follow.followee_id == User.id).scalar_subquery(),
+            following_count=select(func.count()).where(Follow.follower_id == User.id).scalar_subquery(),
+        )
+    )
+
+
+# ------------ BUFFERED FLUSH ------------ #
+
+async def flush_counters() -> int:
+    """Move buffered deltas from Redis into Postgres; returns the number of rows updated"""
+    token = uuid.uuid4().hex
+    claimed = await _claim_script(keys=[DIRTY_SET, FLUSHES, _batch_key(token)], args=[FLUSH_BATCH, token, time.time()])
+    if not claimed:
+        return 0
+
+    rows = {model: [] for model in COUNTER_FIELDS}
+    for key, flat in zip(claimed[::2], claimed[1::2]):
+        table, id = key.split(":")[1:]
+        model = MODELS[table]
+        deltas = dict(zip(flat[::2], flat[1::2]))
+        rows[model].append({"b_id": int(id), **{
+            f"b_{field}": int(deltas.get(field, 0)) for field in COUNTER_FIELDS[model]
+        }})
+
+    try:
+        async with AsyncSessionLocal() as db:
+            for model, params in rows.items():
+                if not params:
+                    continue
+                table = model.__table__
+                stmt = (
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values({field: table.c[field] + bindparam(f"b_{field}") for field in COUNTER_FIELDS[model]})
+                )
+                await db.execute(stmt, params)
+            await db.commit()
+    except Exception:
+        # Put the deltas back so the next flush retries them
+        await _restore_script(keys=[DIRTY_SET, FLUSHES, _batch_key(token)], args=[token])
+        raise
+    await _release_script(keys=[FLUSHES, _batch_key(token)], args=[token])
+
+    # Cached users embed their counts; posts keep theirs apart
+    await cache.invalidate_post_counts([row["b_id"] for row in rows[Post]])
+    await cache.invalidate_users([row["b_id"] for row in rows[User]])
+
+    flushed = sum(len(params) for params in rows.values())
+    metrics.inc("counter_rows_flushed_total", flushed)
+    return flushed
+
+
+async def flush_all_counters():
+    """Flush until the dirty set is empty; run every FLUSH_INTERVAL by app.worker in buffered mode"""
+    # Deltas of flushes whose worker died before committing or restoring them
+    stale = await redis_client.zrangebyscore(FLUSHES, "-inf", time.time() - FLUSH_LEASE)
+    if stale:
+        await _restore_script(keys=[DIRTY_SET, FLUSHES, *map(_batch_key, stale)], args=stale)
+        metrics.inc("counter_flushes_restored_total", len(stale))
+    while await flush_counters() == FLUSH_BATCH:
+        pass
+    await redis_client.set(LAST_FLUSH_KEY, time.time())
+
+
+async def check_flushing():
+    """Warn when buffered counters aren't being flushed, i.e. no app.worker is running"""
+    if COUNTER_MODE != "buffered":
+        return
+    last = await redis_client.get(LAST_FLUSH_KEY)
+    horizon = max(10 * FLUSH_INTERVAL, FLUSH_LEASE)
+    if last is None or time.time() - float(last) > horizon:
+        logger.warning(
+            "COUNTER_MODE=buffered but counters haven't been flushed in the last %ds; "
+            "they only reach Postgres while app.worker runs", horizon,
+        )
@@ -1,25 +1,175 @@
+import itertools
 import os
+import time
+from contextvars import ContextVar
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from fastapi import Request
 from dotenv import load_dotenv
 
+from app import metrics
+
 # Load environment variables from .env
 load_dotenv()
 
 # Get database URL from .env
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Comma-separated read replicas; without any, reads go to the primary
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# SQL logging is synchronous; only turn it on while debugging
+ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+# PgBouncer in transaction mode: it does the pooling, and a connection may land on a
+# different server session each transaction, so named prepared statements can't be reused
+PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# After a client commits, its reads stay on the primary this long so replica lag can't hide its writes
+STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", "5"))
+STICKY_COOKIE = "db_primary_until"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc("db_pool_timeouts_total", pool=self.logging_name)
+            raise
+        finally:
+            metrics.inc("db_pool_checkouts_total", pool=self.logging_name)
+            metrics.inc("db_pool_checkout_wait_seconds_total", time.perf_counter() - start, pool=self.logging_name)
+
+
+def _create_engine(url: str, name: str):
+    if PGBOUNCER:
+        return create_async_engine(
+            url,
+            echo=ECHO,
+            poolclass=NullPool,
+            connect_args={
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+        )
+    return create_async_engine(
+        url,
+        echo=ECHO,
+        poolclass=InstrumentedPool,
+        pool_logging_name=name,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        connect_args={
+            "statement_cache_size": STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": STATEMENT_CACHE_SIZE,
+        },
+    )
 
-# Create async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
 
-# Create session factory
+# Create async engines
+engine = _create_engine(DATABASE_URL, "primary")
+replica_engines = [_create_engine(url, f"replica{i}") for i, url in enumerate(REPLICA_URLS, 1)]
+
+# Create session factories
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
+_replica_sessions = itertools.cycle([
+    sessionmaker(bind=replica, class_=AsyncSession, expire_on_commit=False) for replica in replica_engines
+] or [AsyncSessionLocal])
+
+def read_sessions() -> sessionmaker:
+    """Session factory for reads that don't need read-your-writes: the next replica, or the primary"""
+    return next(_replica_sessions)
+
 
 # Dependency for FastAPI routes
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db(request: Request):
+    """Session for read-only handlers: a replica, unless this client wrote recently"""
+    try:
+        sticky = float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+    factory = AsyncSessionLocal if sticky else read_sessions()
+    async with factory() as session:
+        yield session
+
+
+# ------------ READ-YOUR-WRITES ------------ #
+
+# Per-request flag, set when a primary session commits
+_committed: ContextVar[dict] = ContextVar("committed")
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_commit(session):
+    state = _committed.get(None)
+    if state is not None and session.bind is engine.sync_engine:
+        state["wrote"] = True
+
+
+class ReadYourWritesMiddleware:
+    """Set a short-lived cookie on responses to requests that committed on the primary"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        state = {"wrote": False}
+        _committed.set(state)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and state["wrote"]:
+                cookie = (
+                    f"{STICKY_COOKIE}={time.time() + STICKY_SECONDS:.3f}; "
+                    f"Max-Age={int(STICKY_SECONDS) or 1}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+# ------------ METRICS ------------ #
+
+def _pool_samples():
+    for db_engine in [engine, *replica_engines]:
+        pool = db_engine.sync_engine.pool
+        if not isinstance(pool, InstrumentedPool):
+            continue
+        labels = {"pool": pool.logging_name}
+        yield "db_pool_size", "gauge", labels, pool.size()
+        yield "db_pool_checked_out", "gauge", labels, pool.checkedout()
+        yield "db_pool_overflow", "gauge", labels, max(pool.overflow(), 0)
+        # Share of the maximum connections (pool + overflow) in use
+        yield "db_pool_saturation", "gauge", labels, pool.checkedout() / (pool.size() + MAX_OVERFLOW)
+
+
+metrics.register_collector(_pool_samples)
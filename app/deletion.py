@@ -0,0 +1,229 @@
+"""Set-based deletes for users, posts and comments"""
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache, feed, follows, metrics, threads, trending
+from app.database import AsyncSessionLocal
+from app.models import User
+
+# Rows per transaction when a user is deleted in the background
+CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", "1000"))
+
+
+def _interaction_sql(table: str, keys: str, target_column: str, target_table: str, counter: str) -> str:
+    # Counters follow the keys, which outlive rows archived with their partition
+    return f"""
+        WITH doomed AS (
+            DELETE FROM {keys} WHERE ({target_column}, user_id) IN (
+                SELECT {target_column}, user_id FROM {keys} WHERE user_id = :user_id LIMIT :chunk
+            )
+            RETURNING {target_column}, user_id, timestamp
+        ), removed AS (
+            DELETE FROM {table} WHERE ({target_column}, user_id, timestamp) IN (
+                SELECT {target_column}, user_id, timestamp FROM doomed
+            )
+        ), counts AS (
+            UPDATE {target_table} SET {counter} = {target_table}.{counter} - c.n
+            FROM (SELECT {target_column}, count(*) AS n FROM doomed GROUP BY {target_column}) c
+            WHERE {target_table}.id = c.{target_column}
+            RETURNING {target_table}.id
+        )
+        SELECT (SELECT count(*) FROM doomed) AS deleted, ARRAY(SELECT id FROM counts) AS ids
+    """
+
+
+def _comment_likes_sql(comment_ids: str) -> str:
+    """CTEs deleting the likes, and their keys, on the comments that comment_ids selects"""
+    return f"""
+        like_keys AS (
+            DELETE FROM comment_like_keys WHERE comment_id IN ({comment_ids})
+        ), likes AS (
+            DELETE FROM comment_likes WHERE comment_id IN ({comment_ids})
+        )"""
+
+
+def _posts_sql(posts: str) -> str:
+    """Delete the posts matching posts; their comments, likes and saves go with them via the cascade"""
+    return f"""
+        WITH doomed AS (
+            DELETE FROM posts WHERE id IN (
+                SELECT id FROM posts WHERE {posts} LIMIT :chunk
+            )
+            RETURNING id
+        ), {_comment_likes_sql("SELECT id FROM comments WHERE post_id IN (SELECT id FROM doomed)")}
+        SELECT (SELECT count(*) FROM doomed) AS deleted, ARRAY(SELECT id FROM doomed) AS ids
+    """
+
+
+def _follows_sql(column: str, other_column: str, counter: str) -> str:
+    """Delete follows in one direction and take them off the other side's counter"""
+    return f"""
+        WITH doomed AS (
+            DELETE FROM follows WHERE (follower_id, followee_id) IN (
+                SELECT follower_id, followee_id FROM follows WHERE {column} = :user_id LIMIT :chunk
+            )
+            RETURNING {other_column}
+        ), counts AS (
+            UPDATE users SET {counter} = users.{counter} - 1
+            FROM doomed WHERE users.id = doomed.{other_column}
+            RETURNING users.id
+        )
+        SELECT (SELECT count(*) FROM doomed) AS deleted, ARRAY(SELECT id FROM counts) AS ids
+    """
+
+
+def _comments_sql(roots: str) -> str:
+    """Delete the comments matching roots with their reply subtrees and the likes on all of them"""
+    return f"""
+        WITH RECURSIVE roots AS (
+            SELECT id FROM comments WHERE {roots} LIMIT :chunk
+        ), subtree AS (
+            SELECT id, post_id, reply_to, timestamp FROM comments WHERE id IN (SELECT id FROM roots)
+            UNION
+            SELECT c.id, c.post_id, c.reply_to, c.timestamp FROM comments c JOIN subtree s ON c.reply_to = s.id
+        ), post_counts AS (
+            UPDATE posts SET comment_count = posts.comment_count - c.n
+            FROM (SELECT post_id, count(*) AS n FROM subtree GROUP BY post_id) c
+            WHERE posts.id = c.post_id
+            RETURNING posts.id
+        ), reply_counts AS (
+            -- Only parents outside the subtree survive to be updated
+            UPDATE comments SET reply_count = comments.reply_count - c.n
+            FROM (
+                SELECT reply_to, count(*) AS n FROM subtree
+                WHERE reply_to IS NOT NULL AND reply_to NOT IN (SELECT id FROM subtree)
+                GROUP BY reply_to
+            ) c
+            WHERE comments.id = c.reply_to
+        ), {_comment_likes_sql("SELECT id FROM subtree")}, doomed AS (
+            DELETE FROM comments WHERE (id, timestamp) IN (SELECT id, timestamp FROM subtree) RETURNING id
+        )
+        SELECT (SELECT count(*) FROM doomed) AS deleted, ARRAY(SELECT id FROM post_counts) AS ids
+    """
+
+
+async def _after_posts_deleted(post_ids: list[int]):
+    await cache.invalidate_posts(post_ids)
+    await trending.forget_posts(post_ids)
+
+
+async def _after_comments_deleted(post_ids: list[int]):
+    await cache.invalidate_post_entities(post_ids)
+    await threads.invalidate_threads(post_ids)
+
+
+async def _after_followees_unlinked(user_ids: list[int]):
+    await cache.invalidate_users(user_ids)
+    await follows.forget(user_ids, ("followers",))
+
+
+async def _after_followers_unlinked(user_ids: list[int]):
+    await cache.invalidate_users(user_ids)
+    await follows.forget(user_ids, ("following",))
+
+
+@dataclass
+class Step:
+    sql: str
+    # Called after commit with the ids the statement returned
+    after: Optional[Callable[[list[int]], Awaitable]] = None
+
+
+# A user's own posts go first: the cascade takes everything under them, which
+# leaves less for the counter-adjusting steps to visit
+USER_STEPS = [
+    Step(_posts_sql("user_id = :user_id"), _after_posts_deleted),
+    Step(_comments_sql("user_id = :user_id"), _after_comments_deleted),
+    Step(
+        _interaction_sql("post_likes", "post_like_keys", "post_id", "posts", "like_count"),
+        cache.invalidate_post_entities,
+    ),
+    Step(
+        _interaction_sql("post_saves", "post_save_keys", "post_id", "posts", "save_count"),
+        cache.invalidate_post_entities,
+    ),
+    Step(_interaction_sql("comment_likes", "comment_like_keys", "comment_id", "comments", "like_count")),
+    Step(_follows_sql("follower_id", "followee_id", "follower_count"), _after_followees_unlinked),
+    Step(_follows_sql("followee_id", "follower_id", "following_count"), _after_followers_unlinked),
+]
+
+DELETE_POST = _posts_sql("id = :post_id")
+DELETE_COMMENT = _comments_sql("id = :comment_id")
+
+
+async def _run_step(db: AsyncSession, step: Step, params: dict) -> tuple[int, list[int]]:
+    row = (await db.execute(text(step.sql), params)).one()
+    return row.deleted, row.ids
+
+
+# ------------ USERS ------------ #
+
+async def delete_user(db: AsyncSession, user_id: int) -> bool:
+    """Delete a user and everything they own in one transaction; False if there was no such user"""
+    if not await db.get(User, user_id):
+        return False
+
+    params = {"user_id": user_id, "chunk": None}
+    touched = []
+    for step in USER_STEPS:
+        _, ids = await _run_step(db, step, params)
+        touched.append((step, ids))
+    # Anything the steps raced with goes with the cascade
+    await db.execute(delete(User).where(User.id == user_id))
+    await db.commit()
+
+    for step, ids in touched:
+        if step.after:
+            await step.after(ids)
+    await cache.invalidate_user(user_id)
+    await feed.forget_user(user_id)
+    await follows.forget([user_id])
+    return True
+
+
+async def delete_user_in_chunks(user_id: int, chunk_size: int = CHUNK_SIZE):
+    """Delete a user's rows a chunk per transaction so no statement holds locks for long.
+
+    Runs outside the request (as a background task); the final delete_user sweeps up
+    whatever the user created while the chunks were running.
+    """
+    params = {"user_id": user_id, "chunk": chunk_size}
+    for step in USER_STEPS:
+        while True:
+            async with AsyncSessionLocal() as db:
+                deleted, ids = await _run_step(db, step, params)
+                await db.commit()
+            if step.after:
+                await step.after(ids)
+            metrics.inc("delete_chunks_total")
+            if deleted < chunk_size:
+                break
+
+    async with AsyncSessionLocal() as db:
+        await delete_user(db, user_id)
+
+
+# ------------ POSTS & COMMENTS ------------ #
+
+async def delete_post(db: AsyncSession, post_id: int) -> bool:
+    """Comments, likes, saves and category links go with the post via the cascade"""
+    deleted, _ = await _run_step(db, Step(DELETE_POST), {"post_id": post_id, "chunk": None})
+    if not deleted:
+        return False
+    await db.commit()
+    await _after_posts_deleted([post_id])
+    return True
+
+
+async def delete_comment(db: AsyncSession, comment_id: int) -> bool:
+    """Delete a comment and its whole reply subtree, fixing the post and parent counters"""
+    deleted, post_ids = await _run_step(db, Step(DELETE_COMMENT), {"comment_id": comment_id, "chunk": None})
+    if not deleted:
+        return False
+    await db.commit()
+    await _after_comments_deleted(post_ids)
+    return True
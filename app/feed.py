@@ -0,0 +1,253 @@
+import base64
+import binascii
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache
+from app.models import Follow, Post
+from app.redis_cache import redis_client
+
+# Timelines are bounded; anything older than this falls back to the DB rebuild
+TIMELINE_LIMIT = int(os.getenv("FEED_TIMELINE_LIMIT", "800"))
+# Idle timelines expire and get rebuilt from Postgres on the next read
+TIMELINE_TTL = int(os.getenv("FEED_TIMELINE_TTL", str(7 * 24 * 3600)))
+# Authors with more followers than this are merged at read time instead of fanned out
+FANOUT_THRESHOLD = int(os.getenv("FEED_FANOUT_THRESHOLD", "10000"))
+# Fan-out writes are sent to Redis in pipelines of this many timelines
+FANOUT_BATCH = 1000
+# How long a rebuild may take before the posts recorded for it are dropped and it doesn't write
+REBUILD_LEASE_MS = int(os.getenv("FEED_REBUILD_LEASE_MS", "10000"))
+
+# Member at the bottom of every rebuilt timeline, so an empty feed is still cached
+MARKER = "_"
+
+CELEBRITIES_SET = "feed:celebrities"
+
+
+def timeline_key(user_id: int) -> str:
+    return f"feed:timeline:{user_id}"
+
+
+def outbox_key(user_id: int) -> str:
+    return f"feed:outbox:{user_id}"
+
+
+def lease_key(key: str) -> str:
+    """Held while a timeline is being rebuilt from Postgres"""
+    return f"{key}:loading"
+
+
+def pending_key(key: str) -> str:
+    """Posts fanned out while a timeline was being rebuilt, replayed onto the rebuilt one"""
+    return f"{key}:pending"
+
+
+def post_score(timestamp: datetime) -> float:
+    """Timeline score for a post (UTC epoch seconds)"""
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+def encode_feed_cursor(score: float, post_id: int) -> str:
+    """Opaque cursor for the (score, post id) position of the last entry on a page"""
+    raw = f"{score!r}|{post_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_feed_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, post_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return float(score), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Adds a post to every timeline that is already materialized, then trims and refreshes its TTL.
+# Missing timelines are skipped so a rebuild never sees a partial list; one that is being rebuilt
+# records the post for the rebuild to replay instead.
+_fan_out_script = redis_client.register_script("""
+local added = 0
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('ZADD', key, ARGV[1], ARGV[2])
+        redis.call('ZREMRANGEBYRANK', key, 0, -tonumber(ARGV[3]) - 1)
+        redis.call('EXPIRE', key, ARGV[4])
+        added = added + 1
+    else
+        local ttl = redis.call('PTTL', key .. ':loading')
+        if ttl > 0 then
+            redis.call('RPUSH', key .. ':pending', ARGV[1], ARGV[2])
+            redis.call('PEXPIRE', key .. ':pending', ttl)
+        end
+    end
+end
+return added
+""")
+
+# Replace a timeline with the marker and the (score, post id) pairs in ARGV[5:], replay the posts
+# fanned out since the rebuild began, and release the lease. Does nothing, returning 0, if the lease was lost.
+# KEYS: timeline, lease, pending. ARGV: lease token, marker, limit, TTL, pairs
+_rebuild_script = redis_client.register_script("""
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 5, #ARGV, 1000 do
+    redis.call('ZADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+local pending = redis.call('LRANGE', KEYS[3], 0, -1)
+for i = 1, #pending, 2 do
+    redis.call('ZADD', KEYS[1], pending[i], pending[i + 1])
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+redis.call('ZADD', KEYS[1], '-inf', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('DEL', KEYS[2], KEYS[3])
+return 1
+""")
+
+
+# ------------ WRITE PATH ------------ #
+
+async def publish_post(post: Post):
+    """Put a new post on the author's outbox and own timeline; followers get it from fan_out_post"""
+    score = post_score(post.timestamp)
+    outbox = outbox_key(post.user_id)
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zadd(outbox, {str(post.id): score})
+        pipe.zremrangebyrank(outbox, 0, -TIMELINE_LIMIT - 1)
+        await pipe.execute()
+    await _fan_out_script(
+        keys=[timeline_key(post.user_id)], args=[score, str(post.id), TIMELINE_LIMIT, TIMELINE_TTL]
+    )
+
+
+async def fan_out_post(db: AsyncSession, post_id: int, author_id: int, score: float):
+    """Push a post onto its author's followers' timelines; run by the fan_out_post job (app.tasks)"""
+    # One extra row tells us the author is over the threshold without counting everyone
+    result = await db.execute(
+        select(Follow.follower_id)
+        .where(Follow.followee_id == author_id)
+        .limit(FANOUT_THRESHOLD + 1)
+    )
+    follower_ids = result.scalars().all()
+
+    if len(follower_ids) > FANOUT_THRESHOLD:
+        # Followers pick this author's posts up from the outbox when they read
+        await redis_client.sadd(CELEBRITIES_SET, str(author_id))
+        return
+
+    keys = [timeline_key(uid) for uid in follower_ids]
+    for start in range(0, len(keys), FANOUT_BATCH):
+        await _fan_out_script(
+            keys=keys[start:start + FANOUT_BATCH],
+            args=[score, str(post_id), TIMELINE_LIMIT, TIMELINE_TTL],
+        )
+
+
+async def invalidate_timeline(user_id: int):
+    """Drop a materialized timeline so the next read rebuilds it (e.g. after (un)follow)"""
+    key = timeline_key(user_id)
+    # A rebuild in flight read the old follows; losing its lease keeps it from writing them back
+    await redis_client.delete(key, lease_key(key), pending_key(key))
+
+
+async def forget_user(user_id: int):
+    """Drop a deleted user's timeline, outbox and celebrity flag"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        key = timeline_key(user_id)
+        pipe.delete(key, lease_key(key), pending_key(key), outbox_key(user_id))
+        pipe.srem(CELEBRITIES_SET, user_id)
+        await pipe.execute()
+
+
+# ------------ READ PATH ------------ #
+
+async def _rebuild_timeline(db: AsyncSession, user_id: int):
+    """Materialize a timeline from Postgres after a cache miss or expiry"""
+    key = timeline_key(user_id)
+    token = uuid.uuid4().hex
+    # Taken before the query: posts fanned out after it are recorded for replay, earlier ones are in the snapshot
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(lease_key(key), token, px=REBUILD_LEASE_MS)
+        pipe.delete(pending_key(key))
+        await pipe.execute()
+
+    followees = select(Follow.followee_id).where(Follow.follower_id == user_id)
+    query = (
+        select(Post.id, Post.timestamp)
+        .where((Post.user_id == user_id) | Post.user_id.in_(followees))
+        .order_by(Post.timestamp.desc())
+        .limit(TIMELINE_LIMIT)
+    )
+    rows = (await db.execute(query)).all()
+
+    pairs = [value for row in rows for value in (post_score(row.timestamp), str(row.id))]
+    await _rebuild_script(
+        keys=[key, lease_key(key), pending_key(key)], args=[token, MARKER, TIMELINE_LIMIT, TIMELINE_TTL, *pairs]
+    )
+
+
+async def _followed_celebrities(db: AsyncSession, user_id: int) -> list[int]:
+    celebrities = await redis_client.smembers(CELEBRITIES_SET)
+    if not celebrities:
+        return []
+    result = await db.execute(
+        select(Follow.followee_id).where(
+            Follow.follower_id == user_id,
+            Follow.followee_id.in_([int(c) for c in celebrities]),
+        )
+    )
+    return result.scalars().all()
+
+
+async def get_feed(
+    db: AsyncSession, user_id: int, limit: int, cursor: Optional[str] = None
+) -> tuple[list[dict], Optional[str]]:
+    """Return one page of a user's home feed, newest first, and the cursor for the next page"""
+    key = timeline_key(user_id)
+    if not await redis_client.exists(key):
+        await _rebuild_timeline(db, user_id)
+
+    sources = [key] + [outbox_key(uid) for uid in await _followed_celebrities(db, user_id)]
+    position = decode_feed_cursor(cursor) if cursor else None
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for source in sources:
+            if position is None:
+                pipe.zrevrangebyscore(source, "+inf", "-inf", start=0, num=limit, withscores=True)
+            else:
+                # Posts sharing the cursor's score are filtered by id below; the rest start strictly under it
+                pipe.zrangebyscore(source, position[0], position[0], withscores=True)
+                pipe.zrevrangebyscore(source, f"({position[0]!r}", "-inf", start=0, num=limit, withscores=True)
+        pages = await pipe.execute()
+
+    # Merge the timeline with celebrity outboxes; a post may appear in both
+    merged = {}
+    for page in pages:
+        for post_id, score in page:
+            if post_id != MARKER:
+                merged[int(post_id)] = score
+    entries = sorted(
+        (
+            (score, post_id) for post_id, score in merged.items()
+            if position is None or (score, post_id) < position
+        ),
+        reverse=True,
+    )[:limit]
+    if not entries:
+        return [], None
+
+    posts_by_id = await cache.get_posts(db, [post_id for _, post_id in entries])
+
+    # Deleted posts are left in timelines and simply skipped here
+    posts = [posts_by_id[post_id] for _, post_id in entries if post_id in posts_by_id]
+    next_cursor = encode_feed_cursor(*entries[-1]) if len(entries) == limit else None
+    return posts, next_cursor
@@ -0,0 +1,291 @@
+"""Follow graph: follow/unfollow, follower and following pages, and set queries over mirrored Redis sets"""
+import os
+import uuid
+from typing import Optional
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy import ARRAY, Integer, and_, any_, bindparam, delete, exists, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app import counters, feed, metrics
+from app.database import AsyncSessionLocal
+from app.models import Follow, User
+from app.pagination import PageParams, paginate
+from app.redis_cache import redis_client
+
+SET_TTL = int(os.getenv("FOLLOW_SET_TTL", "86400"))
+MAX_SET_SIZE = int(os.getenv("FOLLOW_MAX_SET_SIZE", "10000"))
+LOAD_BATCH = 10000
+# How long a load may take before the changes recorded for it are dropped and it doesn't write
+LOAD_LEASE_MS = int(os.getenv("FOLLOW_LOAD_LEASE_MS", "10000"))
+
+MARKER = "_"
+# Sole member of a set that is too large to mirror
+TOO_LARGE = "!"
+
+# direction -> (column holding the user, column holding the other side, counter on users)
+DIRECTIONS = {
+    "followers": (Follow.followee_id, Follow.follower_id, "follower_count"),
+    "following": (Follow.follower_id, Follow.followee_id, "following_count"),
+}
+
+
+def set_key(user_id: int, direction: str) -> str:
+    return f"follows:{user_id}:{direction}"
+
+
+def lease_key(key: str) -> str:
+    """Held while a set is being loaded from Postgres"""
+    return f"{key}:loading"
+
+
+def pending_key(key: str) -> str:
+    """Changes made to a set while it was being loaded, replayed onto the loaded snapshot"""
+    return f"{key}:pending"
+
+
+# Add or remove one edge in whichever of the two sets are materialized (and not flagged too large);
+# a set that is being loaded records the change for the load to replay instead.
+# KEYS: follower's following set, followee's followers set. ARGV: action, follower id, followee id
+_update_script = redis_client.register_script("""
+local members = {ARGV[3], ARGV[2]}
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        if redis.call('SISMEMBER', key, '!') == 0 then
+            redis.call(ARGV[1], key, members[i])
+        end
+    else
+        local ttl = redis.call('PTTL', key .. ':loading')
+        if ttl > 0 then
+            redis.call('RPUSH', key .. ':pending', ARGV[1], members[i])
+            redis.call('PEXPIRE', key .. ':pending', ttl)
+        end
+    end
+end
+""")
+
+# Replace a set with the marker and ARGV[4:] (or just "!" for a set too large to mirror), replay the changes
+# recorded since the load began, and release the lease. Does nothing, returning 0, if the lease was lost.
+# KEYS: set, lease, pending. ARGV: lease token, marker, TTL, ids
+_load_script = redis_client.register_script("""
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SADD', KEYS[1], ARGV[2])
+for i = 4, #ARGV, 1000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+if ARGV[2] ~= '!' then
+    local pending = redis.call('LRANGE', KEYS[3], 0, -1)
+    for i = 1, #pending, 2 do
+        redis.call(pending[i], KEYS[1], pending[i + 1])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('DEL', KEYS[2], KEYS[3])
+return 1
+""")
+
+# State of both sets (0 missing, 1 mirrored, 2 too large) followed by their intersection
+# when both are mirrored, or by the members of the one mirrored set when the other is too large
+_intersect_script = redis_client.register_script("""
+local function state(key)
+    if redis.call('EXISTS', key) == 0 then return 0 end
+    if redis.call('SISMEMBER', key, '!') == 1 then return 2 end
+    return 1
+end
+local a, b = state(KEYS[1]), state(KEYS[2])
+local out = {}
+if a == 1 and b == 1 then
+    out = redis.call('SINTER', KEYS[1], KEYS[2])
+elseif a == 1 and b == 2 then
+    out = redis.call('SMEMBERS', KEYS[1])
+elseif a == 2 and b == 1 then
+    out = redis.call('SMEMBERS', KEYS[2])
+end
+table.insert(out, 1, b)
+table.insert(out, 1, a)
+return out
+""")
+
+
+# ------------ WRITES ------------ #
+
+async def _bump_counts(db: AsyncSession, follower_id: int, followee_id: int, delta: int):
+    # Lock the two user rows in id order so crossing follows can't deadlock
+    bumps = sorted([(follower_id, "following_count"), (followee_id, "follower_count")])
+    for user_id, field in bumps:
+        await counters.bump(db, User, user_id, **{field: delta})
+
+
+async def _after_change(action: str, follower_id: int, followee_id: int):
+    try:
+        await _update_script(
+            keys=[set_key(follower_id, "following"), set_key(followee_id, "followers")],
+            args=[action, follower_id, followee_id],
+        )
+    except RedisError:
+        # The sets may now be stale; drop them rather than serve a wrong answer
+        metrics.inc("cache_errors_total", entity="follows")
+        await forget([follower_id, followee_id])
+    await counters.invalidate_cached_user_counts([follower_id, followee_id])
+    await feed.invalidate_timeline(follower_id)
+
+
+async def follow(db: AsyncSession, follower_id: int, followee_id: int) -> bool:
+    """Follow a user; False if already following, 404 if either user doesn't exist"""
+    stmt = (
+        pg_insert(Follow)
+        .values(follower_id=follower_id, followee_id=followee_id)
+        .on_conflict_do_nothing(index_elements=[Follow.follower_id, Follow.followee_id])
+        .returning(Follow.followee_id)
+    )
+    try:
+        inserted = (await db.execute(stmt)).scalar_one_or_none()
+    except IntegrityError:
+        raise HTTPException(status_code=404, detail="User not found")
+    if inserted is None:
+        return False
+    await _bump_counts(db, follower_id, followee_id, 1)
+    await db.commit()
+    await _after_change("SADD", follower_id, followee_id)
+    return True
+
+
+async def unfollow(db: AsyncSession, follower_id: int, followee_id: int) -> bool:
+    """False if there was no such follow"""
+    deleted = (await db.execute(
+        delete(Follow)
+        .where(Follow.follower_id == follower_id, Follow.followee_id == followee_id)
+        .returning(Follow.followee_id)
+    )).scalar_one_or_none()
+    if deleted is None:
+        return False
+    await _bump_counts(db, follower_id, followee_id, -1)
+    await db.commit()
+    await _after_change("SREM", follower_id, followee_id)
+    return True
+
+
+async def forget(user_ids: list[int], directions: tuple[str, ...] = ("followers", "following")):
+    """Drop mirrored sets; the next query reloads them"""
+    keys = [set_key(user_id, direction) for user_id in user_ids for direction in directions]
+    if keys:
+        # Losing the lease also stops loads in progress from writing their snapshot back
+        await redis_client.delete(*keys, *[lease_key(key) for key in keys], *[pending_key(key) for key in keys])
+
+
+# ------------ LISTS ------------ #
+
+async def list_page(db: AsyncSession, user_id: int, direction: str, page: PageParams) -> tuple[list, Optional[str]]:
+    """A page of a user's followers or followees, most recent follow first"""
+    column, other, _ = DIRECTIONS[direction]
+    query = select(User.id, User.name, Follow.timestamp).join(User, User.id == other).where(column == user_id)
+    return await paginate(db, query, Follow.timestamp, other, page)
+
+
+async def relationship(db: AsyncSession, user_id: int, other_id: int) -> dict:
+    """Whether user_id follows other_id and the other way round: two primary key probes"""
+    following = exists().where(Follow.follower_id == user_id, Follow.followee_id == other_id)
+    followed_by = exists().where(Follow.follower_id == other_id, Follow.followee_id == user_id)
+    row = (await db.execute(select(following.label("following"), followed_by.label("followed_by")))).one()
+    return {"following": row.following, "followed_by": row.followed_by, "mutual": row.following and row.followed_by}
+
+
+# ------------ SET QUERIES ------------ #
+
+async def _load(user_id: int, direction: str):
+    """Mirror a user's set into Redis, or flag it as too large to mirror"""
+    column, other, _ = DIRECTIONS[direction]
+    key = set_key(user_id, direction)
+    token = uuid.uuid4().hex
+    # Taken before the query: follows committed after it are recorded for replay, earlier ones are in the snapshot
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(lease_key(key), token, px=LOAD_LEASE_MS)
+        pipe.delete(pending_key(key))
+        await pipe.execute()
+    # One row past the limit tells us the set is too large without counting it. Read from the primary:
+    # a replica can be missing follows committed before the lease, and nothing would replay them
+    async with AsyncSessionLocal() as db:
+        ids = (await db.execute(select(other).where(column == user_id).limit(MAX_SET_SIZE + 1))).scalars().all()
+    metrics.inc("cache_misses_total", entity="follows")
+    marker, ids = (TOO_LARGE, []) if len(ids) > MAX_SET_SIZE else (MARKER, ids)
+    if not await _load_script(keys=[key, lease_key(key), pending_key(key)], args=[token, marker, SET_TTL, *ids]):
+        metrics.inc("cache_stale_loads_total", entity="follows")
+
+
+async def _probe(db: AsyncSession, user_id: int, direction: str, candidates: list[int]) -> list[int]:
+    """The candidates that are in the user's set, by primary key lookups"""
+    if not candidates:
+        return []
+    column, other, _ = DIRECTIONS[direction]
+    result = await db.execute(
+        select(other).where(column == user_id, other == any_(bindparam("candidates", candidates, type_=ARRAY(Integer))))
+    )
+    return result.scalars().all()
+
+
+async def _join(db: AsyncSession, left: tuple[int, str], right: tuple[int, str]) -> list[int]:
+    """Both sides are large accounts: let Postgres join the two index ranges"""
+    metrics.inc("follow_sql_intersections_total")
+    left_column, left_other, _ = DIRECTIONS[left[1]]
+    right_follow = aliased(Follow)
+    right_column, right_other = (getattr(right_follow, column.key) for column in DIRECTIONS[right[1]][:2])
+    result = await db.execute(
+        select(left_other)
+        .join(right_follow, and_(right_other == left_other, right_column == right[0]))
+        .where(left_column == left[0])
+    )
+    return result.scalars().all()
+
+
+async def _intersect(db: AsyncSession, left: tuple[int, str], right: tuple[int, str]) -> list[int]:
+    """Ids in both (user, direction) sets"""
+    keys = [set_key(*left), set_key(*right)]
+    try:
+        reply = await _intersect_script(keys=keys)
+        if 0 in reply[:2]:
+            for side, state in zip((left, right), reply[:2]):
+                if state == 0:
+                    await _load(*side)
+            reply = await _intersect_script(keys=keys)
+        else:
+            metrics.inc("cache_hits_total", entity="follows")
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="follows")
+        reply = [2, 2]
+
+    states = tuple(reply[:2])
+    members = [int(member) for member in reply[2:] if member != MARKER]
+    if states == (1, 1):
+        return members
+    if states == (1, 2):
+        return await _probe(db, *right, members)
+    if states == (2, 1):
+        return await _probe(db, *left, members)
+    return await _join(db, left, right)
+
+
+async def _sample(db: AsyncSession, ids: list[int], limit: int) -> dict:
+    """Count plus the first `limit` users (highest ids first)"""
+    chosen = sorted(ids, reverse=True)[:limit]
+    users = {}
+    if chosen:
+        result = await db.execute(select(User.id, User.name).where(User.id.in_(chosen)))
+        users = {row.id: {"id": row.id, "name": row.name} for row in result.all()}
+    return {"count": len(ids), "items": [users[user_id] for user_id in chosen if user_id in users]}
+
+
+async def mutuals(db: AsyncSession, user_id: int, limit: int) -> dict:
+    """Users that user_id follows and who follow them back"""
+    return await _sample(db, await _intersect(db, (user_id, "following"), (user_id, "followers")), limit)
+
+
+async def followed_by(db: AsyncSession, viewer_id: int, user_id: int, limit: int) -> dict:
+    """People viewer_id follows who follow user_id ("followed by A, B and 12 others")"""
+    return await _sample(db, await _intersect(db, (viewer_id, "following"), (user_id, "followers")), limit)
@@ -0,0 +1,214 @@
+"""
+Stream NDJSON or CSV into Postgres with COPY, in chunked transactions
+
+    python -m app.importer likes events.ndjson
+    python -m app.importer posts posts.csv --format csv --chunk-size 50000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from app.ingest import utc_naive
+
+load_dotenv()
+
+
+@dataclass
+class ImportSpec:
+    # Staging columns and their Postgres types, in COPY order
+    columns: list[tuple[str, str]]
+    # INSERT ... SELECT from the _import staging table; must return the inserted row count
+    sql: str
+
+
+NOW = "now() AT TIME ZONE 'utc'"
+
+
+def _interaction_sql(table: str, keys: str, target_column: str, target_table: str, counter: str) -> str:
+    # Pairs are claimed in the keys table first; only new ones reach the partitioned table
+    return f"""
+        WITH claimed AS (
+            INSERT INTO {keys} ({target_column}, user_id, timestamp)
+            SELECT s.{target_column}, s.user_id, coalesce(s.timestamp, {NOW})
+            FROM _import s
+            JOIN {target_table} t ON t.id = s.{target_column}
+            JOIN users u ON u.id = s.user_id
+            ON CONFLICT DO NOTHING
+            RETURNING {target_column}, user_id, timestamp
+        ), ins AS (
+            INSERT INTO {table} ({target_column}, user_id, timestamp)
+            SELECT {target_column}, user_id, timestamp FROM claimed
+            RETURNING {target_column}
+        ), counts AS (
+            UPDATE {target_table} SET {counter} = {target_table}.{counter} + c.n
+            FROM (SELECT {target_column}, count(*) AS n FROM ins GROUP BY {target_column}) c
+            WHERE {target_table}.id = c.{target_column}
+        )
+        SELECT count(*) FROM ins
+    """
+
+
+SPECS = {
+    "posts": ImportSpec(
+        columns=[("user_id", "integer"), ("content", "text"), ("timestamp", "timestamp")],
+        sql=f"""
+            WITH ins AS (
+                INSERT INTO posts (user_id, content, timestamp)
+                SELECT s.user_id, s.content, coalesce(s.timestamp, {NOW})
+                FROM _import s
+                JOIN users u ON u.id = s.user_id
+                RETURNING id
+            )
+            SELECT count(*) FROM ins
+        """,
+    ),
+    "comments": ImportSpec(
+        columns=[
+            ("post_id", "integer"), ("user_id", "integer"), ("content", "text"),
+            ("reply_to", "integer"), ("timestamp", "timestamp"),
+        ],
+        sql=f"""
+            WITH ins AS (
+                INSERT INTO comments (post_id, user_id, content, reply_to, timestamp)
+                SELECT s.post_id, s.user_id, s.content, s.reply_to, coalesce(s.timestamp, {NOW})
+                FROM _import s
+                JOIN posts p ON p.id = s.post_id
+                JOIN users u ON u.id = s.user_id
+                LEFT JOIN comments parent ON parent.id = s.reply_to
+                WHERE s.reply_to IS NULL OR parent.id IS NOT NULL
+                RETURNING post_id, reply_to
+            ), post_counts AS (
+                UPDATE posts SET comment_count = posts.comment_count + c.n
+                FROM (SELECT post_id, count(*) AS n FROM ins GROUP BY post_id) c
+                WHERE posts.id = c.post_id
+            ), reply_counts AS (
+                UPDATE comments SET reply_count = comments.reply_count + c.n
+                FROM (SELECT reply_to, count(*) AS n FROM ins WHERE reply_to IS NOT NULL GROUP BY reply_to) c
+                WHERE comments.id = c.reply_to
+            )
+            SELECT count(*) FROM ins
+        """,
+    ),
+    "likes": ImportSpec(
+        columns=[("post_id", "integer"), ("user_id", "integer"), ("timestamp", "timestamp")],
+        sql=_interaction_sql("post_likes", "post_like_keys", "post_id", "posts", "like_count"),
+    ),
+    "saves": ImportSpec(
+        columns=[("post_id", "integer"), ("user_id", "integer"), ("timestamp", "timestamp")],
+        sql=_interaction_sql("post_saves", "post_save_keys", "post_id", "posts", "save_count"),
+    ),
+    "comment-likes": ImportSpec(
+        columns=[("comment_id", "integer"), ("user_id", "integer"), ("timestamp", "timestamp")],
+        sql=_interaction_sql("comment_likes", "comment_like_keys", "comment_id", "comments", "like_count"),
+    ),
+}
+
+
+def asyncpg_dsn(url: str) -> str:
+    """asyncpg takes a plain postgresql:// DSN, not the SQLAlchemy dialect URL"""
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+# ------------ INPUT ------------ #
+
+def _convert(value, pg_type: str):
+    if value is None or value == "":
+        return None
+    if pg_type == "integer":
+        return int(value)
+    if pg_type == "timestamp":
+        return utc_naive(datetime.fromisoformat(value) if isinstance(value, str) else value)
+    return str(value)
+
+
+def read_records(stream: io.TextIOBase, fmt: str, spec: ImportSpec) -> Iterator[tuple]:
+    """Yield one tuple per input row in staging-column order"""
+    rows = csv.DictReader(stream) if fmt == "csv" else (json.loads(line) for line in stream if line.strip())
+    for row in rows:
+        yield tuple(_convert(row.get(name), pg_type) for name, pg_type in spec.columns)
+
+
+def chunked(records: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ------------ IMPORT ------------ #
+
+async def import_chunk(conn: asyncpg.Connection, spec: ImportSpec, records: list[tuple]) -> int:
+    """COPY one chunk into staging and move it into place in a single transaction"""
+    columns = ", ".join(f"{name} {pg_type}" for name, pg_type in spec.columns)
+    async with conn.transaction():
+        await conn.execute(f"CREATE TEMP TABLE _import ({columns}) ON COMMIT DROP")
+        await conn.copy_records_to_table("_import", records=records, columns=[name for name, _ in spec.columns])
+        return await conn.fetchval(spec.sql)
+
+
+async def run_import(
+    kind: str, stream: io.TextIOBase, fmt: str, chunk_size: int, dsn: Optional[str] = None
+) -> dict:
+    spec = SPECS[kind]
+    conn = await asyncpg.connect(dsn or asyncpg_dsn(os.environ["DATABASE_URL"]))
+    read = inserted = 0
+    start = time.perf_counter()
+    try:
+        for chunk in chunked(read_records(stream, fmt, spec), chunk_size):
+            chunk_start = time.perf_counter()
+            chunk_inserted = await import_chunk(conn, spec, chunk)
+            read += len(chunk)
+            inserted += chunk_inserted
+            elapsed = time.perf_counter() - chunk_start
+            print(
+                f"{kind}: chunk of {len(chunk)} -> {chunk_inserted} inserted "
+                f"({len(chunk) / elapsed:,.0f} rows/s)",
+                file=sys.stderr,
+            )
+    finally:
+        await conn.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "kind": kind,
+        "read": read,
+        "inserted": inserted,
+        "skipped": read - inserted,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(read / elapsed) if elapsed else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=sorted(SPECS))
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.path == "-":
+        summary = await run_import(args.kind, sys.stdin, args.format, args.chunk_size)
+    else:
+        with open(args.path, newline="") as stream:
+            summary = await run_import(args.kind, stream, args.format, args.chunk_size)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
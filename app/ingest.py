@@ -0,0 +1,161 @@
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import counters, threads, trending
+from app.models import Comment, CommentLike, CommentLikeKey, Post, PostLike, PostLikeKey, PostSave, PostSaveKey, User
+
+# Largest array accepted by the batch endpoints; bigger backfills go through app.importer
+MAX_BATCH_SIZE = int(os.getenv("INGEST_MAX_BATCH", "1000"))
+
+
+def check_batch_size(items: list):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {MAX_BATCH_SIZE} items")
+
+
+def utc_naive(timestamp: Optional[datetime]) -> datetime:
+    """Timestamps are stored as naive UTC; default to now"""
+    if timestamp is None:
+        return datetime.utcnow()
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+async def existing_ids(db: AsyncSession, model, ids: set[int]) -> set[int]:
+    """Set-wise foreign key check: which of ids exist in model's table"""
+    if not ids:
+        return set()
+    result = await db.execute(select(model.id).where(model.id.in_(ids)))
+    return set(result.scalars().all())
+
+
+# ------------ BATCH INSERTS ------------ #
+
+async def insert_posts(db: AsyncSession, items: list) -> dict:
+    users = await existing_ids(db, User, {item.user_id for item in items})
+    rows = [
+        {"user_id": item.user_id, "content": item.content, "timestamp": utc_naive(item.timestamp)}
+        for item in items if item.user_id in users
+    ]
+    ids = []
+    if rows:
+        ids = (await db.execute(insert(Post).values(rows).returning(Post.id))).scalars().all()
+    await db.commit()
+    return {"inserted": len(ids), "rejected": len(items) - len(rows), "ids": ids}
+
+
+async def insert_comments(db: AsyncSession, items: list) -> dict:
+    users = await existing_ids(db, User, {item.user_id for item in items})
+    posts = await existing_ids(db, Post, {item.post_id for item in items})
+    parents = await existing_ids(db, Comment, {item.reply_to for item in items if item.reply_to})
+    rows = [
+        {
+            "post_id": item.post_id,
+            "user_id": item.user_id,
+            "content": item.content,
+            "reply_to": item.reply_to,
+            "timestamp": utc_naive(item.timestamp),
+        }
+        for item in items
+        if item.user_id in users and item.post_id in posts and (not item.reply_to or item.reply_to in parents)
+    ]
+    ids = []
+    if rows:
+        ids = (await db.execute(insert(Comment).values(rows).returning(Comment.id))).scalars().all()
+        await counters.bump_many(db, Post, "comment_count", Counter(row["post_id"] for row in rows))
+        await counters.bump_many(
+            db, Comment, "reply_count", Counter(row["reply_to"] for row in rows if row["reply_to"])
+        )
+    await db.commit()
+    post_ids = sorted({row["post_id"] for row in rows})
+    await counters.invalidate_cached_counts(post_ids)
+    await threads.invalidate_threads(post_ids)
+    await trending.record_many("comment", Counter(row["post_id"] for row in rows))
+    return {"inserted": len(ids), "rejected": len(items) - len(rows), "ids": ids}
+
+
+# ------------ INTERACTIONS ------------ #
+
+# kind -> (model, keys model, target column, target model, counter column)
+INTERACTIONS = {
+    "post_likes": (PostLike, PostLikeKey, "post_id", Post, "like_count"),
+    "post_saves": (PostSave, PostSaveKey, "post_id", Post, "save_count"),
+    "comment_likes": (CommentLike, CommentLikeKey, "comment_id", Comment, "like_count"),
+}
+
+
+async def add_interactions(db: AsyncSession, kind: str, rows: list[dict]) -> list[int]:
+    """Insert likes/saves whose (target, user) pair is new; returns the target id of each inserted row.
+
+    The partitioned tables can't hold a unique (target, user) index, so the pair is claimed in the
+    keys table first and only claimed rows are inserted, in one statement
+    """
+    model, key_model, target_column, *_ = INTERACTIONS[kind]
+    target = getattr(key_model, target_column)
+    claimed = (
+        pg_insert(key_model)
+        .values(rows)
+        .on_conflict_do_nothing()
+        .returning(target, key_model.user_id, key_model.timestamp)
+        .cte("claimed")
+    )
+    stmt = (
+        insert(model)
+        .from_select([target_column, "user_id", "timestamp"], select(claimed))
+        .add_cte(claimed)
+        .returning(getattr(model, target_column))
+    )
+    return (await db.execute(stmt)).scalars().all()
+
+
+async def remove_interactions(db: AsyncSession, kind: str, pairs: list[tuple[int, int]]) -> list[int]:
+    """Delete likes/saves by (target, user); returns the target id of each one removed.
+
+    The key's timestamp pins each row to a single partition
+    """
+    model, key_model, target_column, *_ = INTERACTIONS[kind]
+    key_target = getattr(key_model, target_column)
+    removed = (await db.execute(
+        delete(key_model)
+        .where(tuple_(key_target, key_model.user_id).in_(pairs))
+        .returning(key_target, key_model.user_id, key_model.timestamp)
+    )).all()
+    if removed:
+        target = getattr(model, target_column)
+        await db.execute(
+            delete(model).where(tuple_(target, model.user_id, model.timestamp).in_([tuple(row) for row in removed]))
+        )
+    return [row[0] for row in removed]
+
+
+async def insert_interactions(db: AsyncSession, kind: str, items: list) -> dict:
+    """Idempotently insert likes/saves; duplicates (in the DB or the batch) are skipped"""
+    _, _, target_column, target_model, counter_field = INTERACTIONS[kind]
+    users = await existing_ids(db, User, {item.user_id for item in items})
+    targets = await existing_ids(db, target_model, {getattr(item, target_column) for item in items})
+    rows = [
+        {target_column: getattr(item, target_column), "user_id": item.user_id, "timestamp": utc_naive(item.timestamp)}
+        for item in items
+        if item.user_id in users and getattr(item, target_column) in targets
+    ]
+    inserted = []
+    if rows:
+        inserted = await add_interactions(db, kind, rows)
+        await counters.bump_many(db, target_model, counter_field, Counter(inserted))
+    await db.commit()
+    if target_model is Post:
+        await counters.invalidate_cached_counts(sorted(set(inserted)))
+        await trending.record_many("like" if kind == "post_likes" else "save", Counter(inserted))
+    return {
+        "inserted": len(inserted),
+        "duplicates": len(rows) - len(inserted),
+        "rejected": len(items) - len(rows),
+    }
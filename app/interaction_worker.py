@@ -0,0 +1,79 @@
+"""
+Consumer for the interaction stream (see app.interactions). Run one or more:
+
+    python -m app.interaction_worker --consumer worker-1
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from app import interactions, metrics
+from app.database import AsyncSessionLocal, engine
+
+logger = logging.getLogger("app.interaction_worker")
+
+# Seconds between backlog log lines
+REPORT_INTERVAL = 30
+
+
+async def apply(entries: list):
+    try:
+        async with AsyncSessionLocal() as db:
+            totals = await interactions.apply_batch(db, entries)
+        logger.debug("applied %d events: %s", len(entries), totals)
+    except Exception:
+        if len(entries) == 1:
+            raise
+        # Apply the entries one by one, so only the ones that fail stay pending and count towards dead-lettering
+        logger.exception("batch of %d failed, retrying entries one by one", len(entries))
+        failed = 0
+        for entry in entries:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await interactions.apply_batch(db, [entry])
+            except Exception:
+                failed += 1
+        if failed:
+            raise RuntimeError(f"{failed} of {len(entries)} events failed")
+
+
+async def run(consumer: str):
+    await interactions.ensure_group()
+    logger.info("consuming %s as %s", interactions.STREAM, consumer)
+    last_report = 0.0
+    while True:
+        try:
+            entries = await interactions.read_batch(consumer)
+            if entries:
+                await apply(entries)
+        except Exception:
+            # Unacked entries stay pending and are retried once reclaimed
+            metrics.inc("interaction_batch_errors_total")
+            logger.exception("batch failed")
+            await asyncio.sleep(1)
+
+        if time.monotonic() - last_report > REPORT_INTERVAL:
+            last_report = time.monotonic()
+            lag = await interactions.sample_backlog()
+            logger.info(
+                "backlog %d events, oldest %.1fs",
+                metrics.get("interaction_stream_backlog"), lag or 0.0,
+            )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumer", default=f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    try:
+        await run(args.consumer)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
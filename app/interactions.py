@@ -0,0 +1,276 @@
+"""Write-behind for likes, saves and comment likes through a Redis Stream (INTERACTION_MODE=stream)"""
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import counters, ingest, metrics, trending
+from app.codec import encode
+from app.models import Comment, CommentLike, Post, PostLike, PostSave, User
+from app.redis_cache import INTERACTION_LIMIT, redis_client
+from app.schemas import CommentLikeImport, InteractionImport
+
+logger = logging.getLogger(__name__)
+
+MODE = os.getenv("INTERACTION_MODE", "sync")
+STREAM = "interactions:stream"
+GROUP = "interaction-writers"
+BATCH_SIZE = int(os.getenv("INTERACTION_BATCH_SIZE", "500"))
+BLOCK_MS = int(os.getenv("INTERACTION_BLOCK_MS", "1000"))
+# Entries pending this long on a consumer are presumed lost with it and reclaimed
+CLAIM_IDLE_MS = int(os.getenv("INTERACTION_CLAIM_IDLE_MS", "60000"))
+DEDUPE_TTL = int(os.getenv("INTERACTION_DEDUPE_TTL", "86400"))
+# Entries delivered this many times without being applied are moved to DEAD_LETTER_STREAM
+MAX_DELIVERIES = int(os.getenv("INTERACTION_MAX_DELIVERIES", "5"))
+DEAD_LETTER_STREAM = "interactions:dead"
+
+# kind -> (model, target column, target model, import schema, trending event)
+KINDS = {
+    "post_likes": (PostLike, "post_id", Post, InteractionImport, "like"),
+    "post_saves": (PostSave, "post_id", Post, InteractionImport, "save"),
+    "comment_likes": (CommentLike, "comment_id", Comment, CommentLikeImport, None),
+}
+
+
+def seen_key(kind: str, target_id: int) -> str:
+    return f"interactions:seen:{kind}:{target_id}"
+
+
+# KEYS: seen set, stream, user's recent interactions list.
+# ARGV: action, user id, kind, target id, timestamp, dedupe TTL, force, recent entry, recent limit.
+# "add" enqueues only if the user wasn't in the set; "remove" only if they were, or when forced.
+_enqueue_script = redis_client.register_script("""
+local changed
+if ARGV[1] == 'add' then
+    changed = redis.call('SADD', KEYS[1], ARGV[2])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[2])
+end
+if changed == 0 and ARGV[7] ~= '1' then return 0 end
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('XADD', KEYS[2], '*', 'action', ARGV[1], 'kind', ARGV[3], 'target', ARGV[4], 'user', ARGV[2], 'ts', ARGV[5])
+if ARGV[8] ~= '' then
+    redis.call('LPUSH', KEYS[3], ARGV[8])
+    redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[9]) - 1)
+end
+return 1
+""")
+
+# For each (seen set, user) pair in ARGV: 1 if the user is in the set, 0 if not, -1 if the set expired
+_intent_script = redis_client.register_script("""
+local out = {}
+for i = 1, #ARGV, 2 do
+    if redis.call('EXISTS', ARGV[i]) == 0 then
+        out[#out + 1] = -1
+    else
+        out[#out + 1] = redis.call('SISMEMBER', ARGV[i], ARGV[i + 1])
+    end
+end
+return out
+""")
+
+
+# KEYS: seen sets. ARGV: the user for each set. Drops each user from their set, so dropped events aren't
+# mistaken for recorded ones. Sets that expired are left missing.
+_forget_script = redis_client.register_script("""
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('SREM', key, ARGV[i])
+    end
+end
+""")
+
+
+# ------------ API SIDE ------------ #
+
+async def _enqueue(kind: str, target_id: int, user_id: int, action: str, force: bool = False) -> bool:
+    now = datetime.utcnow()
+    recent = ""
+    if action == "add" and KINDS[kind][4]:
+        recent = encode({"type": KINDS[kind][4], "post_id": target_id, "timestamp": now.isoformat()})
+    changed = await _enqueue_script(
+        keys=[seen_key(kind, target_id), STREAM, f"user:{user_id}:interactions"],
+        args=[action, user_id, kind, target_id, now.isoformat(), DEDUPE_TTL, int(force), recent, INTERACTION_LIMIT],
+    )
+    if changed:
+        metrics.inc("interaction_events_enqueued_total", kind=kind, action=action)
+    return bool(changed)
+
+
+async def add(kind: str, target_id: int, user_id: int) -> bool:
+    """Queue a like/save; False if the user already has one pending or recorded"""
+    return await _enqueue(kind, target_id, user_id, "add")
+
+
+async def remove(db: AsyncSession, kind: str, target_id: int, user_id: int) -> bool:
+    """Queue an unlike/unsave; False if there is nothing to remove"""
+    if await _enqueue(kind, target_id, user_id, "remove"):
+        return True
+    # Not in the seen set: it may still be in Postgres from before the set expired
+    _, key_model, target_column, *_ = ingest.INTERACTIONS[kind]
+    found = await db.scalar(select(exists().where(
+        getattr(key_model, target_column) == target_id, key_model.user_id == user_id
+    )))
+    if found:
+        await _enqueue(kind, target_id, user_id, "remove", force=True)
+    return bool(found)
+
+
+# ------------ WORKER SIDE ------------ #
+
+async def ensure_group():
+    try:
+        await redis_client.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+async def read_batch(consumer: str) -> list[tuple[str, dict]]:
+    """Entries lost by dead consumers first, then new ones (blocking up to BLOCK_MS)"""
+    _, claimed, _ = await redis_client.xautoclaim(STREAM, GROUP, consumer, CLAIM_IDLE_MS, "0-0", count=BATCH_SIZE)
+    if claimed:
+        metrics.inc("interaction_events_reclaimed_total", len(claimed))
+        claimed = await _dead_letter(claimed)
+        if claimed:
+            return claimed
+    response = await redis_client.xreadgroup(GROUP, consumer, {STREAM: ">"}, count=BATCH_SIZE, block=BLOCK_MS)
+    return response[0][1] if response else []
+
+
+async def _dead_letter(entries: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+    """Move entries delivered MAX_DELIVERIES times to DEAD_LETTER_STREAM; returns the rest"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for entry_id, _ in entries:
+            pipe.xpending_range(STREAM, GROUP, entry_id, entry_id, 1)
+        pending = await pipe.execute()
+    dead = [
+        (entry_id, fields) for (entry_id, fields), info in zip(entries, pending)
+        if info and info[0]["times_delivered"] >= MAX_DELIVERIES
+    ]
+    if not dead:
+        return entries
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for entry_id, fields in dead:
+            pipe.xadd(DEAD_LETTER_STREAM, {**fields, "entry": entry_id})
+        ids = [entry_id for entry_id, _ in dead]
+        pipe.xack(STREAM, GROUP, *ids)
+        pipe.xdel(STREAM, *ids)
+        await pipe.execute()
+    await _forget_additions([fields for _, fields in dead])
+    metrics.inc("interaction_events_dead_lettered_total", len(dead))
+    logger.warning("moved %d events to %s after %d deliveries", len(dead), DEAD_LETTER_STREAM, MAX_DELIVERIES)
+    dead_ids = set(ids)
+    return [entry for entry in entries if entry[0] not in dead_ids]
+
+
+async def _forget_additions(events: list[dict]):
+    """Drop the users of likes/saves that will never be written from the seen sets"""
+    pairs = []
+    for fields in events:
+        try:
+            if fields.get("action") == "add" and fields.get("kind") in KINDS:
+                pairs.append((seen_key(fields["kind"], int(fields["target"])), int(fields["user"])))
+        except (KeyError, ValueError):
+            continue
+    if pairs:
+        await _forget_script(keys=[key for key, _ in pairs], args=[user_id for _, user_id in pairs])
+
+
+async def apply_batch(db: AsyncSession, entries: list[tuple[str, dict]]) -> dict[str, int]:
+    """Write a batch of events to Postgres, then ack and delete them from the stream"""
+    # The last event per (kind, target, user) decides; earlier ones are superseded
+    latest: dict[tuple[str, int, int], tuple[str, datetime]] = {}
+    for _, fields in entries:
+        if fields.get("kind") not in KINDS:
+            continue
+        key = (fields["kind"], int(fields["target"]), int(fields["user"]))
+        latest[key] = (fields["action"], datetime.fromisoformat(fields["ts"]))
+
+    # Skip events the API has since reversed (e.g. a like whose unlike is in another batch)
+    keys = list(latest)
+    intents = await _intent_script(args=[
+        arg for kind, target_id, user_id in keys for arg in (seen_key(kind, target_id), user_id)
+    ]) if keys else []
+    additions: dict[str, list] = {kind: [] for kind in KINDS}
+    removals: dict[str, list] = {kind: [] for kind in KINDS}
+    skipped = 0
+    for (kind, target_id, user_id), intent in zip(keys, intents):
+        action, timestamp = latest[(kind, target_id, user_id)]
+        if intent != -1 and intent != (action == "add"):
+            skipped += 1
+        elif action == "add":
+            _, target_column, _, schema, _ = KINDS[kind]
+            additions[kind].append(schema(**{target_column: target_id, "user_id": user_id, "timestamp": timestamp}))
+        else:
+            removals[kind].append((target_id, user_id))
+
+    totals = {"inserted": 0, "duplicates": 0, "rejected": 0, "deleted": 0, "skipped": skipped}
+    for kind in KINDS:
+        if removals[kind]:
+            totals["deleted"] += await _delete(db, kind, removals[kind])
+        if additions[kind]:
+            # Commits, and updates counters, cached counts and trending
+            result = await ingest.insert_interactions(db, kind, additions[kind])
+            for field in ("inserted", "duplicates", "rejected"):
+                totals[field] += result[field]
+            if result["rejected"]:
+                await _forget_rejected(db, kind, additions[kind])
+
+    ids = [entry_id for entry_id, _ in entries]
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.xack(STREAM, GROUP, *ids)
+        pipe.xdel(STREAM, *ids)
+        await pipe.execute()
+
+    metrics.inc("interaction_batches_total")
+    for field, value in totals.items():
+        metrics.inc("interaction_events_total", value, outcome=field)
+    return totals
+
+
+async def _forget_rejected(db: AsyncSession, kind: str, items: list):
+    """Likes/saves of a user or target that no longer exists: take them back out of the seen sets"""
+    _, target_column, target_model, _, _ = KINDS[kind]
+    users = await ingest.existing_ids(db, User, {item.user_id for item in items})
+    targets = await ingest.existing_ids(db, target_model, {getattr(item, target_column) for item in items})
+    await _forget_additions([
+        {"action": "add", "kind": kind, "target": getattr(item, target_column), "user": item.user_id}
+        for item in items
+        if item.user_id not in users or getattr(item, target_column) not in targets
+    ])
+
+
+async def _delete(db: AsyncSession, kind: str, pairs: list[tuple[int, int]]) -> int:
+    model, _, target_model, _, trending_event = KINDS[kind]
+    deleted = await ingest.remove_interactions(db, kind, pairs)
+    decrements = {}
+    for target_id in deleted:
+        decrements[target_id] = decrements.get(target_id, 0) - 1
+    field = "like_count" if model is not PostSave else "save_count"
+    await counters.bump_many(db, target_model, field, decrements)
+    await db.commit()
+    if target_model is Post:
+        await counters.invalidate_cached_counts(sorted(decrements))
+        await trending.record_many(trending_event, decrements)
+    return len(deleted)
+
+
+async def sample_backlog() -> Optional[float]:
+    """Set the backlog gauges: unapplied events, and how long the oldest has waited"""
+    try:
+        length = await redis_client.xlen(STREAM)
+        oldest = await redis_client.xrange(STREAM, count=1)
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="interactions")
+        return None
+    lag = time.time() - int(oldest[0][0].split("-")[0]) / 1000 if oldest else 0.0
+    metrics.set_gauge("interaction_stream_backlog", length)
+    metrics.set_gauge("interaction_stream_lag_seconds", lag)
+    return lag
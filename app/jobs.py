@@ -0,0 +1,244 @@
+"""Redis-backed job queue for work that shouldn't run in the request; `python -m app.worker` runs it"""
+import json
+import math
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from app import metrics
+from app.redis_cache import redis_client
+
+READY = "jobs:ready"
+SCHEDULED = "jobs:scheduled"
+RUNNING = "jobs:running"
+FAILED = "jobs:failed"
+
+# Seconds a claimed job may go without a heartbeat before another worker takes it
+LEASE = int(os.getenv("JOB_LEASE", "60"))
+# How long finished jobs (and idempotency keys) are kept for GET /jobs/{id}
+RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "86400"))
+# The same for runs of periodic jobs, which would otherwise pile up (a 2s periodic makes 43k runs a day)
+PERIODIC_RESULT_TTL = int(os.getenv("JOB_PERIODIC_RESULT_TTL", "60"))
+FAILED_LIMIT = 1000
+
+
+def data_key(job_id: str) -> str:
+    return f"jobs:data:{job_id}"
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[..., Awaitable]
+    max_attempts: int = 5
+    # Seconds before the first retry; doubles on each later one
+    backoff: float = 2.0
+    # Most instances of this job running at once in one worker
+    concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+
+
+@dataclass
+class Periodic:
+    name: str
+    every: float
+
+
+registry: dict[str, Job] = {}
+periodic_jobs: list[Periodic] = []
+
+
+def job(name: str, **options):
+    """Register an async function as a job: @job("delete_user", max_attempts=3)"""
+    def register(func):
+        registry[name] = Job(name, func, **options)
+        return func
+    return register
+
+
+def every(seconds: float, name: str):
+    """Enqueue the registered job `name` (with no kwargs) every `seconds`"""
+    if seconds > 0:
+        periodic_jobs.append(Periodic(name, seconds))
+
+
+# ARGV: id, name, args, max attempts, run at (0 = now), idempotency key, result TTL
+_enqueue_script = redis_client.register_script("""
+if ARGV[6] ~= '' then
+    local existing = redis.call('GET', 'jobs:idem:' .. ARGV[6])
+    if existing then return existing end
+    redis.call('SET', 'jobs:idem:' .. ARGV[6], ARGV[1], 'EX', ARGV[7])
+end
+local data = 'jobs:data:' .. ARGV[1]
+redis.call('HSET', data, 'name', ARGV[2], 'args', ARGV[3], 'attempts', 0, 'max_attempts', ARGV[4])
+redis.call('HSET', data, 'result_ttl', ARGV[7])
+if tonumber(ARGV[5]) > 0 then
+    redis.call('HSET', data, 'state', 'scheduled')
+    redis.call('ZADD', 'jobs:scheduled', ARGV[5], ARGV[1])
+else
+    redis.call('HSET', data, 'state', 'ready')
+    redis.call('LPUSH', 'jobs:ready', ARGV[1])
+end
+return ARGV[1]
+""")
+
+# Move due scheduled jobs and jobs with expired leases to jobs:ready. ARGV: now
+_promote_script = redis_client.register_script("""
+local moved = 0
+for _, source in ipairs({'jobs:scheduled', 'jobs:running'}) do
+    local due = redis.call('ZRANGEBYSCORE', source, '-inf', ARGV[1], 'LIMIT', 0, 1000)
+    for _, id in ipairs(due) do
+        redis.call('ZREM', source, id)
+        redis.call('HSET', 'jobs:data:' .. id, 'state', 'ready')
+        redis.call('LPUSH', 'jobs:ready', id)
+    end
+    moved = moved + #due
+end
+return moved
+""")
+
+# Pop the next ready job and lease it. ARGV: lease expiry. Returns id, name, args, attempts, max attempts
+_claim_script = redis_client.register_script("""
+local id = redis.call('RPOP', 'jobs:ready')
+if not id then return nil end
+local data = 'jobs:data:' .. id
+redis.call('ZADD', 'jobs:running', ARGV[1], id)
+redis.call('HSET', data, 'state', 'running')
+local attempts = redis.call('HINCRBY', data, 'attempts', 1)
+local fields = redis.call('HMGET', data, 'name', 'args', 'max_attempts')
+return {id, fields[1], fields[2], attempts, fields[3]}
+""")
+
+# Mark a job done and keep its data for the TTL it was enqueued with. ARGV: id, default TTL
+_complete_script = redis_client.register_script("""
+local data = 'jobs:data:' .. ARGV[1]
+redis.call('ZREM', 'jobs:running', ARGV[1])
+redis.call('HSET', data, 'state', 'done')
+redis.call('EXPIRE', data, redis.call('HGET', data, 'result_ttl') or ARGV[2])
+""")
+
+# Put a claimed job back without using up an attempt. ARGV: id, run at
+_defer_script = redis_client.register_script("""
+local data = 'jobs:data:' .. ARGV[1]
+redis.call('ZREM', 'jobs:running', ARGV[1])
+redis.call('HINCRBY', data, 'attempts', -1)
+redis.call('HSET', data, 'state', 'scheduled')
+redis.call('ZADD', 'jobs:scheduled', ARGV[2], ARGV[1])
+""")
+
+
+# ------------ PRODUCER ------------ #
+
+async def enqueue(
+    name: str, idempotency_key: Optional[str] = None, delay: float = 0, result_ttl: int = RESULT_TTL, **kwargs
+) -> str:
+    """Queue a job and return its id.
+
+    With an idempotency key, enqueueing again while the key is held (result_ttl
+    seconds) returns the first job's id instead of adding another.
+    """
+    spec = registry[name]
+    job_id = uuid.uuid4().hex
+    run_at = time.time() + delay if delay > 0 else 0
+    queued = await _enqueue_script(args=[
+        job_id, name, json.dumps(kwargs), spec.max_attempts, run_at, idempotency_key or "", result_ttl,
+    ])
+    if queued == job_id:
+        metrics.inc("jobs_enqueued_total", job=name)
+    return queued
+
+
+async def get_status(job_id: str) -> Optional[dict]:
+    data = await redis_client.hgetall(data_key(job_id))
+    if not data:
+        return None
+    return {
+        "id": job_id,
+        "name": data["name"],
+        "state": data["state"],
+        "attempts": int(data["attempts"]),
+        "error": data.get("error"),
+    }
+
+
+# ------------ CONSUMER ------------ #
+
+async def promote() -> int:
+    return await _promote_script(args=[time.time()])
+
+
+async def claim() -> Optional[tuple[str, str, dict, int, int]]:
+    """The next ready job as (id, name, kwargs, attempt, max attempts), or None"""
+    claimed = await _claim_script(args=[time.time() + LEASE])
+    if not claimed:
+        return None
+    job_id, name, args, attempt, max_attempts = claimed
+    return job_id, name, json.loads(args), int(attempt), int(max_attempts)
+
+
+async def renew(job_ids: list[str]):
+    """Extend the leases of jobs still running"""
+    if job_ids:
+        expiry = time.time() + LEASE
+        await redis_client.zadd(RUNNING, {job_id: expiry for job_id in job_ids}, xx=True)
+
+
+async def complete(job_id: str):
+    await _complete_script(args=[job_id, RESULT_TTL])
+
+
+async def defer(job_id: str, delay: float):
+    """Hand a claimed job back to run after delay, e.g. when its per-job concurrency is used up"""
+    await _defer_script(args=[job_id, time.time() + delay])
+
+
+async def retry_or_fail(job_id: str, name: str, attempt: int, max_attempts: int, error: str) -> bool:
+    """Schedule the next attempt with backoff; True if retried, False if the job failed for good"""
+    spec = registry.get(name)
+    retried = spec is not None and attempt < max_attempts
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.zrem(RUNNING, job_id)
+        pipe.hset(data_key(job_id), "error", error[:1000])
+        if retried:
+            # Full jitter keeps a burst of failures from retrying in lockstep
+            delay = random.uniform(0, spec.backoff * 2 ** (attempt - 1))
+            pipe.hset(data_key(job_id), "state", "scheduled")
+            pipe.zadd(SCHEDULED, {job_id: time.time() + delay})
+        else:
+            pipe.hset(data_key(job_id), "state", "failed")
+            pipe.expire(data_key(job_id), RESULT_TTL)
+            pipe.lpush(FAILED, job_id)
+            pipe.ltrim(FAILED, 0, FAILED_LIMIT - 1)
+        await pipe.execute()
+    return retried
+
+
+async def schedule_periodic(last_slots: dict[str, int]):
+    """Enqueue periodic jobs whose interval has rolled over since last_slots"""
+    now = time.time()
+    for periodic in periodic_jobs:
+        slot = int(now // periodic.every)
+        if last_slots.get(periodic.name) != slot:
+            # The key has to outlive the interval; the run's data needn't outlive it by much
+            await enqueue(
+                periodic.name, idempotency_key=f"periodic:{periodic.name}:{slot}",
+                result_ttl=max(PERIODIC_RESULT_TTL, math.ceil(2 * periodic.every)),
+            )
+            last_slots[periodic.name] = slot
+
+
+async def sample_queue():
+    """Set the queue depth gauges"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.llen(READY)
+        pipe.zcard(SCHEDULED)
+        pipe.zcard(RUNNING)
+        pipe.llen(FAILED)
+        ready, scheduled, running, failed = await pipe.execute()
+    metrics.set_gauge("jobs_ready", ready)
+    metrics.set_gauge("jobs_scheduled", scheduled)
+    metrics.set_gauge("jobs_running", running)
+    metrics.set_gauge("jobs_failed", failed)
@@ -0,0 +1,163 @@
+"""Worker startup, shutdown and readiness"""
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import cache, categories, counters, metrics, schema, trending
+from app.codec import encode
+from app.database import POOL_SIZE, AsyncSessionLocal, InstrumentedPool, engine, replica_engines
+from app.local_cache import local_cache
+from app.models import Post
+from app.redis_cache import redis_binary, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Capped at the pool size: overflow connections are closed again as soon as they are returned
+DB_CONNECTIONS = min(int(os.getenv("STARTUP_DB_CONNECTIONS", str(POOL_SIZE))), POOL_SIZE)
+REDIS_CONNECTIONS = int(os.getenv("STARTUP_REDIS_CONNECTIONS", "4"))
+WARM_CACHE = os.getenv("STARTUP_WARM_CACHE", "false").lower() == "true"
+WARM_POSTS = int(os.getenv("STARTUP_WARM_POSTS", "500"))
+# Entries taken from each trending list
+WARM_TRENDING = int(os.getenv("STARTUP_WARM_TRENDING", "100"))
+
+# Seconds between SIGTERM and uvicorn's shutdown during which readiness already fails (0 disables)
+DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "0"))
+# Each readiness ping gives up after this long
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+
+state = {"draining": False}
+
+
+# ------------ POOLS ------------ #
+
+async def _open_engine(db_engine, count: int):
+    async def ping():
+        async with db_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Held concurrently, so each one is a separate connection that goes back into the pool
+    await asyncio.gather(*[ping() for _ in range(count)])
+
+
+async def open_pools():
+    """Connect the database pools and the Redis clients ahead of the first request"""
+    await asyncio.gather(*[
+        _open_engine(db_engine, DB_CONNECTIONS)
+        for db_engine in [engine, *replica_engines]
+        # Under PgBouncer (NullPool) there is nothing to keep open
+        if isinstance(db_engine.sync_engine.pool, InstrumentedPool)
+    ])
+    try:
+        await asyncio.gather(*[
+            client.ping() for client in (redis_client, redis_binary) for _ in range(REDIS_CONNECTIONS)
+        ])
+    except RedisError as exc:
+        # Every Redis read in the app fails open, so a missing Redis is no reason to stay unready
+        logger.warning("redis unavailable at startup: %s", exc)
+
+
+async def close_pools():
+    for db_engine in [engine, *replica_engines]:
+        await db_engine.dispose()
+    for client in (redis_client, redis_binary):
+        await client.aclose()
+
+
+# ------------ WARM-UP ------------ #
+
+async def warm_caches() -> int:
+    """Load hot posts and listings into Redis and this worker's local cache; returns the posts loaded"""
+    post_ids = []
+    for window in trending.WINDOWS:
+        post_ids += [post_id for post_id, _ in await trending.top(window, WARM_TRENDING)]
+    async with AsyncSessionLocal() as db:
+        newest = await db.execute(select(Post.id).order_by(Post.id.desc()).limit(WARM_POSTS))
+        post_ids += newest.scalars().all()
+        posts = await cache.get_posts(db, list(dict.fromkeys(post_ids)))
+    await categories.list_categories()
+    # get_posts only fills Redis; read_through would put each post in the local tier on its first hit
+    for post_id, post in posts.items():
+        post = cache.without_counts(post)
+        local_cache.set(cache.post_key(post_id), post, len(encode(post)))
+    return len(posts)
+
+
+# ------------ READINESS ------------ #
+
+async def _ping_database() -> bool:
+    try:
+        async with engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), READY_TIMEOUT)
+        return True
+    except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+        return False
+
+
+async def _ping_redis() -> bool:
+    try:
+        return await asyncio.wait_for(redis_client.ping(), READY_TIMEOUT)
+    except (RedisError, OSError, asyncio.TimeoutError):
+        return False
+
+
+async def readiness() -> tuple[bool, dict]:
+    """Whether this worker should get traffic, and the state of each dependency"""
+    if state["draining"]:
+        return False, {"status": "draining"}
+    database, redis = await asyncio.gather(_ping_database(), _ping_redis())
+    checks = {"database": "ok" if database else "unavailable", "redis": "ok" if redis else "unavailable"}
+    # Redis reads fail open, so a worker without Redis is degraded but can still serve
+    return database, {"status": "ready" if database else "unavailable", **checks}
+
+
+def _install_drain():
+    """Delay uvicorn's SIGTERM handler by DRAIN_SECONDS, failing readiness in the meantime"""
+    loop = asyncio.get_running_loop()
+    shutdown_handler = signal.getsignal(signal.SIGTERM)
+    if not callable(shutdown_handler):
+        return
+
+    def drain(sig, frame):
+        if state["draining"]:
+            # A second SIGTERM skips the rest of the delay
+            shutdown_handler(sig, frame)
+            return
+        state["draining"] = True
+        logger.info("draining for %.1fs before shutdown", DRAIN_SECONDS)
+        loop.call_soon_threadsafe(loop.call_later, DRAIN_SECONDS, shutdown_handler, sig, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+# ------------ LIFECYCLE ------------ #
+
+async def startup():
+    began = time.perf_counter()
+    await schema.prepare()
+    await open_pools()
+    warmed = 0
+    if WARM_CACHE:
+        try:
+            warmed = await warm_caches()
+        except (RedisError, OSError) as exc:
+            logger.warning("cache warm-up failed: %s", exc)
+    try:
+        await counters.check_flushing()
+    except RedisError as exc:
+        logger.warning("could not check the counter flush: %s", exc)
+    if DRAIN_SECONDS > 0:
+        _install_drain()
+    elapsed = time.perf_counter() - began
+    metrics.set_gauge("startup_seconds", elapsed)
+    logger.info("ready in %.2fs (schema %s, %d posts warmed)", elapsed, schema.MODE, warmed)
+
+
+async def shutdown():
+    state["draining"] = True
+    await close_pools()
@@ -0,0 +1,76 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+# Per-worker, in-memory tier in front of Redis. Entries are kept coherent across
+# workers by pub/sub invalidation; the TTL bounds staleness if a message is lost.
+
+MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "10000"))
+MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TTL = float(os.getenv("LOCAL_CACHE_TTL", "30"))
+
+MISSING = object()
+
+
+class LocalCache:
+    """Size-bounded LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expires_at, value, size in bytes)
+        self._entries: OrderedDict[str, tuple[float, Any, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or MISSING"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, size: int):
+        """Store a value; size is the approximate memory cost (e.g. the serialized length)"""
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+
+local_cache = LocalCache(MAX_ENTRIES, MAX_BYTES, TTL)
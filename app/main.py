@@ -1,13 +1,37 @@
+import asyncio
+
 from fastapi import FastAPI
-from app.models import Base
-from app.database import engine
+from app import lifecycle
+from app.admission import ENABLED as ADMISSION_ENABLED, AdmissionMiddleware
+from app.cache import listen_for_invalidations
+from app.database import ReadYourWritesMiddleware, engine, replica_engines
+from app.profiling import SAMPLE_RATE, ProfilingMiddleware, instrument_engines
 from app.routes import router as api_router
 
 app = FastAPI()
 
+background_tasks: list[asyncio.Task] = []
+
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        
+    # The invalidation listener starts first so nothing warmed into the local cache goes stale unnoticed
+    background_tasks.append(asyncio.create_task(listen_for_invalidations()))
+    await lifecycle.startup()
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await lifecycle.shutdown()
+
+if replica_engines:
+    app.add_middleware(ReadYourWritesMiddleware)
+if SAMPLE_RATE > 0:
+    instrument_engines([engine, *replica_engines])
+    app.add_middleware(ProfilingMiddleware)
+# Added last so it runs first: shed requests never reach the other middleware
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 app.include_router(api_router)
@@ -0,0 +1,60 @@
+from collections import defaultdict
+from typing import Callable, Iterable
+
+# Minimal in-process metrics registry rendered in the Prometheus text format.
+# Values are per worker process; scrape every worker or aggregate upstream.
+
+_types: dict[str, str] = {}
+_values: dict[str, dict[tuple, float]] = defaultdict(dict)
+_collectors: list[Callable[[], Iterable[tuple[str, str, dict, float]]]] = []
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a counter"""
+    _types.setdefault(name, "counter")
+    key = _label_key(labels)
+    series = _values[name]
+    series[key] = series.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Set a gauge to an absolute value"""
+    _types.setdefault(name, "gauge")
+    _values[name][_label_key(labels)] = value
+
+
+def get(name: str, **labels) -> float:
+    return _values.get(name, {}).get(_label_key(labels), 0)
+
+
+def register_collector(collector: Callable[[], Iterable[tuple[str, str, dict, float]]]):
+    """Register a callable yielding (name, type, labels, value) samples computed at scrape time"""
+    _collectors.append(collector)
+
+
+def _format(name: str, labels: tuple, value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{k}="{v}"' for k, v in labels)
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text exposition format"""
+    types = dict(_types)
+    values = {name: dict(series) for name, series in _values.items()}
+    for collector in _collectors:
+        for name, kind, labels, value in collector():
+            types.setdefault(name, kind)
+            values.setdefault(name, {})[_label_key(labels)] = value
+
+    lines = []
+    for name in sorted(values):
+        lines.append(f"# TYPE {name} {types[name]}")
+        for labels, value in sorted(values[name].items()):
+            lines.append(_format(name, labels, value))
+    return "\n".join(lines) + "\n"
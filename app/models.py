@@ -1,103 +1,230 @@
 from sqlalchemy import (
-    Column, Integer, String, ForeignKey, Text, DateTime, Table, UniqueConstraint
+    DDL, Column, Computed, Integer, String, ForeignKey, Text, DateTime, Table, Index, PrimaryKeyConstraint, event, text
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.asyncio import AsyncAttrs
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import declarative_base, deferred, relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+# Text search configuration for the generated search_vector columns (app.search)
+SEARCH_CONFIG = "english"
+
+
+def search_vector_column():
+    """Generated tsvector over content; deferred so ORM loads don't fetch it"""
+    return deferred(Column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}', coalesce(content, ''))", persisted=True)))
+
+
+# Comments and interactions are range-partitioned by month on timestamp (app.partitions). A
+# partition's unique indexes must include the partition key, so the primary key is (id, timestamp),
+# nothing can hold a foreign key to comments, and one like per (target, user) is enforced by the
+# unpartitioned *_keys tables instead.
+
+def partitioned(*indexes):
+    return (
+        PrimaryKeyConstraint("id", "timestamp"),
+        *indexes,
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+def partition_timestamp_column():
+    return Column(DateTime, nullable=False, default=datetime.utcnow, server_default=text("(now() AT TIME ZONE 'utc')"))
+
+
+def key_timestamp_column():
+    """The interaction row's timestamp, which names its partition"""
+    return Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 # Association table for Post <-> Category (Many-to-Many)
 post_category = Table(
     "post_category",
     Base.metadata,
-    Column("post_id", Integer, ForeignKey("posts.id"), primary_key=True),
-    Column("category_id", Integer, ForeignKey("categories.id"), primary_key=True)
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+    Column("category_id", Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True),
+    # The primary key leads with post_id; browsing a category needs the reverse
+    Index("ix_post_category_category_id_post_id", "category_id", "post_id"),
 )
 
 class User(AsyncAttrs, Base):
     __tablename__ = "users"
 
+    # Child rows are removed by ON DELETE CASCADE in the schema (see app.deletion);
+    # passive_deletes keeps the ORM from loading them just to delete them
+
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String())
     is_verified = Column(Integer, default=0)
-
-    posts = relationship("Post", back_populates="author", cascade="all, delete")
-    comments = relationship("Comment", back_populates="author", cascade="all, delete")
-    post_likes = relationship("PostLike", back_populates="user", cascade="all, delete")
-    post_saves = relationship("PostSave", back_populates="user", cascade="all, delete")
-    comment_likes = relationship("CommentLike", back_populates="user", cascade="all, delete")
+    # Denormalized follow counters, maintained by app.counters
+    follower_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    posts = relationship("Post", back_populates="author", cascade="all, delete", passive_deletes=True)
+    comments = relationship("Comment", back_populates="author", cascade="all, delete", passive_deletes=True)
+    post_likes = relationship("PostLike", back_populates="user", cascade="all, delete", passive_deletes=True)
+    post_saves = relationship("PostSave", back_populates="user", cascade="all, delete", passive_deletes=True)
+    comment_likes = relationship("CommentLike", back_populates="user", cascade="all, delete", passive_deletes=True)
+    following = relationship("Follow", foreign_keys="Follow.follower_id", back_populates="follower", cascade="all, delete", passive_deletes=True)
+    followers = relationship("Follow", foreign_keys="Follow.followee_id", back_populates="followee", cascade="all, delete", passive_deletes=True)
 
 class Post(AsyncAttrs, Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_user_timestamp_id", "user_id", "timestamp", "id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    # Denormalized engagement counters, maintained by app.counters
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    save_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    search_vector = search_vector_column()
 
     author = relationship("User", back_populates="posts")
-    comments = relationship("Comment", back_populates="post", cascade="all, delete")
-    likes = relationship("PostLike", back_populates="post", cascade="all, delete")
-    saves = relationship("PostSave", back_populates="post", cascade="all, delete")
-    categories = relationship("Category", secondary=post_category, back_populates="posts", lazy="selectin")
+    comments = relationship("Comment", back_populates="post", cascade="all, delete", passive_deletes=True)
+    likes = relationship("PostLike", back_populates="post", cascade="all, delete", passive_deletes=True)
+    saves = relationship("PostSave", back_populates="post", cascade="all, delete", passive_deletes=True)
+    categories = relationship("Category", secondary=post_category, back_populates="posts")
 
 class Comment(AsyncAttrs, Base):
     __tablename__ = "comments"
-
-    id = Column(Integer, primary_key=True, index=True)
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    __table_args__ = partitioned(
+        Index("ix_comments_post_timestamp_id", "post_id", "timestamp", "id"),
+        # Top-N replies per parent for the thread loader (app.threads)
+        Index("ix_comments_reply_to_timestamp_id", "reply_to", "timestamp", "id"),
+        Index("ix_comments_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+    id = Column(Integer, autoincrement=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
     content = Column(Text)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    reply_to = Column(Integer, ForeignKey("comments.id"), nullable=True)
-
-    post = relationship("Post", back_populates="comments", lazy="selectin")
-    author = relationship("User", back_populates="comments", lazy="selectin")
-    replies = relationship("Comment", back_populates="parent", cascade="all, delete", lazy="selectin")
-    parent = relationship("Comment", remote_side=[id], back_populates="replies", lazy="selectin")
-    likes = relationship("CommentLike", back_populates="comment", cascade="all, delete", lazy="selectin")
+    timestamp = partition_timestamp_column()
+    # No foreign key (see above): app.deletion removes reply subtrees itself
+    reply_to = Column(Integer, nullable=True)
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
+    search_vector = search_vector_column()
+
+    # Loaded explicitly where needed; threads are read with app.threads
+    post = relationship("Post", back_populates="comments")
+    author = relationship("User", back_populates="comments")
+    replies = relationship(
+        "Comment", primaryjoin="Comment.id == foreign(Comment.reply_to)", back_populates="parent", viewonly=True
+    )
+    parent = relationship(
+        "Comment", primaryjoin="Comment.id == foreign(Comment.reply_to)", remote_side=[id],
+        back_populates="replies", viewonly=True,
+    )
+    likes = relationship(
+        "CommentLike", primaryjoin="Comment.id == foreign(CommentLike.comment_id)", back_populates="comment",
+        viewonly=True,
+    )
+
+    # Comment ids are unique on their own; the ORM identifies comments by id alone
+    __mapper_args__ = {"primary_key": [id]}
 
 class CommentLike(AsyncAttrs, Base):
     __tablename__ = "comment_likes"
-    __table_args__ = (UniqueConstraint("comment_id", "user_id", name="unique_comment_like"),)
+    __table_args__ = partitioned(Index("ix_comment_likes_comment_timestamp_id", "comment_id", "timestamp", "id"))
 
-    id = Column(Integer, primary_key=True)
-    comment_id = Column(Integer, ForeignKey("comments.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    id = Column(Integer, autoincrement=True)
+    comment_id = Column(Integer)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    timestamp = partition_timestamp_column()
 
-    comment = relationship("Comment", back_populates="likes")
+    comment = relationship(
+        "Comment", primaryjoin="Comment.id == foreign(CommentLike.comment_id)", back_populates="likes", viewonly=True
+    )
     user = relationship("User", back_populates="comment_likes")
 
+    __mapper_args__ = {"primary_key": [id]}
+
+class CommentLikeKey(AsyncAttrs, Base):
+    __tablename__ = "comment_like_keys"
+    __table_args__ = (PrimaryKeyConstraint("comment_id", "user_id", name="unique_comment_like"),)
+
+    comment_id = Column(Integer)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    timestamp = key_timestamp_column()
+
 class PostLike(AsyncAttrs, Base):
     __tablename__ = "post_likes"
-    __table_args__ = (UniqueConstraint("post_id", "user_id", name="unique_post_like"),)
+    __table_args__ = partitioned(Index("ix_post_likes_post_timestamp_id", "post_id", "timestamp", "id"))
 
-    id = Column(Integer, primary_key=True)
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    id = Column(Integer, autoincrement=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    timestamp = partition_timestamp_column()
 
     post = relationship("Post", back_populates="likes")
     user = relationship("User", back_populates="post_likes")
 
+    __mapper_args__ = {"primary_key": [id]}
+
+class PostLikeKey(AsyncAttrs, Base):
+    __tablename__ = "post_like_keys"
+    __table_args__ = (PrimaryKeyConstraint("post_id", "user_id", name="unique_post_like"),)
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    timestamp = key_timestamp_column()
+
 class PostSave(AsyncAttrs, Base):
     __tablename__ = "post_saves"
-    __table_args__ = (UniqueConstraint("post_id", "user_id", name="unique_post_save"),)
+    __table_args__ = partitioned(Index("ix_post_saves_post_timestamp_id", "post_id", "timestamp", "id"))
 
-    id = Column(Integer, primary_key=True)
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    id = Column(Integer, autoincrement=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    timestamp = partition_timestamp_column()
 
     post = relationship("Post", back_populates="saves")
     user = relationship("User", back_populates="post_saves")
 
+    __mapper_args__ = {"primary_key": [id]}
+
+class PostSaveKey(AsyncAttrs, Base):
+    __tablename__ = "post_save_keys"
+    __table_args__ = (PrimaryKeyConstraint("post_id", "user_id", name="unique_post_save"),)
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    timestamp = key_timestamp_column()
+
 class Category(AsyncAttrs, Base):
     __tablename__ = "categories"
 
     id = Column(Integer, primary_key=True)
     title = Column(String(15), unique=True)
 
-    posts = relationship("Post", secondary=post_category, back_populates="categories", lazy="selectin")
+    posts = relationship("Post", secondary=post_category, back_populates="categories")
+
+class Follow(AsyncAttrs, Base):
+    __tablename__ = "follows"
+    # The primary key answers "does X follow Y"; the two indexes page through
+    # a user's followers and followees newest first (and serve feed fan-out)
+    __table_args__ = (
+        Index("ix_follows_followee_timestamp", "followee_id", "timestamp", "follower_id"),
+        Index("ix_follows_follower_timestamp", "follower_id", "timestamp", "followee_id"),
+    )
+
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=text("(now() AT TIME ZONE 'utc')"))
+
+    follower = relationship("User", foreign_keys=[follower_id], back_populates="following")
+    followee = relationship("User", foreign_keys=[followee_id], back_populates="followers")
+
+
+# create_all (dev databases without Alembic) gets a DEFAULT partition so inserts work before
+# app.partitions has created any monthly ones
+for _table in (Comment.__table__, CommentLike.__table__, PostLike.__table__, PostSave.__table__):
+    event.listen(_table, "after_create", DDL(f"CREATE TABLE {_table.name}_default PARTITION OF {_table.name} DEFAULT"))
@@ -0,0 +1,81 @@
+import base64
+import binascii
+import os
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+
+class PageParams:
+    """Query parameters shared by every paginated endpoint"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def encode_cursor(timestamp: datetime, id: int) -> str:
+    """Opaque cursor for the (timestamp, id) position of the last row on a page"""
+    raw = f"{timestamp.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    timestamp_column,
+    id_column,
+    page: PageParams,
+    descending: bool = True,
+) -> tuple[list[Any], Optional[str]]:
+    """Run one keyset page of query ordered by (timestamp, id).
+
+    Rows must expose `timestamp` and `id` attributes (ORM objects or labelled columns).
+    Returns the rows and the cursor of the next page, or None on the last page.
+    """
+    if page.cursor:
+        position = decode_cursor(page.cursor)
+        key = tuple_(timestamp_column, id_column)
+        query = query.where(key < position if descending else key > position)
+        # Implied by the row comparison, but only a plain bound lets Postgres prune partitions
+        query = query.where(timestamp_column <= position[0] if descending else timestamp_column >= position[0])
+
+    if descending:
+        query = query.order_by(timestamp_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(timestamp_column, id_column)
+
+    # Fetch one extra row to learn whether another page exists
+    result = await db.execute(query.limit(page.limit + 1))
+    rows = result.scalars().all() if _selects_entity(query) else result.all()
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, next_cursor
+
+
+def _selects_entity(query: Select) -> bool:
+    """True for select(Model) (return ORM objects), False for column selects (return rows)"""
+    descriptions = query.column_descriptions
+    return len(descriptions) == 1 and isinstance(descriptions[0]["expr"], type)
@@ -0,0 +1,240 @@
+"""
+Monthly range partitions for comments, post_likes, post_saves and comment_likes
+
+    python -m app.partitions status
+    python -m app.partitions ensure --months-ahead 6
+    python -m app.partitions archive --before 2025-01
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Optional
+
+import asyncpg
+
+from app import metrics
+from app.importer import asyncpg_dsn
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("comments", "comment_likes", "post_likes", "post_saves")
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Months of partitions to keep attached; 0 keeps everything
+RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive")
+MAINTAIN_INTERVAL = int(os.getenv("PARTITION_MAINTAIN_INTERVAL", "86400"))
+# DETACH and CREATE ... PARTITION OF need a brief exclusive lock on the parent; give up rather than queue
+# every query on the table behind it, and retry later
+LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+# Tries at creating a partition before leaving it to the next run, this many seconds apart
+CREATE_ATTEMPTS = 3
+CREATE_RETRY_DELAY = 10
+
+_BOUND = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})[^']*'\) TO \('(\d{4}-\d{2}-\d{2})[^']*'\)")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def default_partition(table: str) -> str:
+    return f"{table}_default"
+
+
+async def connect() -> asyncpg.Connection:
+    return await asyncpg.connect(asyncpg_dsn(os.environ["DATABASE_URL"]))
+
+
+# ------------ INSPECTION ------------ #
+
+async def partitions(conn: asyncpg.Connection, table: str) -> list[tuple[str, Optional[date], Optional[date]]]:
+    """(name, first day, first day after) of each attached partition, oldest first; the default has no bounds"""
+    rows = await conn.fetch("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+    """, table)
+    found = []
+    for row in rows:
+        match = _BOUND.search(row["bound"])
+        lower, upper = (date.fromisoformat(match[1]), date.fromisoformat(match[2])) if match else (None, None)
+        found.append((row["relname"], lower, upper))
+    return sorted(found, key=lambda partition: partition[1] or date.max)
+
+
+async def _detached(conn: asyncpg.Connection, table: str) -> list[str]:
+    """Month partitions left detached by an archive run that stopped before dropping them"""
+    return [row["relname"] for row in await conn.fetch("""
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND NOT relispartition AND relname ~ ('^' || $1 || '_p[0-9]{4}_[0-9]{2}$')
+    """, table)]
+
+
+async def _columns(conn: asyncpg.Connection, table: str) -> str:
+    """The table's insertable (non-generated) columns"""
+    rows = await conn.fetch("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = $1 AND is_generated = 'NEVER' ORDER BY ordinal_position
+    """, table)
+    return ", ".join(f'"{row["column_name"]}"' for row in rows)
+
+
+# ------------ MAINTENANCE ------------ #
+
+async def _create(conn: asyncpg.Connection, table: str, month: date):
+    for attempt in range(1, CREATE_ATTEMPTS + 1):
+        try:
+            return await _create_once(conn, table, month)
+        except asyncpg.LockNotAvailableError:
+            if attempt == CREATE_ATTEMPTS:
+                raise
+            logger.warning("creating %s timed out waiting for a lock; retrying", partition_name(table, month))
+            await asyncio.sleep(CREATE_RETRY_DELAY)
+
+
+async def _create_once(conn: asyncpg.Connection, table: str, month: date):
+    lower, upper = month, add_months(month, 1)
+    name = partition_name(table, month)
+    async with conn.transaction():
+        await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        # Attaching the range scans the default partition and fails on any row that belongs to it,
+        # so those rows are parked in a temp table and reinserted through the parent
+        columns = await _columns(conn, table)
+        await conn.execute(f"CREATE TEMP TABLE _moving ON COMMIT DROP AS SELECT {columns} FROM {table} LIMIT 0")
+        moved = await conn.execute(f"""
+            WITH gone AS (
+                DELETE FROM {default_partition(table)} WHERE timestamp >= $1 AND timestamp < $2 RETURNING {columns}
+            )
+            INSERT INTO _moving SELECT * FROM gone
+        """, lower, upper)
+        await conn.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        await conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM _moving")
+    rows = int(moved.split()[-1])
+    logger.info("created %s (moved %d rows from the default partition)", name, rows)
+    metrics.inc("partitions_created_total", table=table)
+
+
+async def ensure(
+    conn: asyncpg.Connection, months_ahead: int = MONTHS_AHEAD, today: Optional[date] = None
+) -> list[str]:
+    """Create any missing partitions for this month and the next months_ahead; returns their names"""
+    this_month = (today or datetime.utcnow().date()).replace(day=1)
+    created = []
+    for table in TABLES:
+        existing = {lower for _, lower, _ in await partitions(conn, table)}
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+            if month not in existing:
+                await _create(conn, table, month)
+                created.append(partition_name(table, month))
+    return created
+
+
+async def _archive_table(conn: asyncpg.Connection, name: str) -> str:
+    """COPY a detached partition to a gzipped CSV, check the row count and drop it"""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"{name}.csv.gz")
+    partial = f"{path}.partial"
+    expected = await conn.fetchval(f"SELECT count(*) FROM {name}")
+    with open(partial, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            async def write(chunk: bytes):
+                out.write(chunk)
+
+            status = await conn.copy_from_table(name, output=write, format="csv", header=True)
+        # The archive must be on disk before the table is dropped
+        raw.flush()
+        os.fsync(raw.fileno())
+    copied = int(status.split()[-1])
+    if copied != expected:
+        raise RuntimeError(f"{name}: copied {copied} of {expected} rows; keeping the table")
+    os.replace(partial, path)
+    await conn.execute(f"DROP TABLE {name}")
+    logger.info("archived %s (%d rows) to %s", name, copied, path)
+    metrics.inc("partitions_archived_total")
+    return path
+
+
+async def archive(conn: asyncpg.Connection, before: date) -> list[str]:
+    """Detach, archive and drop every month partition that ends on or before `before`; returns the files"""
+    paths = []
+    for table in TABLES:
+        for name, _, upper in await partitions(conn, table):
+            if upper is None or upper > before:
+                continue
+            await conn.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+            try:
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            finally:
+                await conn.execute("RESET lock_timeout")
+        for name in await _detached(conn, table):
+            paths.append(await _archive_table(conn, name))
+    return paths
+
+
+async def maintain():
+    """Create upcoming partitions and archive expired ones; run every MAINTAIN_INTERVAL by app.worker"""
+    conn = await connect()
+    try:
+        await ensure(conn)
+        if RETENTION_MONTHS:
+            this_month = datetime.utcnow().date().replace(day=1)
+            await archive(conn, add_months(this_month, -RETENTION_MONTHS))
+    finally:
+        await conn.close()
+
+
+async def status(conn: asyncpg.Connection):
+    for table in TABLES:
+        print(table)
+        for name, lower, _ in await partitions(conn, table):
+            row = await conn.fetchrow(
+                "SELECT greatest(reltuples, 0)::bigint AS rows, pg_total_relation_size(oid) AS bytes"
+                " FROM pg_class WHERE oid = $1::regclass",
+                name,
+            )
+            print(f"  {name:<28} {lower.isoformat() if lower else 'default':<10} "
+                  f"~{row['rows']:>10} rows {row['bytes'] / 1024 / 1024:>9.1f} MB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "ensure", "archive"])
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    parser.add_argument("--before", help="archive partitions ending on or before this month (YYYY-MM)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    conn = await connect()
+    try:
+        if args.command == "status":
+            await status(conn)
+        elif args.command == "ensure":
+            print(f"created {len(await ensure(conn, args.months_ahead))} partitions")
+        else:
+            if args.before:
+                before = date.fromisoformat(f"{args.before}-01")
+            elif RETENTION_MONTHS:
+                before = add_months(datetime.utcnow().date().replace(day=1), -RETENTION_MONTHS)
+            else:
+                parser.error("--before is required when PARTITION_RETENTION_MONTHS is not set")
+            for path in await archive(conn, before):
+                print(path)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
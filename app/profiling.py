@@ -0,0 +1,160 @@
+"""Per-request profiling: DB queries, Redis round trips and serialization time"""
+import functools
+import logging
+import os
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests profiled; 0 disables profiling entirely
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("PROFILE_N_PLUS_ONE_THRESHOLD", "5"))
+
+
+class RequestProfile:
+    __slots__ = (
+        "start", "queries", "db_seconds", "redis_calls", "redis_seconds",
+        "endpoint_done", "serialize_seconds", "statements",
+    )
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+        self.endpoint_done: Optional[float] = None
+        self.serialize_seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def n_plus_one_suspects(self) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self) -> str:
+        total = time.perf_counter() - self.start
+        return ", ".join([
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries"',
+            f'redis;dur={self.redis_seconds * 1000:.2f};desc="{self.redis_calls} calls"',
+            f"serialize;dur={self.serialize_seconds * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def record_redis(seconds: float, calls: int = 1):
+    profile = _current.get()
+    if profile is not None:
+        profile.redis_calls += calls
+        profile.redis_seconds += seconds
+
+
+# ------------ SQLALCHEMY ------------ #
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None or not conn.info.get("profile_start"):
+        return
+    profile.db_seconds += time.perf_counter() - conn.info["profile_start"].pop()
+    profile.queries += 1
+    # Bound parameters are placeholders, so the text is the statement's shape
+    profile.statements[statement] += 1
+
+
+def instrument_engines(engines: list):
+    for engine in engines:
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ------------ SERIALIZATION ------------ #
+
+class ProfiledRoute(APIRoute):
+    """Marks when the endpoint returns, so the response render can time serialization"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            profile = _current.get()
+            if profile is not None:
+                profile.endpoint_done = time.perf_counter()
+            return result
+
+        super().__init__(path, timed_endpoint, **kwargs)
+
+
+class ProfiledJSONResponse(JSONResponse):
+    """JSONResponse that charges response-model validation and encoding to the profile"""
+
+    def render(self, content) -> bytes:
+        body = super().render(content)
+        profile = _current.get()
+        if profile is not None and profile.endpoint_done is not None:
+            profile.serialize_seconds += time.perf_counter() - profile.endpoint_done
+        return body
+
+
+# ------------ MIDDLEWARE ------------ #
+
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate: float = SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self._record(scope, profile)
+
+    def _record(self, scope, profile: RequestProfile):
+        route = scope.get("route")
+        labels = {"route": f"{scope['method']} {route.path if route else 'unmatched'}"}
+        metrics.inc("profiled_requests_total", **labels)
+        metrics.inc("profiled_request_seconds_total", time.perf_counter() - profile.start, **labels)
+        metrics.inc("profiled_db_queries_total", profile.queries, **labels)
+        metrics.inc("profiled_db_seconds_total", profile.db_seconds, **labels)
+        metrics.inc("profiled_redis_calls_total", profile.redis_calls, **labels)
+        metrics.inc("profiled_redis_seconds_total", profile.redis_seconds, **labels)
+        metrics.inc("profiled_serialize_seconds_total", profile.serialize_seconds, **labels)
+        for statement, count in profile.n_plus_one_suspects():
+            metrics.inc("n_plus_one_suspects_total", **labels)
+            logger.warning(
+                "N+1 suspect on %s: statement ran %d times: %s",
+                labels["route"], count, " ".join(statement.split())[:300],
+            )
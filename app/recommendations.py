@@ -0,0 +1,49 @@
+"""Per-user post recommendations, precomputed by app.recommender"""
+import os
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache, metrics, trending
+from app.codec import encode
+from app.redis_cache import decode_or_none, redis_binary
+
+TOP_K = int(os.getenv("RECOMMEND_TOP_K", "100"))
+# Seconds between builds by app.worker; 0 disables the periodic job
+INTERVAL = int(os.getenv("RECOMMEND_INTERVAL", "3600"))
+# Lists outlive a couple of missed builds, then fall back to trending
+TTL = int(os.getenv("RECOMMEND_TTL", str(max(INTERVAL, 3600) * 3)))
+
+
+def user_key(user_id: int) -> str:
+    return f"recs:user:{user_id}"
+
+
+def encode_list(generated_at: float, post_ids: list[int], scores: list[float]) -> bytes:
+    return encode({"generated_at": generated_at, "items": [[post_id, score] for post_id, score in zip(post_ids, scores)]})
+
+
+async def get_recommendations(db: AsyncSession, user_id: int, limit: int) -> dict:
+    """Up to `limit` recommended posts with scores, best first"""
+    try:
+        stored = decode_or_none(await redis_binary.get(user_key(user_id)))
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="recs")
+        stored = None
+
+    source: str = "personalized"
+    generated_at: Optional[float] = None
+    if stored:
+        metrics.inc("cache_hits_total", entity="recs")
+        generated_at = stored["generated_at"]
+        # Over-fetch a little so deleted posts don't leave the page short
+        ranked = [(post_id, score) for post_id, score in stored["items"][:limit + limit // 4]]
+    else:
+        metrics.inc("cache_misses_total", entity="recs")
+        source = "trending"
+        ranked = await trending.top("24h", limit)
+
+    posts = await cache.get_posts(db, [post_id for post_id, _ in ranked])
+    items = [{**posts[post_id], "score": score} for post_id, score in ranked if post_id in posts][:limit]
+    return {"source": source, "generated_at": generated_at, "items": items}
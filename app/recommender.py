@@ -0,0 +1,305 @@
+"""
+Batch builder for app.recommendations, run as the build_recommendations job or by hand
+
+    python -m app.recommender --days 90
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import time
+from typing import Iterator
+
+import asyncpg
+import numpy as np
+from scipy import sparse
+
+from app import metrics
+from app.importer import asyncpg_dsn
+from app.recommendations import TOP_K, TTL, encode_list, user_key
+from app.redis_cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = int(os.getenv("RECOMMEND_WINDOW_DAYS", "90"))
+CATEGORY_WEIGHT = float(os.getenv("RECOMMEND_CATEGORY_WEIGHT", "0.3"))
+MAX_USER_ITEMS = int(os.getenv("RECOMMEND_MAX_USER_ITEMS", "500"))
+NEIGHBORS = int(os.getenv("RECOMMEND_NEIGHBORS", "50"))
+READ_CHUNK = int(os.getenv("RECOMMEND_READ_CHUNK_BYTES", str(8 * 1024 * 1024)))
+BLOCK_NNZ = int(os.getenv("RECOMMEND_BLOCK_NNZ", "2000000"))
+# Pairs seen together fewer times than this (in weighted interactions) are noise
+MIN_COOCCURRENCE = 2
+CATEGORY_TOP_ITEMS = 200
+WRITE_BATCH = 1000
+
+# table -> weight of one interaction
+INTERACTIONS = {"post_likes": 1.0, "post_saves": 2.0}
+
+
+# ------------ READING ------------ #
+
+# One row of binary COPY output for two non-null int4 columns: field count, then (length, value) per field
+_COPY_ROW = np.dtype([("fields", ">i2"), ("a_len", ">i4"), ("a", ">i4"), ("b_len", ">i4"), ("b", ">i4")])
+# Signature, flags and header extension length, then the trailer
+_COPY_HEADER, _COPY_TRAILER = 19, 2
+
+
+async def _copy_pairs(conn: asyncpg.Connection, sql: str, *args) -> list[np.ndarray]:
+    """A query's two non-null integer columns as (n, 2) int32 arrays, one per READ_CHUNK bytes of binary COPY
+    output. Rows have a fixed width, so numpy reads them in place and no Python object is built per value"""
+    chunks, pending = [], bytearray()
+    header = True
+
+    def parse(data: bytes):
+        rows = np.frombuffer(data, dtype=_COPY_ROW)
+        if len(rows):
+            chunks.append(np.column_stack((rows["a"], rows["b"])).astype(np.int32))
+
+    async def receive(data: bytes):
+        nonlocal header
+        pending.extend(data)
+        if header and len(pending) >= _COPY_HEADER:
+            del pending[:_COPY_HEADER]
+            header = False
+        if not header and len(pending) >= READ_CHUNK:
+            end = len(pending) - len(pending) % _COPY_ROW.itemsize
+            parse(bytes(pending[:end]))
+            del pending[:end]
+
+    query = f"SELECT a::int4, b::int4 FROM ({sql}) AS pairs(a, b)"
+    await conn.copy_from_query(query, *args, output=receive, format="binary")
+    parse(bytes(pending[:-_COPY_TRAILER]))
+    return chunks
+
+
+async def _shape(conn: asyncpg.Connection) -> tuple[int, int, int]:
+    row = await conn.fetchrow(
+        "SELECT (SELECT max(id) FROM users), (SELECT max(id) FROM posts), (SELECT max(id) FROM categories)"
+    )
+    return tuple((value or 0) + 1 for value in row)
+
+
+def _matrix(chunks: list[np.ndarray], weights: list[np.ndarray], shape: tuple[int, int]) -> sparse.csr_matrix:
+    """One CSR matrix from (row, col) chunks; duplicate pairs are summed"""
+    if not chunks:
+        return sparse.csr_matrix(shape, dtype=np.float32)
+    pairs = np.concatenate(chunks)
+    return sparse.csr_matrix((np.concatenate(weights), (pairs[:, 0], pairs[:, 1])), shape=shape)
+
+
+async def load_interactions(
+    conn: asyncpg.Connection, users: int, posts: int, days: int
+) -> tuple[sparse.csr_matrix, int]:
+    """The weighted user x post matrix and the number of interactions read.
+
+    Every pair read is held until the matrix is built: about 40 bytes per interaction at the peak, 12 in the
+    chunks and the rest while _matrix concatenates them and scipy sums them into CSR (9 bytes per pair).
+    """
+    chunks, weights = [], []
+    since = " AND timestamp >= (now() AT TIME ZONE 'utc') - make_interval(days => $1)" if days else ""
+    for table, weight in INTERACTIONS.items():
+        sql = f"SELECT user_id, post_id FROM {table} WHERE user_id IS NOT NULL AND post_id IS NOT NULL{since}"
+        table_chunks = await _copy_pairs(conn, sql, *([days] if days else []))
+        chunks += table_chunks
+        weights += [np.full(len(chunk), weight, dtype=np.float32) for chunk in table_chunks]
+    return _matrix(chunks, weights, (users, posts)), sum(len(chunk) for chunk in chunks)
+
+
+async def load_categories(conn: asyncpg.Connection, posts: int, categories: int) -> sparse.csr_matrix:
+    chunks = await _copy_pairs(conn, "SELECT post_id, category_id FROM post_category")
+    return _matrix(chunks, [np.ones(len(chunk), dtype=np.float32) for chunk in chunks], (posts, categories))
+
+
+# ------------ MATRIX HELPERS ------------ #
+
+def keep_newest(matrix: sparse.csr_matrix, limit: int) -> sparse.csr_matrix:
+    """Keep each row's `limit` highest column indices (post ids grow over time, so the newest posts)"""
+    matrix.sort_indices()
+    counts = np.diff(matrix.indptr)
+    if not len(counts) or counts.max() <= limit:
+        return matrix
+    row_of = np.repeat(np.arange(matrix.shape[0]), counts)
+    keep = matrix.indptr[row_of + 1] - np.arange(matrix.nnz) <= limit
+    indptr = np.concatenate([[0], np.cumsum(np.minimum(counts, limit))])
+    return sparse.csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+
+def row_starts(rows: np.ndarray) -> np.ndarray:
+    """For each entry of a sorted row array, the index where its row begins"""
+    firsts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    return np.repeat(firsts, np.diff(np.r_[firsts, len(rows)]))
+
+
+def top_per_row(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, k: int):
+    """The k largest (positive) values of each row of a COO triple, sorted by row then value descending"""
+    if not len(rows):
+        return rows, cols, values
+    # One float sort key, row + an offset in [0, 0.5) that falls as the value grows, is several
+    # times faster than lexsort. float64 still separates values ~1e-9 apart at a million rows
+    order = np.argsort(rows + (1 - values / values.max()) / 2.0001)
+    rows, cols, values = rows[order], cols[order], values[order]
+    keep = np.arange(len(rows)) - row_starts(rows) < k
+    return rows[keep], cols[keep], values[keep]
+
+
+def blocks(ids: np.ndarray, costs: np.ndarray, budget: int) -> Iterator[np.ndarray]:
+    """Split ids into consecutive runs whose summed cost stays within budget (at least one id each)"""
+    total = np.cumsum(costs)
+    start = 0
+    while start < len(ids):
+        base = total[start - 1] if start else 0
+        end = max(int(np.searchsorted(total, base + budget, side="right")), start + 1)
+        yield ids[start:end]
+        start = end
+
+
+# ------------ MODEL ------------ #
+
+def item_neighbors(interactions: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Post x post cosine similarity, NEIGHBORS entries per post at most"""
+    posts = interactions.shape[1]
+    by_item = interactions.T.tocsr()
+    norms = np.sqrt(np.asarray(interactions.multiply(interactions).sum(axis=0)).ravel())
+    active = np.flatnonzero(norms)
+    # Upper bound on the entries row i of X^T X can have: the items of every user of i
+    binary = by_item.copy()
+    binary.data[:] = 1
+    costs = binary @ np.diff(interactions.indptr).astype(np.float64)
+
+    rows, cols, values = [], [], []
+    for block in blocks(active, costs[active], BLOCK_NNZ):
+        counts = (by_item[block] @ interactions).tocoo()
+        item = block[counts.row]
+        keep = (counts.col != item) & (counts.data >= MIN_COOCCURRENCE)
+        similarity = counts.data[keep] / (norms[item[keep]] * norms[counts.col[keep]])
+        row, col, value = top_per_row(item[keep], counts.col[keep], similarity.astype(np.float32), NEIGHBORS)
+        rows.append(row)
+        cols.append(col)
+        values.append(value)
+    if not rows:
+        return sparse.csr_matrix((posts, posts), dtype=np.float32)
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(posts, posts)
+    )
+
+
+def category_candidates(interactions: sparse.csr_matrix, post_categories: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Category x post matrix of each category's CATEGORY_TOP_ITEMS most engaged posts, scaled to 0..1"""
+    popularity = np.asarray(interactions.sum(axis=0)).ravel()
+    links = post_categories.tocoo()
+    engaged = popularity[links.row] > 0
+    category, post, value = top_per_row(
+        links.col[engaged], links.row[engaged], popularity[links.row[engaged]], CATEGORY_TOP_ITEMS
+    )
+    if len(category):
+        # Rows come out sorted with the best post first, so each row's first value is its maximum
+        value = value / value[row_starts(category)]
+    return sparse.csr_matrix(
+        (value.astype(np.float32), (category, post)), shape=(post_categories.shape[1], post_categories.shape[0])
+    )
+
+
+def normalize_rows(matrix: sparse.csr_matrix, by: str) -> sparse.csr_matrix:
+    if by == "sum":
+        scale = np.asarray(matrix.sum(axis=1)).ravel()
+    else:
+        scale = matrix.max(axis=1).toarray().ravel()
+    inverse = np.divide(1.0, scale, out=np.zeros_like(scale, dtype=np.float64), where=scale > 0)
+    return sparse.diags(inverse.astype(np.float32)) @ matrix
+
+
+def score_users(
+    interactions: sparse.csr_matrix,
+    neighbors: sparse.csr_matrix,
+    affinity: sparse.csr_matrix,
+    candidates: sparse.csr_matrix,
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """(user ids, post ids, scores) of each user block's top TOP_K unseen posts, grouped by user"""
+    users = np.flatnonzero(np.diff(interactions.indptr))
+    binary = interactions.copy()
+    binary.data[:] = 1
+    costs = binary @ np.diff(neighbors.indptr).astype(np.float64)
+    costs += (affinity > 0).sum(axis=1).A.ravel() * CATEGORY_TOP_ITEMS
+
+    for block in blocks(users, costs[users], BLOCK_NNZ):
+        engaged = interactions[block]
+        scores = normalize_rows(engaged @ neighbors, "max") + CATEGORY_WEIGHT * (affinity[block] @ candidates)
+        scores = (scores - scores.multiply(engaged > 0)).tocoo()
+        scores.eliminate_zeros()
+        row, post, value = top_per_row(scores.row, scores.col, scores.data, TOP_K)
+        yield block[row], post, value
+
+
+# ------------ BUILD ------------ #
+
+async def _write(user_ids: np.ndarray, post_ids: np.ndarray, scores: np.ndarray, generated_at: float) -> int:
+    if not len(user_ids):
+        return 0
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(user_ids)) + 1, [len(user_ids)]])
+    written = 0
+    for batch in range(0, len(starts) - 1, WRITE_BATCH):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for start, end in zip(starts[batch:batch + WRITE_BATCH], starts[batch + 1:batch + WRITE_BATCH + 1]):
+                rounded = np.round(scores[start:end].astype(np.float64), 4)
+                value = encode_list(generated_at, post_ids[start:end].tolist(), rounded.tolist())
+                pipe.set(user_key(int(user_ids[start])), value, ex=TTL)
+                written += 1
+            await pipe.execute()
+    return written
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def build(days: int = WINDOW_DAYS) -> dict:
+    """Recompute every user's recommendations; returns a summary of the run"""
+    started = time.perf_counter()
+    generated_at = time.time()
+    conn = await asyncpg.connect(asyncpg_dsn(os.environ["DATABASE_URL"]))
+    try:
+        users, posts, categories = await _shape(conn)
+        interactions, read = await load_interactions(conn, users, posts, days)
+        post_categories = await load_categories(conn, posts, categories)
+    finally:
+        await conn.close()
+    interactions = await asyncio.to_thread(keep_newest, interactions, MAX_USER_ITEMS)
+    loaded = time.perf_counter()
+
+    # The numeric work runs in a thread so the worker's lease heartbeat keeps going
+    neighbors = await asyncio.to_thread(item_neighbors, interactions)
+    affinity = await asyncio.to_thread(lambda: normalize_rows(interactions @ post_categories, "sum"))
+    candidates = await asyncio.to_thread(category_candidates, interactions, post_categories)
+
+    written = 0
+    blocks_done = score_users(interactions, neighbors, affinity, candidates)
+    while (block := await asyncio.to_thread(next, blocks_done, None)) is not None:
+        written += await _write(*block, generated_at)
+
+    summary = {
+        "interactions": read,
+        "pairs": int(interactions.nnz),
+        "neighbor_entries": int(neighbors.nnz),
+        "users_written": written,
+        "load_seconds": round(loaded - started, 2),
+        "seconds": round(time.perf_counter() - started, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+    metrics.set_gauge("recommender_last_run_seconds", summary["seconds"])
+    metrics.set_gauge("recommender_peak_rss_bytes", summary["peak_rss_mb"] * 1024 * 1024)
+    logger.info("recommendations built: %s", summary)
+    return summary
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=WINDOW_DAYS, help="interaction window; 0 reads everything")
+    args = parser.parse_args()
+    print(json.dumps(await build(args.days)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,48 +1,156 @@
+import os
+import time
 import redis.asyncio as redis
-from typing import Any, Optional
-import json
+from typing import Any, Optional, Union
 from datetime import datetime
+from dotenv import load_dotenv
+
+from app import profiling
+from app.codec import CodecError, decode, encode
+from app.local_cache import local_cache
+
+# Load environment variables from .env
+load_dotenv()
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+
+
+class ProfiledPipeline(redis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        if profiling.current() is None:
+            return await super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            profiling.record_redis(time.perf_counter() - start)
+
+
+class ProfiledRedis(redis.Redis):
+    """Redis client that reports round trips to app.profiling while a request is sampled"""
+
+    async def execute_command(self, *args, **options):
+        if profiling.current() is None:
+            return await super().execute_command(*args, **options)
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            profiling.record_redis(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> ProfiledPipeline:
+        return ProfiledPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
 
 # Create a Redis client instance
-redis_client = redis.Redis(host="redis", port=6379, db=0, decode_responses=True)
+redis_client = ProfiledRedis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+# Same server, raw bytes replies: reads of values written by app.codec go through this one
+redis_binary = ProfiledRedis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+
+
+def decode_or_none(raw: Optional[bytes]) -> Any:
+    """Decode a cached value; unreadable values (e.g. from a newer codec) count as missing"""
+    if raw is None:
+        return None
+    try:
+        return decode(raw)
+    except CodecError:
+        return None
 
 
 #  -------------------Posts Cache Operations-----------------------------------
 
-async def cache_post(post_data: dict):
+RECENT_POSTS_LIST = "posts:recent"
+RECENT_LIMIT = 100
+
+# Workers evict their in-process copies of any key published on this channel
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+def lease_key(key: str) -> str:
+    """Held by a read-through load of key (app.cache); deleting it stops the load from writing back"""
+    return f"lease:{key}"
+
+async def publish_invalidation(*keys: str, drop: bool = True):
+    """Drop keys from Redis (unless drop is False, after a write-through) and from this worker's local tier,
+    cancel loads in flight and tell every other worker to drop its local copies too"""
+    if not keys:
+        return
+    for key in keys:
+        local_cache.delete(key)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.delete(*(keys if drop else ()), *[lease_key(key) for key in keys])
+        pipe.publish(INVALIDATION_CHANNEL, "\n".join(keys))
+        await pipe.execute()
+
+# ------------ BATCHED OPERATIONS ------------ #
+
+# Upper bound on commands queued in one pipeline
+PIPELINE_BATCH = 1000
+
+# LPUSH + LTRIM as one atomic server-side call
+_push_and_trim_script = redis_client.register_script("""
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+""")
+
+# SET (with optional TTL) of an entity plus LPUSH + LTRIM of its id onto a capped list
+_set_and_push_script = redis_client.register_script("""
+if tonumber(ARGV[2]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('LPUSH', KEYS[2], ARGV[3])
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[4]) - 1)
+""")
+
+async def push_and_trim(key: str, value: Union[str, bytes], limit: int):
+    """Atomically push onto a capped list in a single round trip"""
+    await _push_and_trim_script(keys=[key], args=[value, limit])
+
+async def get_cached_posts(post_ids: list[int]) -> list[Optional[dict]]:
+    """Get many posts in one MGET; missing ids come back as None, in order"""
+    if not post_ids:
+        return []
+    raws = await redis_binary.mget([f"post:{post_id}" for post_id in post_ids])
+    return [decode_or_none(raw) for raw in raws]
+
+async def delete_cached_posts(post_ids: list[int]):
+    """Delete many posts from cache and the recent list, two round trips per PIPELINE_BATCH posts"""
+    for start in range(0, len(post_ids), PIPELINE_BATCH):
+        batch = post_ids[start:start + PIPELINE_BATCH]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for post_id in batch:
+                pipe.lrem(RECENT_POSTS_LIST, 0, str(post_id))
+            await pipe.execute()
+        await publish_invalidation(*[f"post:{post_id}" for post_id in batch])
+
+async def cache_post(post_data: dict, ttl: Optional[int] = None):
     """Store a post and update recent list"""
     post_id = post_data["id"]
     key = f"post:{post_id}"
-    
-    # Store the post itself
-    await redis_client.set(key, json.dumps(post_data))
-    
-    # Push to recent list
-    await redis_client.lpush(RECENT_POSTS_LIST, str(post_id))
-    await redis_client.ltrim(RECENT_POSTS_LIST, 0, RECENT_LIMIT - 1)
+
+    # Store the post and push it onto the recent list in one atomic call
+    await _set_and_push_script(
+        keys=[key, RECENT_POSTS_LIST],
+        args=[encode(post_data), ttl or 0, str(post_id), RECENT_LIMIT],
+    )
 
 async def get_cached_post(post_id: int) -> Optional[dict]:
     """Get a single post by ID from cache"""
     key = f"post:{post_id}"
-    raw = await redis_client.get(key)
-    return json.loads(raw) if raw else None
+    return decode_or_none(await redis_binary.get(key))
 
 async def delete_cached_post(post_id: int):
     """Delete a post from cache and remove from recent list"""
-    key = f"post:{post_id}"
-    await redis_client.delete(key)
-    await redis_client.lrem(RECENT_POSTS_LIST, 0, str(post_id))
+    await delete_cached_posts([post_id])
 
 async def get_recent_cached_posts() -> list[dict]:
     """Fetch all cached recent posts (up to limit)"""
     ids = await redis_client.lrange(RECENT_POSTS_LIST, 0, -1)
-    posts = []
-    for post_id in ids:
-        post = await get_cached_post(int(post_id))
-        if post:
-            posts.append(post)
-    return posts
+    return [post for post in await get_cached_posts([int(post_id) for post_id in ids]) if post]
 
 # ------------ USER INTERACTION TRACKING ------------ #
 
@@ -56,13 +164,12 @@ async def track_user_interaction(user_id: int, interaction_type: str, post_id: i
         "post_id": post_id,
         "timestamp": datetime.utcnow().isoformat()
     }
-    await redis_client.lpush(key, json.dumps(interaction))
-    await redis_client.ltrim(key, 0, INTERACTION_LIMIT - 1)
+    await push_and_trim(key, encode(interaction), INTERACTION_LIMIT)
 
 async def get_user_interactions(user_id: int) -> list[dict]:
     key = f"user:{user_id}:interactions"
-    raw_list = await redis_client.lrange(key, 0, -1)
-    return [json.loads(entry) for entry in raw_list]
+    raw_list = await redis_binary.lrange(key, 0, -1)
+    return [entry for entry in map(decode_or_none, raw_list) if entry is not None]
 
 async def clear_user_interactions(user_id: int):
     key = f"user:{user_id}:interactions"
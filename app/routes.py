@@ -1,13 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 
-from app.database import get_db
+from app import cache, categories, counters, deletion, feed, follows, ingest, interactions, jobs, lifecycle, metrics, recommendations, search, tasks, threads, trending
+from app.database import get_db, get_read_db
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PageParams, paginate
+from app.redis_cache import track_user_interaction
+from app.profiling import ProfiledJSONResponse, ProfiledRoute
+from app.serialization import RowEncoder, json_response, page_response
 from app.models import *
 from app.schemas import *
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute, default_response_class=ProfiledJSONResponse)
+
+# Read-heavy list endpoints select these columns and skip ORM hydration (app.serialization)
+POST_ROWS = RowEncoder(Post, PostOut)
+LIKE_ROWS = RowEncoder(PostLike, LikeOut)
+SAVE_ROWS = RowEncoder(PostSave, SaveOut)
+COMMENT_ROWS = RowEncoder(Comment, CommentOut)
+COMMENT_LIKE_ROWS = RowEncoder(CommentLike, CommentLikeOut)
 
 # --- USERS ---
 
@@ -17,40 +32,96 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
+    await cache.write_user(new_user)
     return new_user
 
 
 @router.get("/users/{user_id}", response_model=UserOut)
-async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    user = await db.get(User, user_id)
+async def get_user(user_id: int):
+    user = await cache.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return json_response(user)
 
 
 @router.delete("/user/")
-async def delete_user(payload: UserDelete, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(User)
-        .options(
-            selectinload(User.posts),
-            selectinload(User.comments),
-            selectinload(User.post_likes),
-            selectinload(User.post_saves),
-            selectinload(User.comment_likes)
-        )
-        .where(User.id == payload.id)
-    )
-    user = result.scalars().first()
-
-    if not user:
+async def delete_user(
+    payload: UserDelete,
+    response: Response,
+    background: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    if background:
+        # Large accounts: app.worker deletes in short chunked transactions
+        if not await db.get(User, payload.id):
+            raise HTTPException(status_code=404, detail="User not found")
+        job_id = await jobs.enqueue("delete_user", idempotency_key=f"delete_user:{payload.id}", user_id=payload.id)
+        response.status_code = 202
+        return {"message": "User deletion scheduled", "job_id": job_id}
+
+    if not await deletion.delete_user(db, payload.id):
         raise HTTPException(status_code=404, detail="User not found")
-
-    await db.delete(user)
-    await db.commit()
     return {"message": "User and related data deleted"}
 
 
+# --- FOLLOWS ---
+
+@router.post("/users/{user_id}/follow")
+async def follow_user(user_id: int, follow: FollowCreate, db: AsyncSession = Depends(get_db)):
+    if user_id == follow.user_id:
+        raise HTTPException(status_code=400, detail="Users cannot follow themselves")
+    if not await follows.follow(db, follow.user_id, user_id):
+        raise HTTPException(status_code=400, detail="Already following")
+    return {"message": "User followed"}
+
+
+@router.delete("/user/follow/")
+async def unfollow_user(payload: FollowRemove, db: AsyncSession = Depends(get_db)):
+    if not await follows.unfollow(db, payload.user_id, payload.followee_id):
+        raise HTTPException(status_code=404, detail="Follow not found")
+    return {"message": "User unfollowed"}
+
+
+@router.get("/users/{user_id}/followers", response_model=FollowPage)
+async def get_followers(user_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    rows, next_cursor = await follows.list_page(db, user_id, "followers", page)
+    return {"items": [row._mapping for row in rows], "next_cursor": next_cursor}
+
+
+@router.get("/users/{user_id}/following", response_model=FollowPage)
+async def get_following(user_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    rows, next_cursor = await follows.list_page(db, user_id, "following", page)
+    return {"items": [row._mapping for row in rows], "next_cursor": next_cursor}
+
+
+@router.get("/users/{user_id}/relationship/{other_id}", response_model=Relationship)
+async def get_relationship(user_id: int, other_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await follows.relationship(db, user_id, other_id)
+
+
+@router.get("/users/{user_id}/mutuals", response_model=UserSample)
+async def get_mutuals(user_id: int, limit: int = Query(10, ge=0, le=100), db: AsyncSession = Depends(get_read_db)):
+    return await follows.mutuals(db, user_id, limit)
+
+
+@router.get("/users/{user_id}/followed-by", response_model=UserSample)
+async def get_followed_by(
+    user_id: int,
+    viewer_id: int,
+    limit: int = Query(3, ge=0, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await follows.followed_by(db, viewer_id, user_id, limit)
+
+
+@router.get("/users/{user_id}/recommendations", response_model=RecommendationPage)
+async def get_recommendations(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await recommendations.get_recommendations(db, user_id, limit)
+
 
 # --- POSTS ---
 
@@ -65,68 +136,67 @@ async def create_post(post: PostCreate, db: AsyncSession = Depends(get_db)):
     db.add(new_post)
     await db.commit()
     await db.refresh(new_post)
+    await cache.write_post(new_post)
+    await feed.publish_post(new_post)
+    # Follower timelines are written by the worker; reading every follower id doesn't belong in the request
+    await jobs.enqueue(
+        "fan_out_post", idempotency_key=f"fan_out_post:{new_post.id}",
+        post_id=new_post.id, author_id=new_post.user_id, score=feed.post_score(new_post.timestamp),
+    )
     return new_post
 
 
 @router.get("/posts/{post_id}", response_model=PostOut)
-async def get_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    post = await db.get(Post, post_id)
+async def get_post(post_id: int):
+    post = await cache.get_post(post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    return json_response(post)
+
 
+@router.get("/feed/{user_id}", response_model=FeedPage)
+async def get_feed(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    posts, next_cursor = await feed.get_feed(db, user_id, limit, cursor)
+    return page_response(None, posts, next_cursor)
 
-@router.get("/users/{user_id}/posts")
-async def get_all_posts_by_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(Post).where(Post.user_id == user_id)
-    result = await db.execute(query)
-    posts = result.scalars().all()
-    return posts
 
+@router.get("/users/{user_id}/posts", response_model=PostPage)
+async def get_all_posts_by_user(user_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    query = select(*POST_ROWS.columns).where(Post.user_id == user_id)
+    rows, next_cursor = await paginate(db, query, Post.timestamp, Post.id, page)
+    return page_response(POST_ROWS, rows, next_cursor)
 
-@router.get("/posts/{post_id}/likes")
-async def get_all_likes_for_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(PostLike).where(PostLike.post_id == post_id)
-    result = await db.execute(query)
-    likes = result.scalars().all()
-    return likes
 
+@router.get("/posts/{post_id}/likes", response_model=LikePage)
+async def get_all_likes_for_post(post_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    query = select(*LIKE_ROWS.columns).where(PostLike.post_id == post_id)
+    rows, next_cursor = await paginate(db, query, PostLike.timestamp, PostLike.id, page)
+    return page_response(LIKE_ROWS, rows, next_cursor)
 
-@router.get("/posts/{post_id}/comments")
-async def get_all_comments_for_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(Comment).where(Comment.post_id == post_id)
-    result = await db.execute(query)
-    comments = result.scalars().all()
-    return comments
 
+@router.get("/posts/{post_id}/comments", response_model=CommentPage)
+async def get_all_comments_for_post(post_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    query = select(*COMMENT_ROWS.columns).where(Comment.post_id == post_id)
+    rows, next_cursor = await paginate(db, query, Comment.timestamp, Comment.id, page, descending=False)
+    return page_response(COMMENT_ROWS, rows, next_cursor)
 
-@router.get("/posts/{post_id}/saves")
-async def get_all_saves_for_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(PostSave).where(PostSave.post_id == post_id)
-    result = await db.execute(query)
-    saves = result.scalars().all()
-    return saves
+
+@router.get("/posts/{post_id}/saves", response_model=SavePage)
+async def get_all_saves_for_post(post_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    query = select(*SAVE_ROWS.columns).where(PostSave.post_id == post_id)
+    rows, next_cursor = await paginate(db, query, PostSave.timestamp, PostSave.id, page)
+    return page_response(SAVE_ROWS, rows, next_cursor)
 
 
 @router.delete("/post/")
 async def delete_post(payload: PostDelete, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Post)
-        .options(
-            selectinload(Post.likes),
-            selectinload(Post.saves),
-            selectinload(Post.comments),
-            selectinload(Post.categories),
-        )
-        .where(Post.id == payload.id)
-    )
-    post = result.scalars().first()
-
-    if not post:
+    if not await deletion.delete_post(db, payload.id):
         raise HTTPException(status_code=404, detail="Post not found")
-
-    await db.delete(post)
-    await db.commit()
     return {"message": "Post deleted"}
 
 
@@ -139,94 +209,113 @@ async def create_comment(comment: CommentCreate, db: AsyncSession = Depends(get_
     post = await db.get(Post, comment.post_id)
     if not user or not post:
         raise HTTPException(status_code=404, detail="User or Post not found")
+    # reply_to has no foreign key now that comments is partitioned
+    if comment.reply_to and await db.get(Comment, comment.reply_to) is None:
+        raise HTTPException(status_code=404, detail="Parent comment not found")
 
-    print(comment.dict())
     new_comment = Comment(**comment.dict())
     db.add(new_comment)
+    await counters.bump(db, Post, comment.post_id, comment_count=1)
+    if comment.reply_to:
+        await counters.bump(db, Comment, comment.reply_to, reply_count=1)
     await db.commit()
     await db.refresh(new_comment)
-    return new_comment
-
-
-@router.get("/posts/{post_id}/comments", response_model=List[CommentOut])
-async def get_comments(post_id: int, nested: bool = True, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Comment).where(Comment.post_id == post_id).order_by(Comment.timestamp).options(selectinload(Comment.replies))
-    )
-    all_comments = result.scalars().all()
-
-    if nested:
-        # Build nested structure
-        comment_map = {c.id: c for c in all_comments}
-        root_comments = []
-        for comment in all_comments:
-            if comment.reply_to:
-                parent = comment_map.get(comment.reply_to)
-                if parent:
-                    parent.replies.append(comment)
-            else:
-                root_comments.append(comment)
-        return root_comments
-    return all_comments
-
-
-@router.get("/comments/{comment_id}/details")
-async def get_comment_details(comment_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(Comment).options(
-        selectinload(Comment.likes),
-        selectinload(Comment.replies)
-    ).where(Comment.id == comment_id)
-
-    result = await db.execute(query)
-    comment = result.scalars().first()
-
+    await counters.invalidate_cached_counts([comment.post_id])
+    await threads.invalidate_threads([comment.post_id])
+    await trending.record(comment.post_id, "comment")
+    return threads.comment_to_dict(new_comment)
+
+
+@router.get("/posts/{post_id}/thread", response_model=CommentPage)
+async def get_comment_thread(
+    post_id: int,
+    page: PageParams = Depends(),
+    max_depth: int = Query(threads.MAX_DEPTH, ge=1, le=8),
+    replies: int = Query(threads.REPLIES_PER_NODE, ge=0, le=20),
+    db: AsyncSession = Depends(get_db)
+):
+    # Pages over top-level comments; each carries up to `replies` replies per level
+    return json_response(await threads.get_thread(db, post_id, page, max_depth, replies))
+
+
+@router.get("/comments/{comment_id}/replies", response_model=CommentPage)
+async def get_comment_replies(
+    comment_id: int,
+    page: PageParams = Depends(),
+    max_depth: int = Query(threads.MAX_DEPTH, ge=1, le=8),
+    replies: int = Query(threads.REPLIES_PER_NODE, ge=0, le=20),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return json_response(await threads.get_replies(db, comment_id, page, max_depth, replies))
+
+
+@router.get("/comments/{comment_id}/likes", response_model=CommentLikePage)
+async def get_all_likes_for_comment(
+    comment_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)
+):
+    query = select(*COMMENT_LIKE_ROWS.columns).where(CommentLike.comment_id == comment_id)
+    rows, next_cursor = await paginate(db, query, CommentLike.timestamp, CommentLike.id, page)
+    return page_response(COMMENT_LIKE_ROWS, rows, next_cursor)
+
+
+@router.get("/comments/{comment_id}/details", response_model=CommentDetails)
+async def get_comment_details(
+    comment_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    max_depth: int = Query(threads.MAX_DEPTH, ge=1, le=8),
+    replies: int = Query(threads.REPLIES_PER_NODE, ge=0, le=20),
+    db: AsyncSession = Depends(get_read_db)
+):
+    comment = (await db.execute(select(Comment.id, Comment.content).where(Comment.id == comment_id))).first()
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    return {
+    # The first page of each; a hot comment's likes and replies are never loaded whole
+    page = PageParams(limit=limit)
+    likes_query = select(*COMMENT_LIKE_ROWS.columns).where(CommentLike.comment_id == comment_id)
+    likes, likes_cursor = await paginate(db, likes_query, CommentLike.timestamp, CommentLike.id, page)
+    thread = await threads.get_replies(db, comment_id, page, max_depth, replies)
+    return json_response({
         "comment_id": comment.id,
         "content": comment.content,
-        "likes": comment.likes,
-        "replies": comment.replies
-    }
+        "likes": [COMMENT_LIKE_ROWS.encode(row) for row in likes],
+        "likes_cursor": likes_cursor,
+        "replies": thread["items"],
+        "replies_cursor": thread["next_cursor"],
+    })
 
 
 @router.delete("/comment/")
 async def delete_comment(payload: CommentDelete, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Comment)
-        .options(
-            selectinload(Comment.replies),
-            selectinload(Comment.likes)
-        )
-        .where(Comment.id == payload.id)
-    )
-    comment = result.scalars().first()
-
-    if not comment:
+    if not await deletion.delete_comment(db, payload.id):
         raise HTTPException(status_code=404, detail="Comment not found")
-
-    await db.delete(comment)
-    await db.commit()
     return {"message": "Comment deleted"}
 
 
 # --- COMMENT LIKES ---
 
 @router.post("/comments/{comment_id}/like")
-async def like_comment(comment_id: int, like: LikeCreate, db: AsyncSession = Depends(get_db)):
-    # Check if already liked
-    exists = await db.execute(
-        select(CommentLike).where(
-            CommentLike.comment_id == comment_id,
-            CommentLike.user_id == like.user_id
+async def like_comment(comment_id: int, like: LikeCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    if interactions.MODE == "stream":
+        if not await interactions.add("comment_likes", comment_id, like.user_id):
+            raise HTTPException(status_code=400, detail="Already liked")
+        response.status_code = 202
+        return {"message": "Comment like queued"}
+
+    # comments is partitioned, so nothing references it by foreign key; check the comment by hand
+    if await db.get(Comment, comment_id) is None:
+        raise HTTPException(status_code=404, detail="User or Comment not found")
+    # A single idempotent statement: a repeated like is a no-op instead of a constraint error
+    try:
+        inserted = await ingest.add_interactions(
+            db, "comment_likes", [{"comment_id": comment_id, "user_id": like.user_id}]
         )
-    )
-    if exists.scalar_one_or_none():
+    except IntegrityError:
+        raise HTTPException(status_code=404, detail="User or Comment not found")
+    if not inserted:
         raise HTTPException(status_code=400, detail="Already liked")
 
-    new_like = CommentLike(comment_id=comment_id, user_id=like.user_id)
-    db.add(new_like)
+    await counters.bump(db, Comment, comment_id, like_count=1)
     await db.commit()
     return {"message": "Comment liked"}
 
@@ -234,64 +323,87 @@ async def like_comment(comment_id: int, like: LikeCreate, db: AsyncSession = Dep
 # --- POST LIKES ---
 
 @router.post("/posts/{post_id}/like")
-async def like_post(post_id: int, like: LikeCreate, db: AsyncSession = Depends(get_db)):
-    exists = await db.execute(
-        select(PostLike).where(
-            PostLike.post_id == post_id,
-            PostLike.user_id == like.user_id
-        )
-    )
-    if exists.scalar_one_or_none():
+async def like_post(post_id: int, like: LikeCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    if interactions.MODE == "stream":
+        # Written to Postgres by app.interaction_worker
+        if not await interactions.add("post_likes", post_id, like.user_id):
+            raise HTTPException(status_code=400, detail="Already liked")
+        response.status_code = 202
+        return {"message": "Post like queued"}
+
+    try:
+        inserted = await ingest.add_interactions(db, "post_likes", [{"post_id": post_id, "user_id": like.user_id}])
+    except IntegrityError:
+        raise HTTPException(status_code=404, detail="User or Post not found")
+    if not inserted:
         raise HTTPException(status_code=400, detail="Already liked")
-    db.add(PostLike(post_id=post_id, user_id=like.user_id))
+
+    await counters.bump(db, Post, post_id, like_count=1)
     await db.commit()
+    await counters.invalidate_cached_counts([post_id])
+    await trending.record(post_id, "like")
+    await track_user_interaction(like.user_id, "like", post_id)
     return {"message": "Post liked"}
 
 
 @router.delete("/post/like/")
-async def remove_post_like(payload: LikeRemove, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(PostLike).where(PostLike.user_id == payload.user_id)
-    )
-    like = result.scalars().first()
-
-    if not like:
+async def remove_post_like(payload: LikeRemove, response: Response, db: AsyncSession = Depends(get_db)):
+    if interactions.MODE == "stream":
+        if not await interactions.remove(db, "post_likes", payload.post_id, payload.user_id):
+            raise HTTPException(status_code=404, detail="Like not found")
+        response.status_code = 202
+        return {"message": "Like removal queued"}
+
+    if not await ingest.remove_interactions(db, "post_likes", [(payload.post_id, payload.user_id)]):
         raise HTTPException(status_code=404, detail="Like not found")
 
-    await db.delete(like)
+    await counters.bump(db, Post, payload.post_id, like_count=-1)
     await db.commit()
+    await counters.invalidate_cached_counts([payload.post_id])
+    await trending.record(payload.post_id, "like", -1)
     return {"message": "Like removed"}
 
 
 # --- POST SAVES ---
 
 @router.post("/posts/{post_id}/save")
-async def save_post(post_id: int, save: SaveCreate, db: AsyncSession = Depends(get_db)):
-    exists = await db.execute(
-        select(PostSave).where(
-            PostSave.post_id == post_id,
-            PostSave.user_id == save.user_id
-        )
-    )
-    if exists.scalar_one_or_none():
+async def save_post(post_id: int, save: SaveCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    if interactions.MODE == "stream":
+        if not await interactions.add("post_saves", post_id, save.user_id):
+            raise HTTPException(status_code=400, detail="Already saved")
+        response.status_code = 202
+        return {"message": "Post save queued"}
+
+    try:
+        inserted = await ingest.add_interactions(db, "post_saves", [{"post_id": post_id, "user_id": save.user_id}])
+    except IntegrityError:
+        raise HTTPException(status_code=404, detail="User or Post not found")
+    if not inserted:
         raise HTTPException(status_code=400, detail="Already saved")
-    db.add(PostSave(post_id=post_id, user_id=save.user_id))
+
+    await counters.bump(db, Post, post_id, save_count=1)
     await db.commit()
+    await counters.invalidate_cached_counts([post_id])
+    await trending.record(post_id, "save")
+    await track_user_interaction(save.user_id, "save", post_id)
     return {"message": "Post saved"}
 
 
 @router.delete("/post/save/")
-async def remove_post_save(payload: SaveRemove, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(PostSave).where(PostSave.user_id == payload.user_id)
-    )
-    save = result.scalars().first()
-
-    if not save:
+async def remove_post_save(payload: SaveRemove, response: Response, db: AsyncSession = Depends(get_db)):
+    if interactions.MODE == "stream":
+        if not await interactions.remove(db, "post_saves", payload.post_id, payload.user_id):
+            raise HTTPException(status_code=404, detail="Save not found")
+        response.status_code = 202
+        return {"message": "Save removal queued"}
+
+    if not await ingest.remove_interactions(db, "post_saves", [(payload.post_id, payload.user_id)]):
         raise HTTPException(status_code=404, detail="Save not found")
 
-    await db.delete(save)
+    await counters.bump(db, Post, payload.post_id, save_count=-1)
     await db.commit()
+    await counters.invalidate_cached_counts([payload.post_id])
+    await trending.record(payload.post_id, "save", -1)
     return {"message": "Save removed"}
 
 
@@ -303,29 +415,131 @@ async def create_category(cat: CategoryCreate, db: AsyncSession = Depends(get_db
     db.add(db_cat)
     await db.commit()
     await db.refresh(db_cat)
+    await categories.invalidate_listing()
     return db_cat
 
 
+@router.get("/categories/", response_model=List[CategoryOut])
+async def list_categories():
+    return json_response(await categories.list_categories())
+
+
+@router.get("/categories/posts", response_model=PostPage)
+async def get_posts_in_categories(
+    category_ids: List[int] = Query(..., min_length=1, max_length=20),
+    match: str = Query("any", pattern="^(any|all)$"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # match=any: posts in at least one of the categories; match=all: posts in every one
+    return json_response(await categories.get_posts_in_categories(db, category_ids, match, page))
+
+
+@router.get("/categories/{category_id}/posts", response_model=PostPage)
+async def get_category_posts(category_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db)):
+    return json_response(await categories.get_category_posts(db, category_id, page))
+
+
 @router.post("/posts/categories/assign")
 async def assign_categories(payload: PostCategoryAssign, db: AsyncSession = Depends(get_db)):
-    # Retrieve the post
-    post = await db.get(Post, payload.post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+    await categories.assign(db, payload.post_id, payload.category_ids)
+    return {"message": "Categories assigned to post"}
 
-    # Query the categories
-    result = await db.execute(
-        select(Category)
-        .where(Category.id.in_(payload.category_ids))
-        .options(selectinload(Category.posts)) 
-    )
-    categories = result.scalars().all()
 
-    if not categories:
-        raise HTTPException(status_code=404, detail="Categories not found")
+# --- TRENDING ---
 
-    # Assign categories to post
-    post.categories = categories
-    await db.commit()
+@router.get("/trending", response_model=TrendingPage)
+async def get_trending(
+    window: str = Query("24h", pattern="^(" + "|".join(trending.WINDOWS) + ")$"),
+    category_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    ranked = await trending.top(window, limit, category_id)
+    posts = await cache.get_posts(db, [post_id for post_id, _ in ranked])
+    # Posts deleted since they were scored are skipped until compaction catches up
+    items = [{**posts[post_id], "score": score} for post_id, score in ranked if post_id in posts]
+    return json_response({"window": window, "category_id": category_id, "items": items})
 
-    return {"message": "Categories assigned to post"}
+
+# --- SEARCH ---
+
+@router.get("/search", response_model=SearchPage)
+async def search_content(
+    q: str = Query(..., min_length=1, max_length=200),
+    target: str = Query("posts", alias="type", pattern="^(posts|comments)$"),
+    category_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    page: PageParams = Depends(),
+):
+    return json_response(await search.search(q, page, target, category_id, user_id))
+
+
+# --- BULK INGESTION ---
+# Rows referencing missing users/posts/comments are rejected set-wise rather than failing the batch.
+# Batch-created posts are not fanned out; followers see them once their timelines are rebuilt.
+
+@router.post("/posts/batch", response_model=BatchResult)
+async def create_posts_batch(batch: PostBatch, db: AsyncSession = Depends(get_db)):
+    ingest.check_batch_size(batch.items)
+    return await ingest.insert_posts(db, batch.items)
+
+
+@router.post("/comments/batch", response_model=BatchResult)
+async def create_comments_batch(batch: CommentBatch, db: AsyncSession = Depends(get_db)):
+    ingest.check_batch_size(batch.items)
+    return await ingest.insert_comments(db, batch.items)
+
+
+@router.post("/likes/batch", response_model=BatchResult)
+async def like_posts_batch(batch: InteractionBatch, db: AsyncSession = Depends(get_db)):
+    ingest.check_batch_size(batch.items)
+    return await ingest.insert_interactions(db, "post_likes", batch.items)
+
+
+@router.post("/saves/batch", response_model=BatchResult)
+async def save_posts_batch(batch: InteractionBatch, db: AsyncSession = Depends(get_db)):
+    ingest.check_batch_size(batch.items)
+    return await ingest.insert_interactions(db, "post_saves", batch.items)
+
+
+@router.post("/comment-likes/batch", response_model=BatchResult)
+async def like_comments_batch(batch: CommentLikeBatch, db: AsyncSession = Depends(get_db)):
+    ingest.check_batch_size(batch.items)
+    return await ingest.insert_interactions(db, "comment_likes", batch.items)
+
+
+# --- JOBS ---
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+async def get_job(job_id: str):
+    status = await jobs.get_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+# --- METRICS ---
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    if interactions.MODE == "stream":
+        await interactions.sample_backlog()
+    await jobs.sample_queue()
+    return metrics.render()
+
+
+# --- HEALTH ---
+
+@router.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def health_ready(response: Response):
+    # 503 while the database is unreachable or the worker is draining (app.lifecycle)
+    ready, checks = await lifecycle.readiness()
+    if not ready:
+        response.status_code = 503
+    return checks
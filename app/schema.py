@@ -0,0 +1,51 @@
+"""What a starting API worker does about the database schema (SCHEMA_MODE)"""
+import os
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from app.database import engine
+from app.models import Base
+
+MODE = os.getenv("SCHEMA_MODE", "create")
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+
+class SchemaMismatch(RuntimeError):
+    pass
+
+
+def alembic_heads() -> set[str]:
+    """Head revisions of the migration scripts shipped with this code"""
+    config = Config(ALEMBIC_INI)
+    # script_location is relative to alembic.ini, not to the working directory
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+async def check_schema():
+    """Raise SchemaMismatch unless the database is at the Alembic head; runs no DDL"""
+    expected = alembic_heads()
+    async with engine.connect() as conn:
+        try:
+            current = set((await conn.execute(text("SELECT version_num FROM alembic_version"))).scalars())
+        except ProgrammingError:
+            current = set()
+    if current != expected:
+        raise SchemaMismatch(
+            f"database schema is at {', '.join(sorted(current)) or 'no revision'}, "
+            f"this code expects {', '.join(sorted(expected))}; run `alembic upgrade head`"
+        )
+
+
+async def prepare():
+    if MODE == "create":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    elif MODE == "check":
+        await check_schema()
+    elif MODE != "off":
+        raise ValueError(f"SCHEMA_MODE must be create, check or off, not {MODE!r}")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 
 # --- USERS ---
 
@@ -11,6 +11,8 @@ class UserOut(BaseModel):
     id: int
     name: str
     is_verified: int
+    follower_count: int = 0
+    following_count: int = 0
 
     class Config:
         orm_mode = True
@@ -18,6 +20,37 @@ class UserOut(BaseModel):
 class UserDelete(BaseModel):
     id: int
 
+# --- FOLLOWS ---
+
+class FollowCreate(BaseModel):
+    user_id: int
+
+class FollowRemove(BaseModel):
+    user_id: int
+    followee_id: int
+
+class FollowOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    timestamp: datetime
+
+class FollowPage(BaseModel):
+    items: List[FollowOut]
+    next_cursor: Optional[str] = None
+
+class UserSummary(BaseModel):
+    id: int
+    name: Optional[str] = None
+
+class UserSample(BaseModel):
+    count: int
+    items: List[UserSummary]
+
+class Relationship(BaseModel):
+    following: bool
+    followed_by: bool
+    mutual: bool
+
 # --- POSTS ---
 
 class PostCreate(BaseModel):
@@ -29,12 +62,39 @@ class PostOut(BaseModel):
     user_id: int
     content: str
     timestamp: datetime
+    like_count: int = 0
+    save_count: int = 0
+    comment_count: int = 0
     class Config:
         orm_mode = True
 
 class PostDelete(BaseModel):
     id: int
 
+class PostPage(BaseModel):
+    items: List[PostOut]
+    next_cursor: Optional[str] = None
+
+class FeedPage(BaseModel):
+    items: List[PostOut]
+    next_cursor: Optional[str] = None
+
+class TrendingPost(PostOut):
+    score: float
+
+class TrendingPage(BaseModel):
+    window: str
+    category_id: Optional[int] = None
+    items: List[TrendingPost]
+
+class RecommendedPost(PostOut):
+    score: float
+
+class RecommendationPage(BaseModel):
+    source: str
+    generated_at: Optional[float] = None
+    items: List[RecommendedPost]
+
 # --- COMMENTS ---
 
 class CommentCreate(BaseModel):
@@ -53,26 +113,81 @@ class CommentOut(BaseModel):
     content: str
     timestamp: datetime
     reply_to: Optional[int] = None
+    like_count: int = 0
+    reply_count: int = 0
     replies: Optional[List['CommentOut']] = []
+    # Set when more replies exist than were loaded; pass to /comments/{id}/replies
+    replies_cursor: Optional[str] = None
     class Config:
         orm_mode = True
 
 CommentOut.update_forward_refs()
 
+class CommentPage(BaseModel):
+    items: List[CommentOut]
+    next_cursor: Optional[str] = None
+
 # --- LIKES & SAVES ---
 
 class LikeCreate(BaseModel):
     user_id: int
 
 class LikeRemove(BaseModel):
+    post_id: int
     user_id: int
 
 class SaveCreate(BaseModel):
     user_id: int
 
 class SaveRemove(BaseModel):
+    post_id: int
     user_id: int
 
+class LikeOut(BaseModel):
+    id: int
+    post_id: int
+    user_id: int
+    timestamp: datetime
+    class Config:
+        orm_mode = True
+
+class CommentLikeOut(BaseModel):
+    id: int
+    comment_id: int
+    user_id: int
+    timestamp: datetime
+    class Config:
+        orm_mode = True
+
+class SaveOut(BaseModel):
+    id: int
+    post_id: int
+    user_id: int
+    timestamp: datetime
+    class Config:
+        orm_mode = True
+
+class LikePage(BaseModel):
+    items: List[LikeOut]
+    next_cursor: Optional[str] = None
+
+class SavePage(BaseModel):
+    items: List[SaveOut]
+    next_cursor: Optional[str] = None
+
+class CommentLikePage(BaseModel):
+    items: List[CommentLikeOut]
+    next_cursor: Optional[str] = None
+
+class CommentDetails(BaseModel):
+    comment_id: int
+    content: str
+    # First pages only; continue with /comments/{id}/likes and /comments/{id}/replies
+    likes: List[CommentLikeOut]
+    likes_cursor: Optional[str] = None
+    replies: List[CommentOut]
+    replies_cursor: Optional[str] = None
+
 # --- CATEGORY ---
 
 class CategoryCreate(BaseModel):
@@ -87,3 +202,60 @@ class CategoryOut(BaseModel):
 class PostCategoryAssign(BaseModel):
     post_id: int
     category_ids: List[int]
+
+# --- SEARCH ---
+
+class PostHit(PostOut):
+    rank: float
+
+class CommentHit(CommentOut):
+    rank: float
+
+class SearchPage(BaseModel):
+    items: List[Union[PostHit, CommentHit]]
+    next_cursor: Optional[str] = None
+
+# --- JOBS ---
+
+class JobOut(BaseModel):
+    id: str
+    name: str
+    state: str
+    attempts: int
+    error: Optional[str] = None
+
+# --- BULK INGESTION ---
+
+class PostImport(PostCreate):
+    timestamp: Optional[datetime] = None
+
+class CommentImport(CommentCreate):
+    timestamp: Optional[datetime] = None
+
+class InteractionImport(BaseModel):
+    post_id: int
+    user_id: int
+    timestamp: Optional[datetime] = None
+
+class CommentLikeImport(BaseModel):
+    comment_id: int
+    user_id: int
+    timestamp: Optional[datetime] = None
+
+class PostBatch(BaseModel):
+    items: List[PostImport]
+
+class CommentBatch(BaseModel):
+    items: List[CommentImport]
+
+class InteractionBatch(BaseModel):
+    items: List[InteractionImport]
+
+class CommentLikeBatch(BaseModel):
+    items: List[CommentLikeImport]
+
+class BatchResult(BaseModel):
+    inserted: int
+    duplicates: int = 0
+    rejected: int = 0
+    ids: List[int] = []
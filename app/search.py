@@ -0,0 +1,106 @@
+"""Ranked full-text search over posts and comments"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import Float, cast, func, literal_column, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache
+from app.database import read_sessions
+from app.models import SEARCH_CONFIG, Comment, Post, post_category
+from app.pagination import PageParams
+from app.schemas import CommentOut, PostOut
+from app.serialization import RowEncoder
+
+CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "60"))
+# Only the newest this-many matches are ranked; bounds the cost of very common terms
+MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "10000"))
+
+# What GET /search can search, with the columns each result carries
+TARGETS = {
+    "posts": (Post, RowEncoder(Post, PostOut)),
+    "comments": (Comment, RowEncoder(Comment, CommentOut)),
+}
+
+
+def encode_cursor(rank: float, id: int) -> str:
+    raw = f"{rank!r}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return float(rank), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def normalize(q: str) -> str:
+    return " ".join(q.lower().split())
+
+
+def cache_key(q: str, target: str, category_id: Optional[int], user_id: Optional[int], page: PageParams) -> str:
+    params = json.dumps([q, target, category_id, user_id, page.cursor, page.limit])
+    return f"search:{hashlib.sha1(params.encode()).hexdigest()}"
+
+
+async def search(
+    q: str,
+    page: PageParams,
+    target: str = "posts",
+    category_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> dict:
+    """One page of matches for q, best first"""
+    q = normalize(q)
+
+    async def load(db: AsyncSession):
+        return await _query(db, q, target, category_id, user_id, page)
+
+    key = cache_key(q, target, category_id, user_id, page)
+    return await cache.read_through(key, load, CACHE_TTL, read_sessions())
+
+
+async def _query(
+    db: AsyncSession, q: str, target: str, category_id: Optional[int], user_id: Optional[int], page: PageParams
+) -> dict:
+    model, encoder = TARGETS[target]
+    tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q)
+
+    matches = select(*encoder.columns, model.search_vector).where(model.search_vector.op("@@")(tsquery))
+    if user_id is not None:
+        matches = matches.where(model.user_id == user_id)
+    if category_id is not None:
+        in_category = select(post_category.c.post_id).where(post_category.c.category_id == category_id)
+        matches = matches.where((Post.id if model is Post else Comment.post_id).in_(in_category))
+    matches = matches.order_by(model.id.desc()).limit(MAX_CANDIDATES).subquery()
+
+    # ts_rank_cd returns real; compared as float8 so cursors round-trip exactly
+    rank = cast(func.ts_rank_cd(matches.c.search_vector, tsquery), Float).label("rank")
+    hits = select(*[matches.c[column.key] for column in encoder.columns], rank).subquery()
+
+    query = select(hits)
+    if page.cursor:
+        query = query.where(tuple_(hits.c.rank, hits.c.id) < decode_cursor(page.cursor))
+    query = query.order_by(hits.c.rank.desc(), hits.c.id.desc()).limit(page.limit + 1)
+    # The best plan depends on how common the terms are; a cached generic plan can't know that
+    await db.execute(text("SET LOCAL plan_cache_mode = force_custom_plan"))
+    rows = (await db.execute(query)).all()
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    items = []
+    for row in rows:
+        item = encoder.encode(row)
+        item["timestamp"] = item["timestamp"].isoformat()
+        items.append(item)
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,40 @@
+"""Fast path for read-heavy endpoints: Core rows encoded straight to JSON with orjson"""
+import time
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+from app import profiling
+
+
+class RowEncoder:
+    """Columns backing a response schema, plus defaults for its non-column fields"""
+
+    def __init__(self, model, schema: type[BaseModel]):
+        table_columns = model.__table__.c
+        self.columns = [getattr(model, name) for name in schema.model_fields if name in table_columns]
+        self.defaults = {
+            name: field.get_default(call_default_factory=True)
+            for name, field in schema.model_fields.items()
+            if name not in table_columns
+        }
+
+    def encode(self, row) -> dict[str, Any]:
+        return {**self.defaults, **row._mapping} if self.defaults else dict(row._mapping)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    start = time.perf_counter()
+    body = orjson.dumps(content)
+    profile = profiling.current()
+    if profile is not None:
+        profile.serialize_seconds += time.perf_counter() - start
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def page_response(encoder: Optional[RowEncoder], rows: list, next_cursor: Any) -> Response:
+    """Render a keyset page of Core rows (or ready-made dicts when encoder is None)"""
+    items = [encoder.encode(row) for row in rows] if encoder else rows
+    return json_response({"items": items, "next_cursor": next_cursor})
@@ -0,0 +1,86 @@
+"""
+Production entry point: checks the schema once, then runs uvicorn workers
+
+    python -m app.server --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import copy
+import logging
+import logging.config
+import os
+
+import uvicorn
+from uvicorn.config import LOGGING_CONFIG
+
+from app import schema
+from app.database import engine
+
+logger = logging.getLogger("app.server")
+
+HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+PORT = int(os.getenv("SERVER_PORT", "8000"))
+WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# Long enough for the load balancer's readiness probe to notice (app.lifecycle)
+DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "5"))
+KEEPALIVE_TIMEOUT = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", "5"))
+# How long the parent waits for a worker to answer its pings before replacing it; a new worker
+# can't answer until it has imported the app
+HEALTHCHECK_TIMEOUT = int(os.getenv("SERVER_HEALTHCHECK_TIMEOUT", "30"))
+# Written synchronously for every request; leave it to the load balancer
+ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true"
+
+
+async def preflight():
+    try:
+        await schema.check_schema()
+    finally:
+        # The workers are fresh processes with their own pools
+        await engine.dispose()
+
+
+def log_config() -> dict:
+    """uvicorn's logging, with the app's own loggers (app.*) sent to the same handler"""
+    config = copy.deepcopy(LOGGING_CONFIG)
+    config["loggers"]["app"] = {"handlers": ["default"], "level": "INFO", "propagate": False}
+    # SQLAlchemy logs the pools under app.database.InstrumentedPool.*, and at INFO on every dispose
+    config["loggers"]["app.database"] = {"level": "WARNING"}
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT)
+    parser.add_argument("--drain-seconds", type=float, default=DRAIN_SECONDS)
+    args = parser.parse_args()
+    logging.config.dictConfig(log_config())
+
+    if schema.MODE != "off":
+        asyncio.run(preflight())
+        logger.info("schema is at %s", ", ".join(sorted(schema.alembic_heads())))
+    # Inherited by the worker processes; with one worker uvicorn serves from this process
+    os.environ["SCHEMA_MODE"] = schema.MODE = "off"
+    os.environ["SHUTDOWN_DRAIN_SECONDS"] = str(args.drain_seconds)
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        timeout_worker_healthcheck=HEALTHCHECK_TIMEOUT,
+        access_log=ACCESS_LOG,
+        log_config=log_config(),
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Jobs run by app.worker. Importing this module registers them with app.jobs.
+"""
+from typing import Optional
+
+from app import cache, counters, deletion, feed, partitions, recommendations, trending
+from app.database import AsyncSessionLocal
+from app.jobs import every, job
+
+
+@job("delete_user", max_attempts=5, concurrency=2)
+async def delete_user(user_id: int):
+    # Each chunk commits on its own, so a retry resumes where the last attempt stopped
+    await deletion.delete_user_in_chunks(user_id)
+
+
+@job("fan_out_post", max_attempts=5)
+async def fan_out_post(post_id: int, author_id: int, score: float):
+    # Re-adding a post to a timeline is a no-op, so retries are safe
+    async with AsyncSessionLocal() as db:
+        await feed.fan_out_post(db, post_id, author_id, score)
+
+
+@job("reconcile_counters", max_attempts=3)
+async def reconcile_counters(
+    post_ids: Optional[list[int]] = None,
+    comment_ids: Optional[list[int]] = None,
+    user_ids: Optional[list[int]] = None,
+):
+    async with AsyncSessionLocal() as db:
+        await counters.reconcile_posts(db, post_ids or [])
+        await counters.reconcile_comments(db, comment_ids or [])
+        await counters.reconcile_users(db, user_ids or [])
+        await db.commit()
+    await cache.invalidate_post_entities(post_ids or [])
+    await cache.invalidate_users(user_ids or [])
+
+
+@job("rebuild_trending", max_attempts=3, concurrency=1)
+async def rebuild_trending():
+    async with AsyncSessionLocal() as db:
+        await trending.rebuild(db)
+
+
+@job("build_recommendations", max_attempts=2, concurrency=1)
+async def build_recommendations(days: Optional[int] = None):
+    # Imported here so numpy and scipy are only loaded by the worker that runs the build
+    from app import recommender
+
+    await recommender.build(recommender.WINDOW_DAYS if days is None else days)
+
+
+# ------------ PERIODIC ------------ #
+
+# A failed run is simply superseded by the next interval's
+@job("flush_counters", max_attempts=1, concurrency=1)
+async def flush_counters():
+    await counters.flush_all_counters()
+
+
+@job("maintain_trending", max_attempts=1, concurrency=1)
+async def maintain_trending():
+    await trending.maintain()
+
+
+@job("maintain_partitions", max_attempts=1, concurrency=1)
+async def maintain_partitions():
+    await partitions.maintain()
+
+
+if counters.COUNTER_MODE == "buffered":
+    every(counters.FLUSH_INTERVAL, "flush_counters")
+every(trending.COMPACT_INTERVAL, "maintain_trending")
+every(recommendations.INTERVAL, "build_recommendations")
+every(partitions.MAINTAIN_INTERVAL, "maintain_partitions")
@@ -0,0 +1,192 @@
+"""Comment threads loaded with one recursive query"""
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.cache import LEASE_MS
+from app.codec import encode
+from app.pagination import PageParams, decode_cursor, encode_cursor
+from app.redis_cache import decode_or_none, lease_key, redis_binary, redis_client
+
+MAX_DEPTH = int(os.getenv("THREAD_MAX_DEPTH", "3"))
+REPLIES_PER_NODE = int(os.getenv("THREAD_REPLIES_PER_NODE", "3"))
+# Like counts inside cached threads may lag by up to this many seconds
+THREAD_TTL = int(os.getenv("CACHE_THREAD_TTL", "60"))
+
+# Cursor for "load more" on a node none of whose replies were rendered (replies=0): before every reply
+START_CURSOR = encode_cursor(datetime.min, 0)
+
+COLUMNS = ("id", "post_id", "user_id", "content", "timestamp", "reply_to", "like_count", "reply_count")
+
+
+# Like app.cache's leases, but shared by every render of a thread loading at once: a load joins the
+# lease in place rather than replacing it, and fills leave it to expire. KEYS: lease key. ARGV: token, lease ms
+_lease_script = redis_client.register_script("""
+local held = redis.call('GET', KEYS[1])
+if held then
+    return held
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return ARGV[1]
+""")
+
+# Writes one render while its lease is still held; invalidate_threads deletes the lease, so a load that
+# raced it returns its render without caching it. KEYS: thread, lease key. ARGV: lease token, field, value, ttl
+_fill_script = redis_client.register_script("""
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+-- NX: the TTL runs from the first render, so no variant outlives it
+redis.call('EXPIRE', KEYS[1], ARGV[4], 'NX')
+return 1
+""")
+
+
+def _columns(alias: str) -> str:
+    return ", ".join(f"{alias}.{column}" for column in COLUMNS)
+
+
+def thread_key(post_id: int) -> str:
+    return f"thread:{post_id}"
+
+
+def comment_to_dict(comment) -> dict:
+    """Render a comment (ORM object or row) as a CommentOut leaf"""
+    return {
+        "id": comment.id,
+        "post_id": comment.post_id,
+        "user_id": comment.user_id,
+        "content": comment.content,
+        "timestamp": comment.timestamp.isoformat(),
+        "reply_to": comment.reply_to,
+        "like_count": comment.like_count,
+        "reply_count": comment.reply_count,
+        "replies": [],
+        "replies_cursor": None,
+    }
+
+
+def _thread_sql(roots: str, after: bool) -> str:
+    position = "AND (c.timestamp, c.id) > (:after_timestamp, :after_id)" if after else ""
+    return f"""
+        WITH RECURSIVE thread AS (
+            SELECT * FROM (
+                SELECT {_columns("c")}, 1 AS depth, row_number() OVER (ORDER BY c.timestamp, c.id) AS rn
+                FROM comments c
+                WHERE {roots} {position}
+                ORDER BY c.timestamp, c.id
+                LIMIT :root_fetch
+            ) top
+            UNION ALL
+            SELECT {_columns("r")}, t.depth + 1, r.rn
+            FROM thread t
+            CROSS JOIN LATERAL (
+                SELECT {_columns("c")}, row_number() OVER (ORDER BY c.timestamp, c.id) AS rn
+                FROM comments c
+                WHERE c.reply_to = t.id
+                ORDER BY c.timestamp, c.id
+                LIMIT :reply_fetch
+            ) r
+            -- The extra look-ahead rows are not expanded
+            WHERE t.depth < :max_depth AND t.rn <= CASE WHEN t.depth = 1 THEN :root_fetch - 1 ELSE :reply_fetch - 1 END
+        )
+        SELECT * FROM thread
+        ORDER BY depth, timestamp, id
+    """
+
+
+def _render(rows, limit: int, replies: int) -> tuple[list[dict], Optional[str]]:
+    """Nest rows (ordered by depth) into CommentOut dicts in one pass"""
+    nodes = {}
+    top = []
+    next_cursor = None
+    # Last rendered row of each sibling group, keyed by parent (None for the top level)
+    tails = {}
+    for row in rows:
+        parent = None if row.depth == 1 else row.reply_to
+        if row.rn > (limit if parent is None else replies):
+            tail = tails.get(parent)
+            cursor = encode_cursor(tail.timestamp, tail.id) if tail else START_CURSOR
+            if parent is None:
+                next_cursor = cursor
+            else:
+                nodes[parent]["replies_cursor"] = cursor
+            continue
+
+        node = comment_to_dict(row)
+        nodes[row.id] = node
+        (top if parent is None else nodes[parent]["replies"]).append(node)
+        tails[parent] = row
+    return top, next_cursor
+
+
+async def _load(
+    db: AsyncSession, roots: str, params: dict, page: PageParams, max_depth: int, replies: int
+) -> tuple[list[dict], Optional[str]]:
+    params = {**params, "root_fetch": page.limit + 1, "reply_fetch": replies + 1, "max_depth": max_depth}
+    if page.cursor:
+        params["after_timestamp"], params["after_id"] = decode_cursor(page.cursor)
+    result = await db.execute(text(_thread_sql(roots, after=bool(page.cursor))), params)
+    return _render(result.all(), page.limit, replies)
+
+
+# ------------ PUBLIC ------------ #
+
+async def get_thread(
+    db: AsyncSession, post_id: int, page: PageParams, max_depth: int, replies: int
+) -> dict:
+    """One page of a post's top-level comments with their reply trees, read through Redis"""
+    key = thread_key(post_id)
+    field = f"{page.cursor or ''}|{page.limit}|{max_depth}|{replies}"
+    try:
+        raw = await redis_binary.hget(key, field)
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="thread")
+        raw = None
+    thread = decode_or_none(raw)
+    if thread is not None:
+        metrics.inc("cache_hits_total", entity="thread")
+        return thread
+
+    metrics.inc("cache_misses_total", entity="thread")
+    try:
+        token = await _lease_script(keys=[lease_key(key)], args=[uuid.uuid4().hex, LEASE_MS])
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="thread")
+        token = None
+    items, next_cursor = await _load(
+        db, "c.post_id = :post_id AND c.reply_to IS NULL", {"post_id": post_id}, page, max_depth, replies
+    )
+    thread = {"items": items, "next_cursor": next_cursor}
+    if token is None:
+        return thread
+    try:
+        if not await _fill_script(keys=[key, lease_key(key)], args=[token, field, encode(thread), THREAD_TTL]):
+            metrics.inc("cache_stale_loads_total", entity="thread")
+    except RedisError:
+        metrics.inc("cache_errors_total", entity="thread")
+    return thread
+
+
+async def get_replies(
+    db: AsyncSession, comment_id: int, page: PageParams, max_depth: int, replies: int
+) -> dict:
+    """Load more: the next page of a comment's replies, each with its own subtree"""
+    items, next_cursor = await _load(
+        db, "c.reply_to = :comment_id", {"comment_id": comment_id}, page, max_depth, replies
+    )
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def invalidate_threads(post_ids: list[int]):
+    """Drop every cached render of these posts' threads (after comments are added or removed)"""
+    if post_ids:
+        keys = [thread_key(post_id) for post_id in post_ids]
+        await redis_client.delete(*keys, *[lease_key(key) for key in keys])
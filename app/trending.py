@@ -0,0 +1,299 @@
+"""
+Trending posts: forward-decayed engagement scores in Redis sorted sets
+
+    python -m app.trending rebuild
+    python -m app.trending compact
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.models import post_category
+from app.redis_cache import PIPELINE_BATCH, redis_client
+
+# Window name -> half-life in seconds
+WINDOWS = {"1h": 3600, "24h": 24 * 3600, "7d": 7 * 24 * 3600}
+WEIGHTS = {
+    "like": float(os.getenv("TRENDING_LIKE_WEIGHT", "1")),
+    "save": float(os.getenv("TRENDING_SAVE_WEIGHT", "2")),
+    "comment": float(os.getenv("TRENDING_COMMENT_WEIGHT", "3")),
+}
+# Entries whose decayed score falls below this are dropped by compaction
+MIN_SCORE = float(os.getenv("TRENDING_MIN_SCORE", "0.05"))
+MAX_SIZE = int(os.getenv("TRENDING_MAX_SIZE", "10000"))
+# Seconds between compactions (a periodic job in app.worker); 0 leaves it to the CLI
+COMPACT_INTERVAL = float(os.getenv("TRENDING_COMPACT_INTERVAL", "300"))
+# Rebuilds only look this many half-lives back; older events weigh under 1/2**n
+REBUILD_HALF_LIVES = 6
+
+CATEGORIES_SET = "trending:categories"
+# Present while the sets are in a known-good state; missing after a Redis flush
+BUILT_KEY = "trending:built"
+
+
+def leaderboard_key(window: str, category_id: Optional[int] = None) -> str:
+    if category_id is None:
+        return f"trending:{window}"
+    return f"trending:{window}:category:{category_id}"
+
+
+def epoch_key(window: str) -> str:
+    return f"trending:epoch:{window}"
+
+
+def post_categories_key(post_id: int) -> str:
+    return f"trending:post_categories:{post_id}"
+
+
+# Scores grow by 2x per half-life since the epoch; a bump this many half-lives past it rescales first,
+# so a window whose compaction stopped can't overflow (2 ** 1024 is about 42 days of the 1h window)
+MAX_HALF_LIVES = 64
+
+# Lua: rescale every set of a window to a new epoch; returns the window's set keys
+_RESCALE_LUA = """
+local function rescale(window, half, now)
+    local epoch = tonumber(redis.call('GET', 'trending:epoch:' .. window) or now)
+    local factor = 2 ^ ((epoch - tonumber(now)) / half)
+    local keys = {'trending:' .. window}
+    for _, category in ipairs(redis.call('SMEMBERS', 'trending:categories')) do
+        keys[#keys + 1] = 'trending:' .. window .. ':category:' .. category
+    end
+    for _, key in ipairs(keys) do
+        if redis.call('EXISTS', key) == 1 then
+            redis.call('ZUNIONSTORE', key, 1, key, 'WEIGHTS', factor)
+        end
+    end
+    redis.call('SET', 'trending:epoch:' .. window, now)
+    return keys
+end
+"""
+
+# KEYS[1]: the post's category set. ARGV: post id, weight, now, max half-lives, then (window, half-life) pairs.
+# Key names are derived in the script, so this assumes a single Redis instance, not a cluster.
+_bump_script = redis_client.register_script(_RESCALE_LUA + """
+local categories = redis.call('SMEMBERS', KEYS[1])
+local now = tonumber(ARGV[3])
+for i = 5, #ARGV, 2 do
+    local window, half = ARGV[i], tonumber(ARGV[i + 1])
+    redis.call('SET', 'trending:epoch:' .. window, ARGV[3], 'NX')
+    local exponent = (now - tonumber(redis.call('GET', 'trending:epoch:' .. window))) / half
+    if exponent > tonumber(ARGV[4]) then
+        rescale(window, half, ARGV[3])
+        exponent = 0
+    end
+    local increment = tonumber(ARGV[2]) * 2 ^ exponent
+    redis.call('ZINCRBY', 'trending:' .. window, increment, ARGV[1])
+    for _, category in ipairs(categories) do
+        redis.call('ZINCRBY', 'trending:' .. window .. ':category:' .. category, increment, ARGV[1])
+    end
+end
+""")
+
+# Rescale one window to a new epoch and drop decayed / overflow entries.
+# ARGV: window, half-life, now, min score, max size
+_compact_script = redis_client.register_script(_RESCALE_LUA + """
+local removed = 0
+for _, key in ipairs(rescale(ARGV[1], tonumber(ARGV[2]), ARGV[3])) do
+    if redis.call('EXISTS', key) == 1 then
+        removed = removed + redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. ARGV[4])
+        removed = removed + redis.call('ZREMRANGEBYRANK', key, 0, -tonumber(ARGV[5]) - 1)
+    end
+end
+return removed
+""")
+
+
+# ------------ WRITE PATH ------------ #
+
+async def record(post_id: int, kind: str, count: int = 1):
+    """Add count engagement events of kind ("like", "save", "comment") to a post's scores.
+
+    Negative counts take events back out (e.g. an unlike), at the current time's weight.
+    Trending is best-effort: Redis errors are counted, not raised.
+    """
+    args = [post_id, WEIGHTS[kind] * count, time.time(), MAX_HALF_LIVES]
+    for window, half_life in WINDOWS.items():
+        args += [window, half_life]
+    try:
+        await _bump_script(keys=[post_categories_key(post_id)], args=args)
+    except RedisError:
+        metrics.inc("trending_errors_total")
+
+
+async def record_many(kind: str, counts: dict[int, int]):
+    for post_id, count in counts.items():
+        if count:
+            await record(post_id, kind, count)
+
+
+async def set_post_categories(post_id: int, category_ids: list[int]):
+    """Remember which per-category leaderboards a post's events go to"""
+    key = post_categories_key(post_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        if category_ids:
+            pipe.sadd(key, *category_ids)
+            pipe.sadd(CATEGORIES_SET, *category_ids)
+        await pipe.execute()
+
+
+async def forget_posts(post_ids: list[int]):
+    """Remove deleted posts from every leaderboard"""
+    if not post_ids:
+        return
+    categories = await redis_client.smembers(CATEGORIES_SET)
+    keys = [
+        leaderboard_key(window, category)
+        for window in WINDOWS
+        for category in [None, *categories]
+    ]
+    members = [str(post_id) for post_id in post_ids]
+    for start in range(0, len(members), PIPELINE_BATCH):
+        chunk = members[start:start + PIPELINE_BATCH]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zrem(key, *chunk)
+            pipe.delete(*[post_categories_key(int(post_id)) for post_id in chunk])
+            await pipe.execute()
+
+
+# ------------ READ PATH ------------ #
+
+async def top(window: str, limit: int, category_id: Optional[int] = None) -> list[tuple[int, float]]:
+    """Highest-scoring (post id, current decayed score) pairs, skipping entries compaction would drop"""
+    epoch = await redis_client.get(epoch_key(window))
+    if epoch is None:
+        return []
+    # Stored scores are in units of the epoch; bring them to now
+    factor = 2 ** ((float(epoch) - time.time()) / WINDOWS[window])
+    entries = await redis_client.zrevrangebyscore(
+        leaderboard_key(window, category_id), "+inf", MIN_SCORE / factor, start=0, num=limit, withscores=True
+    )
+    return [(int(post_id), score * factor) for post_id, score in entries]
+
+
+# ------------ MAINTENANCE ------------ #
+
+async def compact() -> int:
+    """Rescale every leaderboard to now and drop decayed entries; returns how many were removed"""
+    now = time.time()
+    removed = 0
+    for window, half_life in WINDOWS.items():
+        removed += await _compact_script(args=[window, half_life, now, MIN_SCORE, MAX_SIZE])
+    metrics.inc("trending_compacted_entries_total", removed)
+    return removed
+
+
+def _rebuild_sql(half_life: int) -> str:
+    return f"""
+        WITH events AS (
+            SELECT post_id, timestamp, CAST(:like_weight AS float8) AS weight FROM post_likes WHERE timestamp > :since
+            UNION ALL
+            SELECT post_id, timestamp, CAST(:save_weight AS float8) FROM post_saves WHERE timestamp > :since
+            UNION ALL
+            SELECT post_id, timestamp, CAST(:comment_weight AS float8) FROM comments WHERE timestamp > :since
+        ), scores AS (
+            SELECT post_id, sum(weight * power(2, extract(epoch FROM timestamp - :now) / {half_life})) AS score
+            FROM events
+            GROUP BY post_id
+        ), ranked AS (
+            SELECT NULL::integer AS category_id, post_id, score,
+                   row_number() OVER (ORDER BY score DESC) AS rank
+            FROM scores
+            UNION ALL
+            SELECT pc.category_id, s.post_id, s.score,
+                   row_number() OVER (PARTITION BY pc.category_id ORDER BY s.score DESC)
+            FROM scores s JOIN post_category pc ON pc.post_id = s.post_id
+        )
+        SELECT category_id, post_id, score FROM ranked WHERE rank <= :max_size AND score >= :min_score
+    """
+
+
+async def rebuild(db: AsyncSession):
+    """Recompute every leaderboard from Postgres, e.g. after Redis lost them"""
+    now = datetime.utcnow()
+    now_epoch = time.time()
+
+    # Post -> categories sets, so new events reach the per-category boards
+    rows = (await db.execute(select(post_category.c.post_id, post_category.c.category_id))).all()
+    post_categories: dict[int, list[int]] = {}
+    for post_id, category_id in rows:
+        post_categories.setdefault(post_id, []).append(category_id)
+    items = list(post_categories.items())
+    for start in range(0, len(items), PIPELINE_BATCH):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for post_id, category_ids in items[start:start + PIPELINE_BATCH]:
+                pipe.delete(post_categories_key(post_id))
+                pipe.sadd(post_categories_key(post_id), *category_ids)
+            await pipe.execute()
+    categories = sorted({category for _, category in rows})
+    if categories:
+        await redis_client.sadd(CATEGORIES_SET, *categories)
+
+    for window, half_life in WINDOWS.items():
+        result = await db.execute(text(_rebuild_sql(half_life)), {
+            "since": now - timedelta(seconds=half_life * REBUILD_HALF_LIVES),
+            "now": now,
+            "like_weight": WEIGHTS["like"],
+            "save_weight": WEIGHTS["save"],
+            "comment_weight": WEIGHTS["comment"],
+            "max_size": MAX_SIZE,
+            "min_score": MIN_SCORE,
+        })
+        boards: dict[str, dict[str, float]] = {}
+        for category_id, post_id, score in result.all():
+            boards.setdefault(leaderboard_key(window, category_id), {})[str(post_id)] = float(score)
+
+        # Build under temporary names and swap them in, so readers never see a half-built board
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for key in [leaderboard_key(window), *[leaderboard_key(window, c) for c in categories]]:
+                if key not in boards:
+                    pipe.delete(key)
+            for key, scores in boards.items():
+                pipe.delete(f"{key}:rebuild")
+                pipe.zadd(f"{key}:rebuild", scores)
+                pipe.rename(f"{key}:rebuild", key)
+            # Rebuilt scores are relative to now
+            pipe.set(epoch_key(window), now_epoch)
+            await pipe.execute()
+
+    await redis_client.set(BUILT_KEY, now_epoch)
+    metrics.inc("trending_rebuilds_total")
+
+
+async def maintain():
+    """Compact, rebuilding first if Redis lost the leaderboards; run every COMPACT_INTERVAL by app.worker"""
+    from app.database import AsyncSessionLocal
+
+    if not await redis_client.exists(BUILT_KEY):
+        async with AsyncSessionLocal() as db:
+            await rebuild(db)
+    await compact()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "compact"])
+    args = parser.parse_args()
+
+    from app.database import AsyncSessionLocal, engine
+
+    if args.command == "rebuild":
+        async with AsyncSessionLocal() as db:
+            await rebuild(db)
+        print("rebuilt")
+    else:
+        print(f"removed {await compact()} entries")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Job worker (see app.jobs and app.tasks). Run one or more next to the API:
+
+    python -m app.worker --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import time
+import traceback
+
+from app import jobs, metrics, tasks  # noqa: F401 - tasks registers the jobs
+from app.database import engine
+
+logger = logging.getLogger("app.worker")
+
+CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+SHUTDOWN_GRACE = float(os.getenv("WORKER_SHUTDOWN_GRACE", "30"))
+# A claimed job whose per-job concurrency is used up goes back to the queue for this long
+DEFER_DELAY = float(os.getenv("WORKER_DEFER_DELAY", "1"))
+
+
+class Worker:
+    def __init__(self, concurrency: int = CONCURRENCY):
+        self.slots = asyncio.Semaphore(concurrency)
+        # Per-job limits from @job(concurrency=...)
+        self.job_slots = {
+            name: asyncio.Semaphore(spec.concurrency) for name, spec in jobs.registry.items() if spec.concurrency
+        }
+        self.running: dict[str, asyncio.Task] = {}
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        heartbeat = asyncio.create_task(self._heartbeat())
+        last_slots: dict[str, int] = {}
+        try:
+            while not self.stopping.is_set():
+                await self.slots.acquire()
+                if self.stopping.is_set():
+                    self.slots.release()
+                    break
+                try:
+                    await jobs.schedule_periodic(last_slots)
+                    await jobs.promote()
+                    claimed = await jobs.claim()
+                except Exception:
+                    logger.exception("polling failed")
+                    claimed = None
+                if claimed is None:
+                    self.slots.release()
+                    await self._sleep(POLL_INTERVAL)
+                    continue
+                job_id, name = claimed[:2]
+                job_slot = self.job_slots.get(name)
+                if job_slot is not None:
+                    if job_slot.locked():
+                        # Waiting here would hold a worker slot that other jobs could use
+                        await self._defer(job_id, name)
+                        continue
+                    # Doesn't block: the slot is free
+                    await job_slot.acquire()
+                self.running[job_id] = asyncio.create_task(self._execute(*claimed))
+        finally:
+            if self.running:
+                logger.info("waiting for %d running jobs", len(self.running))
+                await asyncio.wait(list(self.running.values()), timeout=SHUTDOWN_GRACE)
+            heartbeat.cancel()
+
+    async def _execute(self, job_id: str, name: str, kwargs: dict, attempt: int, max_attempts: int):
+        spec = jobs.registry.get(name)
+        started = time.perf_counter()
+        try:
+            if spec is None:
+                raise LookupError(f"unknown job {name!r}")
+            if attempt > max_attempts:
+                raise RuntimeError("lease expired on the last attempt")
+            await asyncio.wait_for(spec.func(**kwargs), spec.timeout)
+        except Exception as exc:
+            retried = await jobs.retry_or_fail(job_id, name, attempt, max_attempts, traceback.format_exc())
+            metrics.inc("jobs_retried_total" if retried else "jobs_failed_total", job=name)
+            logger.warning("job %s %s attempt %d/%d failed: %r", name, job_id, attempt, max_attempts, exc)
+        else:
+            await jobs.complete(job_id)
+            metrics.inc("jobs_completed_total", job=name)
+        finally:
+            metrics.inc("jobs_seconds_total", time.perf_counter() - started, job=name)
+            self.running.pop(job_id, None)
+            if name in self.job_slots:
+                self.job_slots[name].release()
+            self.slots.release()
+
+    async def _defer(self, job_id: str, name: str):
+        try:
+            await jobs.defer(job_id, DEFER_DELAY)
+            metrics.inc("jobs_deferred_total", job=name)
+        except Exception:
+            # Left in jobs:running, so it comes back once its lease expires
+            logger.exception("deferring job %s failed", job_id)
+        finally:
+            self.slots.release()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(jobs.LEASE / 3)
+            try:
+                await jobs.renew(list(self.running))
+            except Exception:
+                logger.exception("lease renewal failed")
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    worker = Worker(args.concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stopping.set)
+    logger.info("running %d job types, %d periodic", len(jobs.registry), len(jobs.periodic_jobs))
+    try:
+        await worker.run()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
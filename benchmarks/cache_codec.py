@@ -0,0 +1,129 @@
+"""
+Bytes per key and encode/decode cost of cached values under each app.codec setting
+
+    python -m benchmarks.cache_codec --iterations 20000
+    python -m benchmarks.cache_codec --redis
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import codec
+from app.redis_cache import redis_binary
+
+WORDS = "the a post about coffee music travel photo today new great love city night game team food".split()
+SETTINGS = [
+    ("orjson", "none"), ("orjson", "zlib"), ("orjson", "lz4"),
+    ("msgpack", "none"), ("msgpack", "zlib"), ("msgpack", "lz4"),
+]
+
+
+def text(rng: random.Random, size: int) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def post(rng: random.Random, size: int) -> dict:
+    return {
+        "id": rng.randrange(10 ** 7),
+        "user_id": rng.randrange(10 ** 6),
+        "content": text(rng, size),
+        "timestamp": (datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(10 ** 7))).isoformat(),
+        "like_count": rng.randrange(10 ** 4),
+        "save_count": rng.randrange(10 ** 3),
+        "comment_count": rng.randrange(10 ** 3),
+    }
+
+
+def thread(rng: random.Random, comments: int) -> dict:
+    def node(depth: int) -> dict:
+        return {
+            "id": rng.randrange(10 ** 7),
+            "post_id": rng.randrange(10 ** 7),
+            "user_id": rng.randrange(10 ** 6),
+            "content": text(rng, 120),
+            "timestamp": datetime(2024, 1, 1).isoformat(),
+            "reply_to": None,
+            "like_count": rng.randrange(100),
+            "reply_count": 2 if depth < 2 else 0,
+            "replies": [node(depth + 1) for _ in range(2)] if depth < 2 else [],
+            "replies_cursor": None,
+        }
+    return {"items": [node(0) for _ in range(comments)], "next_cursor": "MjAyNC0wMS0wMVQwMDowMDowMHwxMjM0"}
+
+
+def samples() -> dict[str, object]:
+    rng = random.Random(7)
+    return {
+        "post (100 B body)": post(rng, 100),
+        "post (1 KB body)": post(rng, 1000),
+        "post (8 KB body)": post(rng, 8000),
+        "user": {"id": 123456, "name": "someone", "is_verified": False},
+        "interaction": {"type": "like", "post_id": 1234567, "timestamp": datetime(2024, 1, 1, 12).isoformat()},
+        "thread page (10 roots)": thread(rng, 10),
+    }
+
+
+def per_op_us(func, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def legacy_row(value, iterations: int) -> tuple[int, float, float]:
+    raw = json.dumps(value).encode()
+    encode_us = per_op_us(lambda v: json.dumps(v).encode(), value, iterations)
+    decode_us = per_op_us(lambda r: json.loads(r.decode()), raw, iterations)
+    return len(raw), encode_us, decode_us
+
+
+async def memory_usage(key: str, raw: bytes):
+    await redis_binary.set(key, raw)
+    try:
+        return await redis_binary.memory_usage(key)
+    except Exception:
+        return None
+    finally:
+        await redis_binary.delete(key)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--compress-min-bytes", type=int, default=codec.COMPRESS_MIN_BYTES)
+    parser.add_argument("--redis", action="store_true", help="also report Redis MEMORY USAGE per key")
+    args = parser.parse_args()
+
+    available = []
+    for name, compression in SETTINGS:
+        try:
+            available.append((f"{name}+{compression}", codec.Codec(name, compression, args.compress_min_bytes)))
+        except ValueError as exc:
+            print(f"skipping {name}+{compression}: {exc}")
+
+    for label, value in samples().items():
+        print(f"\n{label}")
+        print(f"  {'codec':<16} {'bytes':>7} {'redis':>7} {'encode us':>10} {'decode us':>10}")
+        size, encode_us, decode_us = legacy_row(value, args.iterations)
+        memory = await memory_usage("bench:codec", json.dumps(value).encode()) if args.redis else None
+        print(f"  {'json (old)':<16} {size:>7} {memory or '-':>7} {encode_us:>10.2f} {decode_us:>10.2f}")
+        for name, current in available:
+            raw = current.encode(value)
+            assert codec.decode(raw) == value
+            memory = await memory_usage("bench:codec", raw) if args.redis else None
+            print(
+                f"  {name:<16} {len(raw):>7} {memory or '-':>7} "
+                f"{per_op_us(current.encode, value, args.iterations):>10.2f} "
+                f"{per_op_us(codec.decode, raw, args.iterations):>10.2f}"
+            )
+    await redis_binary.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+Cold start of the API server: time to /health/ready, then the latency of its first requests
+
+    python -m benchmarks.cold_start --workers 2 --runs 3
+    python -m benchmarks.cold_start --modes server warm --requests 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import asyncpg
+import httpx
+
+from app.importer import asyncpg_dsn
+
+MODES = {
+    "dev": (["-m", "uvicorn", "app.main:app"], {"SCHEMA_MODE": "create"}),
+    "server": (["-m", "app.server"], {"SCHEMA_MODE": "check", "STARTUP_WARM_CACHE": "false"}),
+    "warm": (["-m", "app.server"], {"SCHEMA_MODE": "check", "STARTUP_WARM_CACHE": "true"}),
+}
+READY_TIMEOUT = 120
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    return f"p50 {statistics.median(samples):7.1f} ms  p95 {samples[max(int(len(samples) * 0.95) - 1, 0)]:7.1f} ms"
+
+
+async def targets(count: int) -> list[str]:
+    conn = await asyncpg.connect(asyncpg_dsn(os.environ["DATABASE_URL"]))
+    try:
+        posts = [row["id"] for row in await conn.fetch("SELECT id FROM posts ORDER BY id DESC LIMIT 200")]
+        users = [row["id"] for row in await conn.fetch("SELECT id FROM users ORDER BY id DESC LIMIT 200")]
+    finally:
+        await conn.close()
+    rng = random.Random(1)
+    paths = ["/trending?window=24h", "/trending?window=7d", "/categories/"]
+    paths += [f"/posts/{post_id}" for post_id in posts] + [f"/users/{user_id}" for user_id in users]
+    return [rng.choice(paths) for _ in range(count)]
+
+
+def start(mode: str, port: int, workers: int) -> subprocess.Popen:
+    args, env = MODES[mode]
+    command = [sys.executable, *args, "--port", str(port), "--workers", str(workers)]
+    return subprocess.Popen(
+        command, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen) -> float:
+    began = time.perf_counter()
+    while time.perf_counter() - began < READY_TIMEOUT:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode} before it was ready")
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return time.perf_counter() - began
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.02)
+    raise RuntimeError(f"server not ready after {READY_TIMEOUT}s")
+
+
+async def burst(client: httpx.AsyncClient, paths: list[str], concurrency: int) -> tuple[float, list[float], int]:
+    """Latencies of paths sent by `concurrency` clients; also the first response's and the error count"""
+    queue = list(reversed(paths))
+    samples, errors = [], 0
+
+    async def run():
+        nonlocal errors
+        while queue:
+            path = queue.pop()
+            started = time.perf_counter()
+            response = await client.get(path)
+            samples.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code >= 500
+
+    await asyncio.gather(*[run() for _ in range(concurrency)])
+    return samples[0], samples, errors
+
+
+def stop(process: subprocess.Popen) -> float:
+    began = time.perf_counter()
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    return time.perf_counter() - began
+
+
+async def measure(mode: str, args, paths: list[str]) -> tuple[float, float, list[float], int, float]:
+    process = start(mode, args.port, args.workers)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+            ready = await wait_ready(client, process)
+            first, samples, errors = await burst(client, paths, args.concurrency)
+    finally:
+        stopped = stop(process)
+    return ready, first, samples, errors, stopped
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200, help="requests in the burst after ready")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    paths = await targets(args.requests)
+    for mode in args.modes:
+        for run in range(1, args.runs + 1):
+            ready, first, samples, errors, stopped = await measure(mode, args, paths)
+            print(f"{mode:<7} run {run}  ready {ready:6.2f}s  first {first:7.1f} ms  burst {percentiles(samples)}"
+                  f"  5xx {errors}  stop {stopped:5.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Home-feed latency of the Redis timelines vs a naive SELECT ... ORDER BY timestamp
+
+    python -m benchmarks.feed_latency --users 2000 --posts 200000 --reads 2000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from app import feed
+from app.database import AsyncSessionLocal, engine
+from app.models import Base, Follow, Post, User
+from app.redis_cache import redis_client
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def seed(users: int, follows_per_user: int, posts: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            insert(User).returning(User.id), [{"name": f"bench-{i}"} for i in range(users)]
+        )
+        user_ids = result.scalars().all()
+
+        follows = set()
+        for follower in user_ids:
+            for followee in random.sample(user_ids, follows_per_user):
+                if followee != follower:
+                    follows.add((follower, followee))
+        await db.execute(
+            insert(Follow), [{"follower_id": a, "followee_id": b} for a, b in follows]
+        )
+
+        now = datetime.utcnow()
+        for start in range(0, posts, 10000):
+            rows = [
+                {
+                    "user_id": random.choice(user_ids),
+                    "content": "benchmark post",
+                    "timestamp": now - timedelta(seconds=random.randint(0, 30 * 24 * 3600)),
+                }
+                for _ in range(min(10000, posts - start))
+            ]
+            await db.execute(insert(Post), rows)
+        await db.commit()
+    return user_ids
+
+
+async def naive_feed(db, user_id: int, limit: int):
+    followees = select(Follow.followee_id).where(Follow.follower_id == user_id)
+    result = await db.execute(
+        select(Post)
+        .where((Post.user_id == user_id) | Post.user_id.in_(followees))
+        .order_by(Post.timestamp.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def measure(label: str, reader, user_ids: list[int], reads: int, limit: int):
+    samples = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(reads):
+            user_id = random.choice(user_ids)
+            start = time.perf_counter()
+            await reader(db, user_id, limit)
+            samples.append((time.perf_counter() - start) * 1000)
+            await db.rollback()
+    print(
+        f"{label:<10} p50={percentile(samples, 50):7.2f}ms  "
+        f"p99={percentile(samples, 99):7.2f}ms  mean={statistics.mean(samples):7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--follows-per-user", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    user_ids = await seed(args.users, args.follows_per_user, args.posts)
+    print(f"seeded {len(user_ids)} users, {args.posts} posts")
+
+    # Materialize timelines up front so the run measures steady-state reads
+    async with AsyncSessionLocal() as db:
+        for user_id in user_ids:
+            await feed.get_feed(db, user_id, args.limit)
+
+    await measure("naive", naive_feed, user_ids, args.reads, args.limit)
+    await measure("timeline", feed.get_feed, user_ids, args.reads, args.limit)
+
+    await redis_client.aclose()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+Follow graph queries on a synthetic power-law graph, cold, warm and as a Postgres join
+
+    python -m benchmarks.follow_graph --users 200000 --edges 5000000
+    python -m benchmarks.follow_graph --skip-seed --iterations 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import func, select, text
+
+from app import follows
+from app.database import AsyncSessionLocal, engine
+from app.models import Follow, User
+from app.pagination import PageParams
+
+CHUNK = 500_000
+NAME = "graph-bench"
+
+
+async def seed(users: int, edges: int, skew: float) -> tuple[int, int]:
+    async with AsyncSessionLocal() as db:
+        first = (await db.execute(text(
+            "INSERT INTO users (name) SELECT :name || g FROM generate_series(1, :users) g RETURNING id"
+        ), {"name": f"{NAME}-", "users": users})).scalars().all()
+        await db.commit()
+    first, last = min(first), max(first)
+    print(f"seeded {users} users")
+
+    for start in range(0, edges, CHUNK):
+        began = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            # power(random(), skew) piles followees onto the lowest ids
+            await db.execute(text("""
+                INSERT INTO follows (follower_id, followee_id, timestamp)
+                SELECT follower, followee, now() - random() * interval '365 days' FROM (
+                    SELECT :first + floor(random() * :n)::int AS follower,
+                           :first + floor(power(random(), :skew) * :n)::int AS followee
+                    FROM generate_series(1, :count)
+                ) e
+                WHERE follower <> followee
+                ON CONFLICT DO NOTHING
+            """), {"first": first, "n": users, "skew": skew, "count": min(CHUNK, edges - start)})
+            await db.commit()
+        print(f"seeded {start + min(CHUNK, edges - start)} follows ({time.perf_counter() - began:.1f}s)")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("""
+            UPDATE users SET
+                follower_count = (SELECT count(*) FROM follows WHERE followee_id = users.id),
+                following_count = (SELECT count(*) FROM follows WHERE follower_id = users.id)
+            WHERE id BETWEEN :first AND :last
+        """), {"first": first, "last": last})
+        await db.commit()
+        await db.execute(text("ANALYZE follows"))
+        await db.execute(text("ANALYZE users"))
+    return first, last
+
+
+async def bench_range() -> tuple[int, int]:
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(func.min(User.id), func.max(User.id)).where(User.name.like(f"{NAME}-%"))
+        )).one()
+    return row[0], row[1]
+
+
+async def timed(label: str, iterations: int, call, prepare=None):
+    samples = []
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:
+            if prepare:
+                await prepare()
+            start = time.perf_counter()
+            result = await call(db)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(
+        f"{label:<44} p50 {statistics.median(samples):8.2f} ms  "
+        f"p95 {samples[max(int(len(samples) * 0.95) - 1, 0)]:8.2f} ms  {describe(result)}"
+    )
+
+
+def describe(result) -> str:
+    if isinstance(result, dict) and "count" in result:
+        return f"({result['count']} users)"
+    if isinstance(result, tuple):
+        return f"({len(result[0])} rows)"
+    return f"({result})" if isinstance(result, int) else ""
+
+
+async def set_queries(label: str, iterations: int, left: tuple[int, str], right: tuple[int, str], limit: int):
+    async def query(db):
+        return await follows._sample(db, await follows._intersect(db, left, right), limit)
+
+    async def postgres_only(db):
+        return await follows._sample(db, await follows._join(db, left, right), limit)
+
+    async def drop():
+        await follows.forget([left[0], right[0]])
+
+    await timed(f"{label}: cold", iterations, query, drop)
+    await timed(f"{label}: warm", iterations, query)
+    await timed(f"{label}: postgres only", iterations, postgres_only)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--edges", type=int, default=5_000_000)
+    parser.add_argument("--skew", type=float, default=4.0, help="higher concentrates more follows on fewer accounts")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the graph from a previous run")
+    args = parser.parse_args()
+
+    first, last = await bench_range() if args.skip_seed else await seed(args.users, args.edges, args.skew)
+    rng = random.Random(1)
+    async with AsyncSessionLocal() as db:
+        celebrity = (await db.execute(
+            select(User.id).where(User.id.between(first, last)).order_by(User.follower_count.desc()).limit(1)
+        )).scalar_one()
+        edges, top = (await db.execute(
+            select(func.sum(User.following_count), func.max(User.follower_count)).where(User.id.between(first, last))
+        )).one()
+        # A typical account: a random one outside the most-followed tenth
+        typical = (await db.execute(
+            select(User.id).where(User.id.between(first + (last - first) // 10, last), User.following_count > 0)
+            .order_by(func.abs(User.id - rng.randint(first, last))).limit(1)
+        )).scalar_one()
+        target = (await db.execute(
+            select(User.id).where(User.id.between(first, last), User.follower_count.between(200, follows.MAX_SET_SIZE))
+            .order_by(User.follower_count).limit(1)
+        )).scalar()
+    print(f"{last - first + 1} users, {edges} follows, largest account has {top} followers\n")
+
+    page = PageParams(cursor=None, limit=50)
+
+    async def deep_cursor(direction: str, user_id: int, pages: int) -> PageParams:
+        cursor = None
+        async with AsyncSessionLocal() as db:
+            for _ in range(pages):
+                _, cursor = await follows.list_page(db, user_id, direction, PageParams(cursor=cursor, limit=50))
+        return PageParams(cursor=cursor, limit=50)
+
+    deep = await deep_cursor("followers", celebrity, 200)
+    await timed("celebrity followers, first page", args.iterations,
+                lambda db: follows.list_page(db, celebrity, "followers", page))
+    await timed("celebrity followers, page 200", args.iterations,
+                lambda db: follows.list_page(db, celebrity, "followers", deep))
+    await timed("typical following, first page", args.iterations,
+                lambda db: follows.list_page(db, typical, "following", page))
+    await timed("celebrity follower count (users column)", args.iterations,
+                lambda db: db.scalar(select(User.follower_count).where(User.id == celebrity)))
+    await timed("celebrity follower count (count(*))", max(args.iterations // 4, 1),
+                lambda db: db.scalar(select(func.count()).where(Follow.followee_id == celebrity)))
+    await timed("relationship typical -> celebrity", args.iterations,
+                lambda db: follows.relationship(db, typical, celebrity))
+    print()
+    await set_queries("mutuals (typical)", args.iterations, (typical, "following"), (typical, "followers"), 10)
+    await set_queries("mutuals (celebrity)", args.iterations, (celebrity, "following"), (celebrity, "followers"), 10)
+    await set_queries("followed-by typical -> celebrity", args.iterations, (typical, "following"), (celebrity, "followers"), 3)
+    if target:
+        await set_queries(f"followed-by typical -> {target}", args.iterations, (typical, "following"), (target, "followers"), 3)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
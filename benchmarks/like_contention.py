@@ -0,0 +1,88 @@
+"""
+Hammer a single (post, user) pair with concurrent like/unlike/save requests and
+check that exactly one row and a consistent counter survive.
+
+Drives the app in-process through httpx's ASGI transport (or a running server
+with --url). Needs DATABASE_URL and Redis like the app itself.
+
+    python -m benchmarks.like_contention --tasks 200
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import func, select
+
+from app.database import AsyncSessionLocal, engine
+from app.main import app
+from app.models import Base, Post, PostLike, PostSave
+
+
+async def hammer(client: httpx.AsyncClient, method: str, url: str, tasks: int, json: dict) -> Counter:
+    start = time.perf_counter()
+    responses = await asyncio.gather(*[client.request(method, url, json=json) for _ in range(tasks)])
+    elapsed = time.perf_counter() - start
+    statuses = Counter(response.status_code for response in responses)
+    print(f"{method} {url:<28} x{tasks}: {dict(statuses)} in {elapsed * 1000:.0f}ms")
+    return statuses
+
+
+async def state(post_id: int, user_id: int) -> tuple[int, int, int, int]:
+    async with AsyncSessionLocal() as db:
+        likes = await db.scalar(
+            select(func.count()).where(PostLike.post_id == post_id, PostLike.user_id == user_id)
+        )
+        saves = await db.scalar(
+            select(func.count()).where(PostSave.post_id == post_id, PostSave.user_id == user_id)
+        )
+        post = await db.get(Post, post_id)
+        return likes, post.like_count, saves, post.save_count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--url", help="base URL of a running server (default: in-process ASGI)")
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async with client:
+        user = (await client.post("/users/", json={"name": "contention"})).json()
+        post = (await client.post("/posts/", json={"user_id": user["id"], "content": "hot"})).json()
+        pair = {"post_id": post["id"], "user_id": user["id"]}
+
+        failures = []
+        for method, url, body in [
+            ("POST", f"/posts/{post['id']}/like", {"user_id": user["id"]}),
+            ("POST", f"/posts/{post['id']}/save", {"user_id": user["id"]}),
+        ]:
+            statuses = await hammer(client, method, url, args.tasks, body)
+            if set(statuses) != {200}:
+                failures.append(f"{method} {url} returned {dict(statuses)}")
+        if await state(**pair) != (1, 1, 1, 1):
+            failures.append(f"after likes/saves: rows and counters are {await state(**pair)}, expected all 1")
+
+        await hammer(client, "DELETE", "/post/like/", args.tasks, pair)
+        await hammer(client, "DELETE", "/post/save/", args.tasks, pair)
+        if await state(**pair) != (0, 0, 0, 0):
+            failures.append(f"after removals: rows and counters are {await state(**pair)}, expected all 0")
+
+    await engine.dispose()
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+    print("ok: one row per pair, counters consistent")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
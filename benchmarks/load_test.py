@@ -0,0 +1,435 @@
+"""
+Drive every API route with a weighted concurrent mix; throughput and p50/p95/p99 per endpoint
+
+    python -m benchmarks.load_test --duration 60 --concurrency 64 --output after.json --baseline before.json
+    python -m benchmarks.load_test --mix "GET /posts/{post_id}=50,POST /posts/{post_id}/like=50"
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+import httpx
+
+from app.importer import asyncpg_dsn
+from benchmarks import seed as seeding
+
+SAMPLE_SIZE = 20000
+BATCH_ITEMS = 50
+# Endpoints with fewer samples than this are reported but not compared
+MIN_SAMPLES = 20
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Workload:
+    """Ids to aim requests at, plus the rows this run created (for the delete routes)"""
+
+    def __init__(self, users: list[int], posts: list[int], comment_posts: dict[int, int], categories: list[int]):
+        self.users = users
+        self.posts = posts
+        # comment id -> its post id, so replies land on the right post
+        self.comment_posts = comment_posts
+        self.comments = list(comment_posts)
+        self.categories = categories
+        # Earlier posts in the sample are hotter, as in the seeded graph
+        self._post_weights = list(_cumulative(len(posts)))
+        self.created_users: list[int] = []
+        self.created_posts: list[int] = []
+        self.created_comments: list[int] = []
+
+    def user(self) -> int:
+        return random.choice(self.users)
+
+    def post(self) -> int:
+        return random.choices(self.posts, cum_weights=self._post_weights)[0]
+
+    def comment(self) -> int:
+        return random.choice(self.comments)
+
+    def pair(self) -> dict:
+        return {"post_id": self.post(), "user_id": self.user()}
+
+
+def _cumulative(n: int, exponent: float = 1.1):
+    total = 0.0
+    for rank in range(n):
+        total += 1 / (rank + 1) ** exponent
+        yield total
+
+
+# ------------ OPERATIONS ------------ #
+
+Call = Callable[[httpx.AsyncClient, Workload], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Operation:
+    name: str
+    weight: float
+    call: Call
+
+
+async def _delete(client: httpx.AsyncClient, url: str, body: dict) -> httpx.Response:
+    return await client.request("DELETE", url, json=body)
+
+
+async def _create_user(client, w):
+    response = await client.post("/users/", json={"name": "load-test"})
+    if response.status_code == 200:
+        w.created_users.append(response.json()["id"])
+    return response
+
+
+async def _create_post(client, w):
+    response = await client.post("/posts/", json={"user_id": w.user(), "content": "load test post"})
+    if response.status_code == 200:
+        w.created_posts.append(response.json()["id"])
+    return response
+
+
+async def _create_comment(client, w):
+    body = {"post_id": w.post(), "user_id": w.user(), "content": "load test comment"}
+    response = await client.post("/comments/", json=body)
+    if response.status_code == 200:
+        w.created_comments.append(response.json()["id"])
+    return response
+
+
+async def _reply(client, w):
+    comment_id = w.comment()
+    return await client.post("/comments/", json={
+        "post_id": w.comment_posts[comment_id], "user_id": w.user(),
+        "content": "load test reply", "reply_to": comment_id,
+    })
+
+
+async def _delete_created(client, w, created: list[int], url: str):
+    if not created:
+        return None
+    return await _delete(client, url, {"id": created.pop()})
+
+
+async def _create_category(client, w):
+    response = await client.post("/categories/", json={"title": f"lt{random.randrange(10 ** 12)}"})
+    if response.status_code == 200:
+        w.categories.append(response.json()["id"])
+    return response
+
+
+async def _assign_categories(client, w):
+    if not w.categories:
+        return None
+    chosen = random.sample(w.categories, min(len(w.categories), 3))
+    return await client.post("/posts/categories/assign", json={"post_id": w.post(), "category_ids": chosen})
+
+
+async def _browse_category(client, w):
+    if not w.categories:
+        return None
+    return await client.get(f"/categories/{random.choice(w.categories)}/posts")
+
+
+async def _filter_categories(client, w):
+    if not w.categories:
+        return None
+    chosen = random.sample(w.categories, min(len(w.categories), 2))
+    return await client.get("/categories/posts", params={"category_ids": chosen, "match": random.choice(["any", "all"])})
+
+
+def _batch(kind: str, make_item: Callable[[Workload], dict]) -> Call:
+    async def call(client, w):
+        return await client.post(f"/{kind}/batch", json={"items": [make_item(w) for _ in range(BATCH_ITEMS)]})
+    return call
+
+
+OPERATIONS = [
+    # Reads
+    Operation("GET /users/{user_id}", 10, lambda c, w: c.get(f"/users/{w.user()}")),
+    Operation("GET /posts/{post_id}", 15, lambda c, w: c.get(f"/posts/{w.post()}")),
+    Operation("GET /feed/{user_id}", 15, lambda c, w: c.get(f"/feed/{w.user()}")),
+    Operation("GET /users/{user_id}/posts", 5, lambda c, w: c.get(f"/users/{w.user()}/posts")),
+    Operation("GET /posts/{post_id}/likes", 3, lambda c, w: c.get(f"/posts/{w.post()}/likes")),
+    Operation("GET /posts/{post_id}/comments", 3, lambda c, w: c.get(f"/posts/{w.post()}/comments")),
+    Operation("GET /posts/{post_id}/saves", 2, lambda c, w: c.get(f"/posts/{w.post()}/saves")),
+    Operation("GET /posts/{post_id}/thread", 8, lambda c, w: c.get(f"/posts/{w.post()}/thread")),
+    Operation("GET /comments/{comment_id}/replies", 2, lambda c, w: c.get(f"/comments/{w.comment()}/replies")),
+    Operation("GET /comments/{comment_id}/details", 1, lambda c, w: c.get(f"/comments/{w.comment()}/details")),
+    Operation("GET /users/{user_id}/followers", 2, lambda c, w: c.get(f"/users/{w.user()}/followers")),
+    Operation("GET /users/{user_id}/mutuals", 1, lambda c, w: c.get(f"/users/{w.user()}/mutuals")),
+    Operation(
+        "GET /users/{user_id}/followed-by", 2,
+        lambda c, w: c.get(f"/users/{w.user()}/followed-by", params={"viewer_id": w.user()}),
+    ),
+    Operation("GET /categories/", 1, lambda c, w: c.get("/categories/")),
+    Operation("GET /categories/{category_id}/posts", 4, _browse_category),
+    Operation("GET /categories/posts", 1, _filter_categories),
+    Operation("GET /metrics", 0.2, lambda c, w: c.get("/metrics")),
+    # Writes
+    Operation("POST /users/", 1, _create_user),
+    Operation("POST /posts/", 3, _create_post),
+    Operation("POST /comments/", 3, _create_comment),
+    Operation("POST /comments/ (reply)", 1, _reply),
+    Operation("POST /posts/{post_id}/like", 8, lambda c, w: c.post(f"/posts/{w.post()}/like", json={"user_id": w.user()})),
+    Operation("DELETE /post/like/", 3, lambda c, w: _delete(c, "/post/like/", w.pair())),
+    Operation("POST /posts/{post_id}/save", 2, lambda c, w: c.post(f"/posts/{w.post()}/save", json={"user_id": w.user()})),
+    Operation("DELETE /post/save/", 1, lambda c, w: _delete(c, "/post/save/", w.pair())),
+    Operation(
+        "POST /comments/{comment_id}/like", 3,
+        lambda c, w: c.post(f"/comments/{w.comment()}/like", json={"user_id": w.user()}),
+    ),
+    Operation(
+        "POST /users/{user_id}/follow", 1,
+        lambda c, w: c.post(f"/users/{w.user()}/follow", json={"user_id": w.user()}),
+    ),
+    Operation(
+        "DELETE /user/follow/", 0.5,
+        lambda c, w: _delete(c, "/user/follow/", {"user_id": w.user(), "followee_id": w.user()}),
+    ),
+    Operation("POST /categories/", 0.1, _create_category),
+    Operation("POST /posts/categories/assign", 0.5, _assign_categories),
+    Operation("DELETE /post/", 0.5, lambda c, w: _delete_created(c, w, w.created_posts, "/post/")),
+    Operation("DELETE /comment/", 0.5, lambda c, w: _delete_created(c, w, w.created_comments, "/comment/")),
+    Operation("DELETE /user/", 0.2, lambda c, w: _delete_created(c, w, w.created_users, "/user/")),
+    # Bulk ingestion
+    Operation("POST /posts/batch", 0.2, _batch("posts", lambda w: {"user_id": w.user(), "content": "batch"})),
+    Operation(
+        "POST /comments/batch", 0.2,
+        _batch("comments", lambda w: {"post_id": w.post(), "user_id": w.user(), "content": "batch"}),
+    ),
+    Operation("POST /likes/batch", 0.2, _batch("likes", lambda w: w.pair())),
+    Operation("POST /saves/batch", 0.2, _batch("saves", lambda w: w.pair())),
+    Operation(
+        "POST /comment-likes/batch", 0.2,
+        _batch("comment-likes", lambda w: {"comment_id": w.comment(), "user_id": w.user()}),
+    ),
+]
+
+
+def parse_mix(spec: Optional[str]) -> list[Operation]:
+    """Override weights with "NAME=WEIGHT,..."; unnamed operations keep their defaults"""
+    if not spec:
+        return OPERATIONS
+    overrides = {}
+    for item in spec.split(","):
+        name, _, weight = item.rpartition("=")
+        overrides[name.strip()] = float(weight)
+    unknown = set(overrides) - {op.name for op in OPERATIONS}
+    if unknown:
+        sys.exit(f"unknown operations in --mix: {sorted(unknown)}")
+    return [Operation(op.name, overrides.get(op.name, op.weight), op.call) for op in OPERATIONS]
+
+
+# ------------ RUN ------------ #
+
+async def load_workload(dsn: str) -> Workload:
+    conn = await asyncpg.connect(dsn)
+    try:
+        users = [r["id"] for r in await conn.fetch("SELECT id FROM users ORDER BY random() LIMIT $1", SAMPLE_SIZE)]
+        # Most-liked first, so Workload.post() favours hot posts
+        posts = [r["id"] for r in await conn.fetch(
+            "SELECT id FROM posts ORDER BY like_count DESC, id LIMIT $1", SAMPLE_SIZE
+        )]
+        comments = {r["id"]: r["post_id"] for r in await conn.fetch(
+            "SELECT id, post_id FROM comments ORDER BY random() LIMIT $1", SAMPLE_SIZE
+        )}
+        categories = [r["id"] for r in await conn.fetch("SELECT id FROM categories LIMIT 100")]
+    finally:
+        await conn.close()
+    if not users or not posts or not comments:
+        sys.exit("database has no users/posts/comments; run python -m benchmarks.seed first or pass --seed")
+    return Workload(users, posts, comments, categories)
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    operations: list[Operation],
+    deadline: float,
+    measure_from: float,
+    samples: dict,
+    statuses: dict,
+):
+    weights = [op.weight for op in operations]
+    while time.perf_counter() < deadline:
+        op = random.choices(operations, weights=weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await op.call(client, workload)
+            status = response.status_code if response is not None else None
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        if status is None or start < measure_from:
+            continue
+        samples[op.name].append((time.perf_counter() - start) * 1000)
+        statuses[op.name][str(status)] += 1
+
+
+def summarize(samples: dict, statuses: dict, seconds: float) -> dict:
+    endpoints = {}
+    for name in sorted(samples):
+        latencies = samples[name]
+        codes = statuses[name]
+        errors = sum(n for code, n in codes.items() if not code.isdigit() or int(code) >= 500)
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": round(len(latencies) / seconds, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "statuses": dict(codes),
+        }
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    total = {
+        "requests": len(everything),
+        "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+        "rps": round(len(everything) / seconds, 2),
+        "p50_ms": round(percentile(everything, 50), 2) if everything else None,
+        "p95_ms": round(percentile(everything, 95), 2) if everything else None,
+        "p99_ms": round(percentile(everything, 99), 2) if everything else None,
+    }
+    return {"total": total, "endpoints": endpoints}
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<40} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, stats in rows:
+        print(
+            f"{name:<40} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} "
+            f"{stats['p50_ms'] or 0:>7.1f}ms {stats['p95_ms'] or 0:>7.1f}ms {stats['p99_ms'] or 0:>7.1f}ms"
+        )
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Endpoints whose p95 grew by more than threshold (a fraction) relative to the baseline"""
+    regressions = []
+    for name, stats in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if not before or min(stats["requests"], before["requests"]) < MIN_SAMPLES:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms "
+                f"(+{(stats['p95_ms'] / before['p95_ms'] - 1) * 100:.0f}%)"
+            )
+    if report["total"]["rps"] < baseline["total"]["rps"] * (1 - threshold):
+        regressions.append(f"total throughput {baseline['total']['rps']} -> {report['total']['rps']} req/s")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, operations: list[Operation]) -> dict:
+    dsn = asyncpg_dsn(os.environ["DATABASE_URL"])
+    if args.seed:
+        conn = await asyncpg.connect(dsn)
+        try:
+            await seeding.seed(conn, args.seed_users, 20, args.seed_users * 10, args.seed_users * 100,
+                               args.seed_users * 10, args.seed_users * 20, 8)
+        finally:
+            await conn.close()
+    workload = await load_workload(dsn)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+        lifespan = None
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+        # ASGITransport doesn't send lifespan events; run the startup/shutdown hooks ourselves
+        lifespan = app.router.lifespan_context(app)
+
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    if lifespan:
+        await lifespan.__aenter__()
+    try:
+        async with client:
+            start = time.perf_counter()
+            measure_from = start + args.warmup
+            deadline = measure_from + args.duration
+            await asyncio.gather(*[
+                worker(client, workload, operations, deadline, measure_from, samples, statuses)
+                for _ in range(args.concurrency)
+            ])
+    finally:
+        if lifespan:
+            await lifespan.__aexit__(None, None, None)
+
+    report = summarize(samples, statuses, args.duration)
+    report["meta"] = {
+        "commit": git_commit(),
+        "started": datetime.utcnow().isoformat(),
+        "target": args.url or "asgi",
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "concurrency": args.concurrency,
+        "mix": {op.name: op.weight for op in operations},
+    }
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server (default: in-process ASGI)")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", help='weight overrides, e.g. "GET /feed/{user_id}=40,POST /posts/=0"')
+    parser.add_argument("--seed", action="store_true", help="seed a synthetic graph before running")
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 slowdown, as a fraction")
+    parser.add_argument("--list", action="store_true", help="list operations and default weights")
+    args = parser.parse_args()
+
+    if args.list:
+        for op in OPERATIONS:
+            print(f"{op.weight:>6}  {op.name}")
+        return
+
+    random.seed(args.random_seed)
+    operations = parse_mix(args.mix)
+    report = await run(args, operations)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\nregressions beyond {args.threshold:.0%}:")
+            print("\n".join(f"  {line}" for line in regressions))
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,225 @@
+"""
+Monthly partitions vs one flat table for likes: inserts, recent-window counts, cursor pages and unlikes
+
+    python -m benchmarks.partitioning --rows 2000000 --months 12
+    python -m benchmarks.partitioning --rows 10000000 --batch 500 --iterations 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from app.importer import asyncpg_dsn
+from app.partitions import add_months, partition_name
+
+SCHEMA = "partition_bench"
+CHUNK = 500_000
+NOW = "(now() AT TIME ZONE 'utc')"
+
+SCHEMA_SQL = f"""
+    CREATE TABLE flat_likes (
+        id serial PRIMARY KEY,
+        post_id integer NOT NULL,
+        user_id integer NOT NULL,
+        timestamp timestamp NOT NULL DEFAULT {NOW},
+        CONSTRAINT unique_flat_like UNIQUE (post_id, user_id)
+    );
+    CREATE INDEX ON flat_likes (post_id, timestamp, id);
+    CREATE INDEX ON flat_likes (user_id);
+
+    CREATE TABLE part_likes (
+        id serial,
+        post_id integer NOT NULL,
+        user_id integer NOT NULL,
+        timestamp timestamp NOT NULL DEFAULT {NOW},
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+    CREATE INDEX ON part_likes (post_id, timestamp, id);
+    CREATE INDEX ON part_likes (user_id);
+    CREATE TABLE part_like_keys (
+        post_id integer NOT NULL,
+        user_id integer NOT NULL,
+        timestamp timestamp NOT NULL,
+        CONSTRAINT unique_part_like PRIMARY KEY (post_id, user_id)
+    );
+    CREATE INDEX ON part_like_keys (user_id);
+"""
+
+# {rows} selects (post_id, user_id, timestamp); BATCH passes them as $1, $2, $3 arrays
+BATCH = "SELECT * FROM unnest($1::int[], $2::int[], $3::timestamp[])"
+INSERT = {
+    "flat": """
+        INSERT INTO flat_likes (post_id, user_id, timestamp)
+        {rows}
+        ON CONFLICT DO NOTHING
+        RETURNING post_id
+    """,
+    "partitioned": """
+        WITH claimed AS (
+            INSERT INTO part_like_keys (post_id, user_id, timestamp)
+            {rows}
+            ON CONFLICT DO NOTHING
+            RETURNING post_id, user_id, timestamp
+        )
+        INSERT INTO part_likes (post_id, user_id, timestamp)
+        SELECT post_id, user_id, timestamp FROM claimed
+        RETURNING post_id
+    """,
+}
+
+QUERIES = {
+    "24h counts": """
+        SELECT post_id, count(*) FROM {table} WHERE timestamp > {now} - interval '24 hours' GROUP BY post_id
+    """,
+    "7d counts": """
+        SELECT post_id, count(*) FROM {table} WHERE timestamp > {now} - interval '7 days' GROUP BY post_id
+    """,
+    # app.pagination's keyset condition, with the plain bound that allows pruning
+    "likes page": """
+        SELECT id, post_id, user_id, timestamp FROM {table}
+        WHERE post_id = $1 AND (timestamp, id) < ($2, $3) AND timestamp <= $2
+        ORDER BY timestamp DESC, id DESC LIMIT 50
+    """,
+}
+
+# $1 post id, $2 user id
+UNLIKE = {
+    "flat": ["DELETE FROM flat_likes WHERE post_id = $1 AND user_id = $2 RETURNING id"],
+    "partitioned": [
+        "DELETE FROM part_like_keys WHERE post_id = $1 AND user_id = $2 RETURNING timestamp",
+        "DELETE FROM part_likes WHERE post_id = $1 AND user_id = $2 AND timestamp = $3",
+    ],
+}
+
+TABLES = {"flat": "flat_likes", "partitioned": "part_likes"}
+
+
+async def connect() -> asyncpg.Connection:
+    return await asyncpg.connect(asyncpg_dsn(os.environ["DATABASE_URL"]), server_settings={"search_path": SCHEMA})
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    return f"p50 {statistics.median(samples):7.2f} ms  p95 {samples[max(int(len(samples) * 0.95) - 1, 0)]:7.2f} ms"
+
+
+async def setup(conn: asyncpg.Connection, months: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    await conn.execute(SCHEMA_SQL)
+    this_month = datetime.utcnow().date().replace(day=1)
+    for offset in range(-months, 2):
+        month = add_months(this_month, offset)
+        await conn.execute(
+            f"CREATE TABLE {partition_name('part_likes', month)} PARTITION OF part_likes "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    await conn.execute("CREATE TABLE part_likes_default PARTITION OF part_likes DEFAULT")
+
+
+async def seed(conn: asyncpg.Connection, rows: int, months: int, posts: int, users: int):
+    # Generated once into a staging table so both layouts get the same likes
+    await conn.execute(
+        "CREATE UNLOGGED TABLE seed (n integer, post_id integer, user_id integer, timestamp timestamp)"
+    )
+    await conn.execute(f"""
+        INSERT INTO seed
+        SELECT n, 1 + floor(random() * $1)::int, 1 + floor(random() * $2)::int,
+               {NOW} - random() * ($3 * interval '30 days')
+        FROM generate_series(1, $4) n
+    """, posts, users, months, rows)
+    for layout, sql in INSERT.items():
+        began = time.perf_counter()
+        for start in range(0, rows, CHUNK):
+            chunk = f"SELECT post_id, user_id, timestamp FROM seed WHERE n > {start} AND n <= {start + CHUNK}"
+            await conn.execute(sql.format(rows=chunk))
+        await conn.execute(f"VACUUM ANALYZE {TABLES[layout]}")
+        print(f"seeded {layout:<12} {time.perf_counter() - began:6.1f}s")
+    await conn.execute("VACUUM ANALYZE part_like_keys")
+    await conn.execute("DROP TABLE seed")
+
+
+async def inserts(conn: asyncpg.Connection, layout: str, batches: int, batch: int, posts: int, users: int):
+    rng = random.Random(1)
+    statement = await conn.prepare(INSERT[layout].format(rows=BATCH))
+    inserted, samples = 0, []
+    began = time.perf_counter()
+    for _ in range(batches):
+        post_ids = [rng.randint(1, posts) for _ in range(batch)]
+        user_ids = [rng.randint(1, users) for _ in range(batch)]
+        timestamps = [datetime.utcnow()] * batch
+        start = time.perf_counter()
+        inserted += len(await statement.fetch(post_ids, user_ids, timestamps))
+        samples.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - began
+    print(f"{layout:<12} insert batch of {batch:<5}    {percentiles(samples)}  "
+          f"{inserted / elapsed:>9.0f} rows/s ({batches * batch - inserted} duplicates)")
+
+
+async def queries(conn: asyncpg.Connection, layout: str, iterations: int):
+    table = TABLES[layout]
+    # Posts with likes in the last week, so pages and unlikes have something to find
+    recent = await conn.fetch(
+        f"SELECT post_id, user_id, timestamp, id FROM {table} WHERE timestamp > {NOW} - interval '7 days' "
+        f"ORDER BY post_id, user_id LIMIT $1",
+        iterations,
+    )
+    for name, sql in QUERIES.items():
+        statement = await conn.prepare(sql.format(table=table, now=NOW))
+        samples = []
+        # The first run only warms the cache and is not timed; window scans get fewer runs than lookups
+        for i in range(-1, iterations if "$1" in sql else max(iterations // 10, 5)):
+            start = time.perf_counter()
+            if "$1" in sql:
+                row = recent[i % len(recent)]
+                await statement.fetch(row["post_id"], row["timestamp"] + timedelta(seconds=1), row["id"])
+            else:
+                await statement.fetch()
+            if i >= 0:
+                samples.append((time.perf_counter() - start) * 1000)
+        print(f"{layout:<12} {name:<24} {percentiles(samples)}")
+
+    statements = [await conn.prepare(sql) for sql in UNLIKE[layout]]
+    samples = []
+    for row in recent:
+        start = time.perf_counter()
+        async with conn.transaction():
+            removed = await statements[0].fetchval(row["post_id"], row["user_id"])
+            if len(statements) > 1 and removed is not None:
+                await statements[1].fetch(row["post_id"], row["user_id"], removed)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{layout:<12} {'unlike':<24} {percentiles(samples)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--months", type=int, default=12, help="history the seeded likes are spread over")
+    parser.add_argument("--posts", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    args = parser.parse_args()
+
+    conn = await connect()
+    try:
+        await setup(conn, args.months)
+        await seed(conn, args.rows, args.months, args.posts, args.users)
+        for layout in INSERT:
+            await inserts(conn, layout, args.batches, args.batch, args.posts, args.users)
+        for layout in INSERT:
+            await queries(conn, layout, args.iterations)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
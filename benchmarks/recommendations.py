@@ -0,0 +1,109 @@
+"""
+Recommendation build at scale: runtime and peak RSS of app.recommender.build, and the serving lookup
+
+    python -m benchmarks.recommendations --users 100000 --likes 5000000
+    python -m benchmarks.recommendations --skip-seed --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import func, select, text
+
+from app import recommendations, recommender
+from app.database import AsyncSessionLocal, engine
+from app.models import User
+
+CHUNK = 500_000
+NAME = "recs-bench"
+
+
+async def seed(users: int, likes: int, communities: int, skew: float):
+    async with AsyncSessionLocal() as db:
+        first = (await db.execute(text(
+            "INSERT INTO users (name) SELECT :name || g FROM generate_series(1, :users) g RETURNING id"
+        ), {"name": f"{NAME}-", "users": users})).scalars().all()
+        low, high = (await db.execute(text("SELECT min(id), max(id) FROM posts"))).one()
+        await db.commit()
+    first = min(first)
+    print(f"seeded {users} users")
+
+    for start in range(0, likes, CHUNK):
+        began = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            # A user's community picks the slice; power(random(), skew) piles likes onto its first posts.
+            # Like counts are bumped in the same statement so the posts stay consistent.
+            await db.execute(text("""
+                WITH picked AS (
+                    SELECT DISTINCT user_id, :low + (user_id % :communities) * :span
+                                    + floor(power(random(), :skew) * :span)::int AS post_id
+                    FROM (SELECT :first + floor(random() * :users)::int AS user_id FROM generate_series(1, :count)) u
+                ), claimed AS (
+                    INSERT INTO post_like_keys (user_id, post_id, timestamp)
+                    SELECT picked.user_id, picked.post_id, now() - random() * interval '60 days'
+                    FROM picked JOIN posts ON posts.id = picked.post_id
+                    ON CONFLICT DO NOTHING
+                    RETURNING user_id, post_id, timestamp
+                ), inserted AS (
+                    INSERT INTO post_likes (user_id, post_id, timestamp)
+                    SELECT user_id, post_id, timestamp FROM claimed
+                    RETURNING post_id
+                )
+                UPDATE posts SET like_count = posts.like_count + added.n
+                FROM (SELECT post_id, count(*) AS n FROM inserted GROUP BY post_id) added
+                WHERE posts.id = added.post_id
+            """), {
+                "first": first, "users": users, "low": low, "communities": communities,
+                "span": (high - low) // communities, "skew": skew, "count": min(CHUNK, likes - start),
+            })
+            await db.commit()
+        print(f"seeded {start + min(CHUNK, likes - start)} likes ({time.perf_counter() - began:.1f}s)")
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("ANALYZE post_likes"))
+
+
+async def serve(label: str, iterations: int):
+    async with AsyncSessionLocal() as db:
+        first, last = (await db.execute(
+            select(func.min(User.id), func.max(User.id)).where(User.name.like(f"{NAME}-%"))
+        )).one()
+    rng = random.Random(1)
+    samples, personalized = [], 0
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            page = await recommendations.get_recommendations(db, rng.randint(first, last), 20)
+            samples.append((time.perf_counter() - start) * 1000)
+        personalized += page["source"] == "personalized"
+    samples.sort()
+    print(
+        f"GET recommendations, {label:<12} p50 {statistics.median(samples):.2f} ms  "
+        f"p95 {samples[max(int(len(samples) * 0.95) - 1, 0)]:.2f} ms  ({personalized}/{iterations} personalized)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--likes", type=int, default=5_000_000)
+    parser.add_argument("--communities", type=int, default=50)
+    parser.add_argument("--skew", type=float, default=3.0, help="higher concentrates more likes on fewer posts")
+    parser.add_argument("--days", type=int, default=recommender.WINDOW_DAYS)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the likes from a previous run")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        await seed(args.users, args.likes, args.communities, args.skew)
+    print(json.dumps(await recommender.build(args.days)))
+    # The same users twice: first with their posts mostly uncached, then with them cached
+    await serve("posts cold", args.iterations)
+    await serve("posts warm", args.iterations)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
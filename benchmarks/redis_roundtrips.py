@@ -0,0 +1,97 @@
+"""
+Round trips and latency of the redis_cache helpers, one await per command vs MGET and pipelines
+
+    python -m benchmarks.redis_roundtrips --posts 100 --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime
+
+from redis.asyncio.connection import Connection
+
+from app import redis_cache
+from app.redis_cache import (
+    INTERACTION_LIMIT, RECENT_LIMIT, RECENT_POSTS_LIST, cache_post,
+    get_recent_cached_posts, redis_client, track_user_interaction
+)
+
+round_trips = 0
+_send_packed_command = Connection.send_packed_command
+
+
+async def _counting_send(self, command, check_health=True):
+    # A pipeline is packed into a single send, so this counts network round trips
+    global round_trips
+    round_trips += 1
+    return await _send_packed_command(self, command, check_health)
+
+
+Connection.send_packed_command = _counting_send
+
+
+# ------------ BASELINE: the pre-batching implementations ------------ #
+
+async def naive_cache_post(post_data: dict, ttl=None):
+    post_id = post_data["id"]
+    await redis_client.set(f"post:{post_id}", json.dumps(post_data), ex=ttl)
+    await redis_client.lpush(RECENT_POSTS_LIST, str(post_id))
+    await redis_client.ltrim(RECENT_POSTS_LIST, 0, RECENT_LIMIT - 1)
+
+
+async def naive_get_recent_cached_posts() -> list[dict]:
+    ids = await redis_client.lrange(RECENT_POSTS_LIST, 0, -1)
+    posts = []
+    for post_id in ids:
+        post = await redis_cache.get_cached_post(int(post_id))
+        if post:
+            posts.append(post)
+    return posts
+
+
+async def naive_track_user_interaction(user_id: int, interaction_type: str, post_id: int):
+    key = f"user:{user_id}:interactions"
+    interaction = {"type": interaction_type, "post_id": post_id, "timestamp": datetime.utcnow().isoformat()}
+    await redis_client.lpush(key, json.dumps(interaction))
+    await redis_client.ltrim(key, 0, INTERACTION_LIMIT - 1)
+
+
+async def run(label: str, operation, iterations: int):
+    global round_trips
+    round_trips = 0
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await operation(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<32} round trips/op={round_trips / iterations:6.1f}  "
+        f"p50={statistics.median(samples):7.3f}ms  mean={statistics.mean(samples):7.3f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=RECENT_LIMIT)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    await redis_client.delete(RECENT_POSTS_LIST)
+    post = {"id": 0, "user_id": 1, "content": "x" * 280, "timestamp": datetime.utcnow().isoformat()}
+    for post_id in range(args.posts):
+        await cache_post({**post, "id": post_id})
+
+    await run("cache_post (before)", lambda i: naive_cache_post({**post, "id": i}), args.iterations)
+    await run("cache_post (after)", lambda i: cache_post({**post, "id": i}), args.iterations)
+    await run("get_recent_cached_posts (before)", lambda i: naive_get_recent_cached_posts(), args.iterations)
+    await run("get_recent_cached_posts (after)", lambda i: get_recent_cached_posts(), args.iterations)
+    await run("track_user_interaction (before)", lambda i: naive_track_user_interaction(1, "like", i), args.iterations)
+    await run("track_user_interaction (after)", lambda i: track_user_interaction(1, "like", i), args.iterations)
+
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
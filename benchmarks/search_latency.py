@@ -0,0 +1,129 @@
+"""
+Search latency at scale against app.search, with the result cache bypassed and then hit
+
+    python -m benchmarks.search_latency --posts 1000000
+    python -m benchmarks.search_latency --skip-seed --iterations 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import search
+from app.database import AsyncSessionLocal, engine
+from app.pagination import PageParams
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "te", "su", "no", "vi", "de", "po", "zu", "fe", "ga", "shi", "ber", "tan"]
+CHUNK = 100_000
+
+
+def vocabulary(size: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+
+async def seed(posts: int, words: list[str]) -> tuple[int, int]:
+    """Insert posts in chunks; word i is picked with probability ~ Zipf, so words[0] is the most common"""
+    async with AsyncSessionLocal() as db:
+        user_id = (await db.execute(text("INSERT INTO users (name) VALUES ('search-bench') RETURNING id"))).scalar_one()
+        category_id = (await db.execute(
+            text("INSERT INTO categories (title) VALUES (:title) RETURNING id"),
+            {"title": f"sb{random.randrange(10 ** 8)}"},
+        )).scalar_one()
+        await db.commit()
+
+    for start in range(0, posts, CHUNK):
+        began = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("""
+                INSERT INTO posts (user_id, content, timestamp)
+                SELECT :user_id,
+                       (SELECT string_agg((CAST(:words AS text[]))[1 + floor(power(random(), 4) * :n)::int], ' ')
+                        FROM generate_series(1, 12) WHERE g > 0),
+                       now() - random() * interval '30 days'
+                FROM generate_series(1, :count) g
+            """), {"user_id": user_id, "words": words, "n": len(words), "count": min(CHUNK, posts - start)})
+            await db.commit()
+        print(f"seeded {start + min(CHUNK, posts - start)} posts ({time.perf_counter() - began:.1f}s)")
+
+    async with AsyncSessionLocal() as db:
+        # ~1% of the posts go in one category, for the filtered queries
+        await db.execute(text("""
+            INSERT INTO post_category (post_id, category_id)
+            SELECT id, :category_id FROM posts WHERE user_id = :user_id AND random() < 0.01
+        """), {"user_id": user_id, "category_id": category_id})
+        await db.commit()
+        await db.execute(text("ANALYZE posts"))
+    return user_id, category_id
+
+
+async def bench_context() -> tuple[int, int, list[str]]:
+    async with AsyncSessionLocal() as db:
+        user_id = (await db.execute(text("SELECT max(id) FROM users WHERE name = 'search-bench'"))).scalar_one()
+        category_id = (await db.execute(text(
+            "SELECT max(category_id) FROM post_category pc JOIN posts p ON p.id = pc.post_id WHERE p.user_id = :user_id"
+        ), {"user_id": user_id})).scalar_one()
+    return user_id, category_id, vocabulary(5000)
+
+
+async def count_matches(q: str) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            text("SELECT count(*) FROM posts WHERE search_vector @@ websearch_to_tsquery('english', :q)"), {"q": q}
+        )).scalar_one()
+
+
+async def time_query(label: str, iterations: int, **kwargs):
+    page = PageParams(cursor=None, limit=20)
+    q = search.normalize(kwargs.pop("q"))
+    uncached, cached = [], []
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            await search._query(db, q, "posts", kwargs.get("category_id"), kwargs.get("user_id"), page)
+            uncached.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            await search.search(q, page, "posts", kwargs.get("category_id"), kwargs.get("user_id"))
+            cached.append((time.perf_counter() - start) * 1000)
+    uncached.sort()
+    print(
+        f"{label:<28} {await count_matches(q):>9}  "
+        f"p50 {statistics.median(uncached):8.1f} ms  p95 {uncached[int(len(uncached) * 0.95) - 1]:8.1f} ms  "
+        f"cached p50 {statistics.median(cached):6.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse posts from a previous run")
+    args = parser.parse_args()
+
+    words = vocabulary(5000)
+    if args.skip_seed:
+        user_id, category_id, words = await bench_context()
+    else:
+        user_id, category_id = await seed(args.posts, words)
+
+    common, medium, rare = words[0], words[200], words[4000]
+    print(f"{'query':<28} {'matches':>9}")
+    await time_query("rare term", args.iterations, q=rare)
+    await time_query("medium term", args.iterations, q=medium)
+    await time_query("common term", args.iterations, q=common)
+    await time_query("two terms (AND)", args.iterations, q=f"{medium} {words[201]}")
+    await time_query("either term (OR)", args.iterations, q=f"{rare} or {words[4001]}")
+    await time_query("phrase", args.iterations, q=f'"{medium} {words[201]}"')
+    await time_query("medium term + category", args.iterations, q=medium, category_id=category_id)
+    await time_query("medium term + author", args.iterations, q=medium, user_id=user_id)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Seed a synthetic power-law social graph for the benchmarks
+
+    python -m benchmarks.seed --users 5000 --posts 50000 --likes 500000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from app.database import engine
+from app.importer import SPECS, asyncpg_dsn, chunked, import_chunk
+from app.models import Base
+
+CHUNK_SIZE = 50000
+
+
+def zipf_choices(population: list[int], k: int, exponent: float = 1.1) -> list[int]:
+    """k draws from population where the i-th item has weight 1 / (i + 1) ** exponent"""
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(population))]
+    return random.choices(population, weights=weights, k=k)
+
+
+def random_timestamp(days: int = 30) -> datetime:
+    return datetime.utcnow() - timedelta(seconds=random.randint(0, days * 24 * 3600))
+
+
+async def _import(conn: asyncpg.Connection, kind: str, records: list[tuple]) -> int:
+    inserted = 0
+    for chunk in chunked(iter(records), CHUNK_SIZE):
+        inserted += await import_chunk(conn, SPECS[kind], chunk)
+    return inserted
+
+
+async def seed(
+    conn: asyncpg.Connection,
+    users: int,
+    follows_per_user: int,
+    posts: int,
+    likes: int,
+    saves: int,
+    comments: int,
+    depth: int,
+) -> dict:
+    tag = f"seed-{int(time.time())}"
+    await conn.copy_records_to_table("users", records=[(f"{tag}-{i}", 0) for i in range(users)],
+                                     columns=["name", "is_verified"])
+    user_ids = [row["id"] for row in await conn.fetch(
+        "SELECT id FROM users WHERE name LIKE $1 ORDER BY id", f"{tag}-%"
+    )]
+
+    # Popular accounts (low ranks) collect most of the follows
+    follows = {
+        (follower, followee)
+        for follower in user_ids
+        for followee in zipf_choices(user_ids, follows_per_user)
+        if follower != followee
+    }
+    await conn.copy_records_to_table("follows", records=[
+        (follower, followee, random_timestamp()) for follower, followee in follows
+    ], columns=["follower_id", "followee_id", "timestamp"])
+
+    await _import(conn, "posts", [
+        (user_id, "benchmark post", random_timestamp()) for user_id in zipf_choices(user_ids, posts, 0.8)
+    ])
+    post_ids = [row["id"] for row in await conn.fetch(
+        "SELECT id FROM posts WHERE user_id = ANY($1::int[]) ORDER BY id", user_ids
+    )]
+    # Shuffle so popularity isn't correlated with age
+    ranked_posts = random.sample(post_ids, len(post_ids))
+
+    # Duplicate (post, user) pairs are dropped by the importer's ON CONFLICT
+    await _import(conn, "likes", [
+        (post_id, random.choice(user_ids), None) for post_id in zipf_choices(ranked_posts, likes)
+    ])
+    await _import(conn, "saves", [
+        (post_id, random.choice(user_ids), None) for post_id in zipf_choices(ranked_posts, saves)
+    ])
+
+    # Comment threads: half the comments are top-level, the rest reply to the
+    # previous level so threads taper off with depth
+    roots = comments // 2
+    await _import(conn, "comments", [
+        (post_id, random.choice(user_ids), "benchmark comment", None, random_timestamp())
+        for post_id in zipf_choices(ranked_posts, roots)
+    ])
+    level = await conn.fetch(
+        "SELECT id, post_id FROM comments WHERE post_id = ANY($1::int[]) AND reply_to IS NULL", post_ids
+    )
+    remaining = comments - roots
+    for _ in range(depth - 1):
+        if not level or remaining <= 0:
+            break
+        size = min(remaining, max(1, len(level) // 2))
+        parents = random.sample(list(level), min(size, len(level)))
+        marker = await conn.fetchval("SELECT coalesce(max(id), 0) FROM comments")
+        await _import(conn, "comments", [
+            (parent["post_id"], random.choice(user_ids), "benchmark reply", parent["id"], None)
+            for parent in parents
+        ])
+        remaining -= len(parents)
+        level = await conn.fetch("SELECT id, post_id FROM comments WHERE id > $1", marker)
+
+    comment_ids = [row["id"] for row in await conn.fetch(
+        "SELECT id FROM comments WHERE post_id = ANY($1::int[]) ORDER BY id", post_ids
+    )]
+    return {"tag": tag, "users": user_ids, "posts": ranked_posts, "comments": comment_ids}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--follows-per-user", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--likes", type=int, default=200000)
+    parser.add_argument("--saves", type=int, default=20000)
+    parser.add_argument("--comments", type=int, default=40000)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.random_seed)
+
+    async with engine.begin() as sa_conn:
+        await sa_conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+    conn = await asyncpg.connect(asyncpg_dsn(os.environ["DATABASE_URL"]))
+    start = time.perf_counter()
+    try:
+        seeded = await seed(
+            conn, args.users, args.follows_per_user, args.posts, args.likes,
+            args.saves, args.comments, args.depth,
+        )
+    finally:
+        await conn.close()
+    print(json.dumps({
+        "tag": seeded["tag"],
+        "users": len(seeded["users"]),
+        "posts": len(seeded["posts"]),
+        "comments": len(seeded["comments"]),
+        "seconds": round(time.perf_counter() - start, 1),
+    }))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
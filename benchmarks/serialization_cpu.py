@@ -0,0 +1,73 @@
+"""
+CPU time per 1k-row list response: ORM entities through orm_mode vs Core rows with orjson
+
+    python -m benchmarks.serialization_cpu --rows 1000 --iterations 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert, select
+
+from app.database import AsyncSessionLocal, engine
+from app.models import Base, Post, User
+from app.schemas import PostOut, PostPage
+from app.serialization import RowEncoder, page_response
+
+POST_ROWS = RowEncoder(Post, PostOut)
+
+
+async def seed(rows: int) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user_id = (await db.execute(insert(User).values(name="serialization-bench").returning(User.id))).scalar_one()
+        await db.execute(insert(Post), [{"user_id": user_id, "content": f"post {i} " * 8} for i in range(rows)])
+        await db.commit()
+    return user_id
+
+
+async def orm_path(user_id: int, rows: int) -> bytes:
+    """What the handler did before: select(Post), then FastAPI's response_model serialization"""
+    async with AsyncSessionLocal() as db:
+        posts = (await db.execute(select(Post).where(Post.user_id == user_id).limit(rows))).scalars().all()
+    page = PostPage.model_validate({"items": posts, "next_cursor": None}, from_attributes=True)
+    return json.dumps(jsonable_encoder(page)).encode()
+
+
+async def lean_path(user_id: int, rows: int) -> bytes:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(*POST_ROWS.columns).where(Post.user_id == user_id).limit(rows))
+        return page_response(POST_ROWS, result.all(), None).body
+
+
+async def measure(label: str, path, user_id: int, rows: int, iterations: int) -> float:
+    await path(user_id, rows)  # warm up statement caches
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time()
+        await path(user_id, rows)
+        samples.append((time.process_time() - start) * 1000 * 1000 / rows)
+    median = statistics.median(samples)
+    print(f"{label:<6} {median:8.2f} ms CPU per 1k rows  (min {min(samples):.2f}, max {max(samples):.2f})")
+    return median
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    user_id = await seed(args.rows)
+    before = await measure("orm", orm_path, user_id, args.rows, args.iterations)
+    after = await measure("lean", lean_path, user_id, args.rows, args.iterations)
+    print(f"speedup x{before / after:.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import ingest
+
+TASKS = 50
+
+
+class RecordingSession:
+    """Stands in for an AsyncSession: keeps the statements it is given and inserts nothing"""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: []))
+
+
+async def hammer_like() -> tuple[list, int, int]:
+    """Like one post as one user TASKS times at once; returns the statuses, the rows and the counter"""
+    import httpx
+    from sqlalchemy import func, select
+
+    from app.database import AsyncSessionLocal, engine
+    from app.main import app
+    from app.models import Base, Post, PostLike
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            user = (await client.post("/users/", json={"name": "contention"})).json()
+            post = (await client.post("/posts/", json={"user_id": user["id"], "content": "hot"})).json()
+            responses = await asyncio.gather(*[
+                client.post(f"/posts/{post['id']}/like", json={"user_id": user["id"]}) for _ in range(TASKS)
+            ])
+        async with AsyncSessionLocal() as db:
+            rows = await db.scalar(
+                select(func.count()).where(PostLike.post_id == post["id"], PostLike.user_id == user["id"])
+            )
+            like_count = (await db.get(Post, post["id"])).like_count
+        return [response.status_code for response in responses], rows, like_count
+    finally:
+        await engine.dispose()
+
+
+def test_like_is_one_conflict_free_statement():
+    db = RecordingSession()
+    asyncio.run(ingest.add_interactions(db, "post_likes", [{"post_id": 1, "user_id": 2}]))
+
+    [statement] = db.statements
+    sql = " ".join(str(statement.compile(dialect=postgresql.dialect())).split())
+    assert sql.startswith("WITH claimed AS (INSERT INTO post_like_keys")
+    assert "ON CONFLICT DO NOTHING RETURNING" in sql
+    assert "INSERT INTO post_likes (post_id, user_id, timestamp) SELECT" in sql
+
+
+@pytest.mark.skipif(not os.getenv("DATABASE_URL"), reason="needs DATABASE_URL (and Redis)")
+def test_concurrent_likes_of_one_pair_leave_one_row():
+    from app import counters, interactions
+    if interactions.MODE != "sync" or counters.COUNTER_MODE != "sync":
+        pytest.skip("likes and counters are written behind with INTERACTION_MODE=stream or COUNTER_MODE=buffered")
+
+    statuses, rows, like_count = asyncio.run(hammer_like())
+
+    assert sorted(statuses) == [200] + [400] * (TASKS - 1)
+    assert rows == 1
+    assert like_count == 1
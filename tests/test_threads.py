@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.pagination import decode_cursor
+from app.threads import START_CURSOR, _render
+
+T0 = datetime(2026, 1, 1)
+
+
+def row(id: int, depth: int, rn: int, reply_to=None, reply_count: int = 0):
+    return SimpleNamespace(
+        id=id, post_id=1, user_id=1, content=f"comment {id}", timestamp=T0 + timedelta(seconds=id),
+        reply_to=reply_to, like_count=0, reply_count=reply_count, depth=depth, rn=rn,
+    )
+
+
+def test_render_nests_replies_and_sets_cursors():
+    rows = [
+        row(1, 1, 1, reply_count=3),
+        row(2, 1, 2),
+        row(3, 1, 3),  # look-ahead for the top level
+        row(10, 2, 1, reply_to=1),
+        row(11, 2, 2, reply_to=1),
+        row(12, 2, 3, reply_to=1),  # look-ahead for comment 1
+    ]
+    top, next_cursor = _render(rows, limit=2, replies=2)
+
+    assert [node["id"] for node in top] == [1, 2]
+    assert decode_cursor(next_cursor) == (rows[1].timestamp, 2)
+    assert [node["id"] for node in top[0]["replies"]] == [10, 11]
+    assert decode_cursor(top[0]["replies_cursor"]) == (rows[4].timestamp, 11)
+    assert top[1]["replies_cursor"] is None
+
+
+def test_render_with_zero_replies_points_load_more_at_the_start():
+    # With replies=0 only the look-ahead reply arrives, before any sibling was rendered
+    rows = [
+        row(1, 1, 1, reply_count=2),
+        row(2, 1, 2),
+        row(10, 2, 1, reply_to=1),
+    ]
+    top, next_cursor = _render(rows, limit=2, replies=0)
+
+    assert next_cursor is None
+    assert top[0]["replies"] == []
+    assert top[0]["replies_cursor"] == START_CURSOR
+    assert top[1]["replies_cursor"] is None
+    # The start cursor sorts before every real reply
+    assert decode_cursor(START_CURSOR) < (rows[2].timestamp, 10)